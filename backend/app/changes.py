@@ -0,0 +1,73 @@
+from datetime import datetime
+
+from app.loader import ENTITIES
+from app.models import ChangeLog
+from app.responses import rows_as_dicts
+from sqlalchemy import Integer, func, insert, select
+from sqlalchemy.orm import Session
+
+# Operations recorded in the change log
+CREATE, UPDATE, DELETE = "create", "update", "delete"
+
+
+def record_change(db: Session, entity, entity_id, version, operation):
+    """Append a change to the feed inside the caller's write transaction; returns its seq"""
+    result = db.execute(
+        insert(ChangeLog).values(
+            entity=entity,
+            entity_id=str(entity_id),
+            version=version,
+            operation=operation,
+            changed_at=datetime.utcnow(),
+        )
+    )
+    return result.inserted_primary_key[0]
+
+
+def record_changes(db: Session, entity, entity_ids, operation, version=1):
+    """Append one change per ID with a single executemany, for bulk writes; returns their seqs"""
+    changed_at = datetime.utcnow()
+    rows = [
+        {
+            "entity": entity,
+            "entity_id": str(entity_id),
+            "version": version,
+            "operation": operation,
+            "changed_at": changed_at,
+        }
+        for entity_id in entity_ids
+    ]
+    if not rows:
+        return []
+    db.execute(insert(ChangeLog.__table__), rows)
+    # The write lock is held, so this transaction's seqs are the last len(rows) ones
+    last = db.execute(select(func.max(ChangeLog.seq))).scalar()
+    return list(range(last - len(rows) + 1, last + 1))
+
+
+def _typed_id(entity, entity_id):
+    model, _ = ENTITIES[entity]
+    (primary_key,) = model.__table__.primary_key.columns
+    return int(entity_id) if isinstance(primary_key.type, Integer) else entity_id
+
+
+def changes_page(db: Session, since=0, limit=1000, entities=None):
+    """Changes with a sequence number above ``since``, oldest first.
+
+    Reads a range of the primary key, so the cost depends on ``limit``, not
+    on the size of the log. ``next_since`` is the ``since`` of the next call:
+    the last returned seq, or ``since`` again if nothing changed.
+    """
+    query = select(ChangeLog.__table__).where(ChangeLog.seq > since).order_by(ChangeLog.seq)
+    if entities:
+        query = query.where(ChangeLog.entity.in_(entities))
+    items = rows_as_dicts(db.execute(query.limit(limit + 1)))
+    has_more = len(items) > limit
+    items = items[:limit]
+    for item in items:
+        item["entity_id"] = _typed_id(item["entity"], item["entity_id"])
+    return {
+        "items": items,
+        "next_since": items[-1]["seq"] if items else since,
+        "has_more": has_more,
+    }
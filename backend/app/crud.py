@@ -0,0 +1,517 @@
+import inspect
+import os
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Optional
+
+from app import database
+from app.changes import CREATE, DELETE, UPDATE, record_change
+from app.events import event_broker
+from app.history import archive_version, purge_history
+from app.loader import include_related, parse_include, required_columns
+from app.metrics import instrumented
+from app.responses import (
+    FastJSONResponse,
+    JSONArraySpool,
+    etag_response,
+    rows_as_dicts,
+    schema_columns,
+)
+from app.writer import write_queue
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from pydantic import create_model
+from sqlalchemy import DateTime, Float, Integer, String, select, tuple_
+from sqlalchemy.orm import Session
+
+# Largest page a list endpoint serves with ?limit=
+MAX_PAGE_SIZE = 10000
+
+# Rows a list endpoint reads, completes and encodes at a time
+LIST_BATCH_SIZE = int(os.getenv("LIST_BATCH_SIZE", "1000"))
+
+# Most IDs one batch request may ask for
+MAX_BATCH_SIZE = 5000
+
+FIELDS_DESCRIPTION = "Comma-separated columns to return, e.g. `id,value` (default: all)"
+INCLUDE_DESCRIPTION = "Comma-separated related records to embed, e.g. `lab_tests.analytes`"
+UPDATED_SINCE_DESCRIPTION = "Only records created or updated at or after this time (UTC)"
+
+
+def get_read_db():
+    db = database.ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _with_path_parameter(fn, name, annotation):
+    """Expose ``fn``'s ``record_id`` argument to FastAPI under the entity's own name"""
+    signature = inspect.signature(fn)
+    parameters = [
+        parameter.replace(name=name, annotation=annotation)
+        if parameter.name == "record_id"
+        else parameter
+        for parameter in signature.parameters.values()
+    ]
+
+    def endpoint(**kwargs):
+        kwargs["record_id"] = kwargs.pop(name)
+        return fn(**kwargs)
+
+    endpoint.__signature__ = signature.replace(parameters=parameters)
+    endpoint.__name__ = fn.__name__
+    return endpoint
+
+
+def _parse_value(column, text):
+    """Parse a cursor component into the Python type of ``column``; raises ValueError"""
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(text)
+    if isinstance(column.type, Float):
+        return float(text)
+    if isinstance(column.type, Integer):
+        return int(text)
+    return text
+
+
+def filter_parameters(model, names):
+    """Dependency turning typed query parameters into WHERE clauses on ``model``.
+
+    Each named column gets parameters by type: ``<name>_from`` / ``<name>_to``
+    (inclusive) for date-times and numbers, a repeatable ``<name>`` (IN-list)
+    for strings and ``<name>`` equality for integers such as foreign keys.
+    """
+    parameters, clauses = [], []
+    for name in names:
+        column = model.__table__.c[name]
+        if isinstance(column.type, (DateTime, Float)):
+            value_type = datetime if isinstance(column.type, DateTime) else float
+            for suffix, bound in (("from", column.__ge__), ("to", column.__le__)):
+                side = "at or after" if suffix == "from" else "at or before"
+                parameters.append((f"{name}_{suffix}", Optional[value_type], f"{name} {side}"))
+                clauses.append((f"{name}_{suffix}", bound))
+        elif isinstance(column.type, String):
+            parameters.append((name, Optional[list[str]], f"{name} is one of (repeatable)"))
+            clauses.append((name, column.in_))
+        else:
+            parameters.append((name, Optional[int], f"{name} equals"))
+            clauses.append((name, column.__eq__))
+
+    def conditions(**values):
+        return [clause(values[key]) for key, clause in clauses if values[key] is not None]
+
+    conditions.__signature__ = inspect.Signature(
+        [
+            inspect.Parameter(
+                key,
+                inspect.Parameter.KEYWORD_ONLY,
+                default=Query(None, description=description),
+                annotation=annotation,
+            )
+            for key, annotation, description in parameters
+        ]
+    )
+    return conditions
+
+
+def add_crud_routes(
+    router: APIRouter,
+    model,
+    schema,
+    create_schema,
+    update_schema,
+    *,
+    entity,
+    name,
+    plural,
+    label,
+    id_name,
+    hooks=(),
+    filters=(),
+    sorts=(),
+    events=None,
+):
+    """Register the standard create / all / get / update / delete endpoints of one entity.
+
+    ``entity`` is the entity's history key (its table name); ``name`` and
+    ``plural`` name the endpoints (``create_<name>``, ``list_<plural>``, ...)
+    and ``label`` is the human-readable name used in docs and 404s.
+
+    Every write runs on the writer thread with history archived through
+    :func:`archive_version` and an entry in the change feed. ``hooks`` keep
+    derived data in step: each is called as ``hook(db, record, previous)``
+    inside the write transaction, after the change is flushed. ``previous``
+    holds the record's column values before an update or delete (None on
+    create); ``record`` is None after a delete.
+
+    ``filters`` names the columns ``/all`` can be filtered on (see
+    :func:`filter_parameters`) and ``sorts`` the NOT NULL columns it can be
+    ordered by (``sort=<name>`` or ``sort=-<name>``). Back each with an index.
+
+    With ``events`` set, creates and updates are also pushed to
+    :data:`app.events.event_broker` subscribers after they commit.
+    ``events(db, record)`` runs in the write transaction and returns the
+    ID of the patient the record belongs to, which streams filter on.
+
+    Register fixed-path routes such as ``/summary`` on ``router`` before
+    calling this, so ``/{id}`` does not shadow them.
+    """
+    (primary_key,) = model.__table__.primary_key.columns
+    id_type = int if isinstance(primary_key.type, Integer) else str
+    columns = schema_columns(model, schema)
+    columns_by_name = {column.name: column for column in columns}
+    label_lower = label[0].lower() + label[1:]
+    filter_conditions = filter_parameters(model, filters)
+    sort_columns = {}
+    for sort in sorts:
+        column = model.__table__.c[sort]
+        if column.nullable:
+            raise ValueError(f"Cannot keyset-paginate on nullable column {column}")
+        sort_columns[sort] = (column, False)
+        sort_columns[f"-{sort}"] = (column, True)
+    SortKey = Enum(f"{model.__name__}SortKey", {key: key for key in sort_columns}, type=str)
+    not_found = f"{label} not found"
+
+    def run_hooks(db: Session, record, previous):
+        for hook in hooks:
+            hook(db, record, previous)
+
+    def column_values(record):
+        return {column.key: getattr(record, column.key) for column in model.__table__.c}
+
+    def change_event(db: Session, record, seq, operation):
+        """The streaming event for a committed create/update (None without ``events``)"""
+        if events is None:
+            return None
+        return {
+            "seq": seq,
+            "entity": entity,
+            "operation": operation,
+            "patient_id": events(db, record),
+            "data": {column.name: getattr(record, column.key) for column in columns},
+        }
+
+    def write_and_publish(write):
+        record, event = write_queue.run(write)
+        if event is not None:
+            event_broker.publish(event)
+        return record
+
+    def create(payload: create_schema):
+        def write(db: Session):
+            record = model(**payload.dict(), version=1)
+            db.add(record)
+            db.flush()
+            seq = record_change(
+                db, entity, getattr(record, primary_key.key), record.version, CREATE
+            )
+            run_hooks(db, record, None)
+            return record, change_event(db, record, seq, CREATE)
+
+        return write_and_publish(write)
+
+    def projection(fields):
+        """Columns named by a ``fields=`` parameter (every schema column if None)"""
+        if fields is None:
+            return columns
+        names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        unknown = [name for name in names if name not in columns_by_name]
+        if not names or unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields given",
+            )
+        return [columns_by_name[name] for name in names]
+
+    def parse_includes(include):
+        """The ``include=`` relation tree (empty if None)"""
+        if include is None:
+            return {}
+        try:
+            return parse_include(entity, include)
+        except ValueError as error:
+            raise HTTPException(status_code=422, detail=str(error)) from None
+
+    def hidden_columns(selected, needed):
+        """Columns named in ``needed`` but not selected: fetched for cursors and includes only"""
+        names = {column.name for column in selected}
+        return [model.__table__.c[name] for name in dict.fromkeys(needed) if name not in names]
+
+    def complete_rows(db: Session, rows, tree, hidden, loaders=None):
+        """Embed the included relations, then drop the columns the client did not ask for"""
+        include_related(db, entity, rows, tree, loaders)
+        for column in hidden:
+            for row in rows:
+                del row[column.name]
+        return rows
+
+    def parse_cursor(after, sort_column):
+        """Split an ``X-Next-After`` cursor into (sort value, primary key)"""
+        try:
+            if sort_column is None:
+                return None, _parse_value(primary_key, after)
+            value, _, key = after.rpartition("|")
+            return _parse_value(sort_column, value), _parse_value(primary_key, key)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Invalid cursor") from None
+
+    def list_all(
+        request: Request,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = Query(None, description="The X-Next-After of the last page"),
+        sort: Optional[SortKey] = Query(None, description="Order by this column (`-` descending)"),
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+        include: Optional[str] = Query(None, description=INCLUDE_DESCRIPTION),
+        updated_since: Optional[datetime] = Query(None, description=UPDATED_SINCE_DESCRIPTION),
+        conditions: list = Depends(filter_conditions),
+        db: Session = Depends(get_read_db),
+    ):
+        selected = projection(fields)
+        if updated_since is not None:
+            if updated_since.tzinfo is not None:
+                # updated_at is stored as naive UTC
+                updated_since = updated_since.astimezone(timezone.utc).replace(tzinfo=None)
+            conditions = [*conditions, model.updated_at >= updated_since]
+        tree = parse_includes(include)
+        sort_column, descending = sort_columns[sort.value] if sort else (None, False)
+        paginated = limit is not None or after is not None
+        # The cursor needs the sort key and primary key even when not asked for
+        cursor_columns = [primary_key] if sort_column is None else [sort_column, primary_key]
+        needed = [column.name for column in cursor_columns] if paginated else []
+        hidden = hidden_columns(selected, [*needed, *required_columns(entity, tree)])
+        query = select(*selected, *hidden).where(*conditions)
+
+        if paginated or sort_column is not None:
+            order = [column.desc() if descending else column for column in cursor_columns]
+            query = query.order_by(*order)
+        if after is not None:
+            sort_value, key = parse_cursor(after, sort_column)
+            if sort_column is None:
+                position, bound = primary_key, key
+            else:
+                position, bound = tuple_(sort_column, primary_key), tuple_(sort_value, key)
+            query = query.where(position < bound if descending else position > bound)
+        if limit is not None:
+            query = query.limit(limit + 1)
+
+        # Read, complete and encode LIST_BATCH_SIZE rows at a time, so a 10,000 row
+        # page never holds all of its rows (or its whole body) in memory
+        result = db.execute(query.execution_options(yield_per=LIST_BATCH_SIZE))
+        keys = list(result.keys())
+        body = JSONArraySpool()
+        # The include loaders are built once per request, but their caches only
+        # hold one batch's related rows, so memory stays bounded by the batch size
+        loaders = {}
+        count, last, more = 0, None, False
+        for partition in result.partitions():
+            rows = [dict(zip(keys, row)) for row in partition]
+            if limit is not None and count + len(rows) > limit:
+                rows, more = rows[: limit - count], True
+            if not rows:
+                continue
+            count += len(rows)
+            last = {column.name: rows[-1][column.name] for column in cursor_columns if paginated}
+            body.write_rows(complete_rows(db, rows, tree, hidden, loaders))
+            for loader in loaders.values():
+                loader.clear()
+
+        headers = {}
+        if more:
+            key = str(last[primary_key.name])
+            if sort_column is not None:
+                value = last[sort_column.name]
+                value = value.isoformat() if isinstance(value, datetime) else value
+                key = f"{value}|{key}"
+            headers["X-Next-After"] = key
+        return body.response(request, headers)
+
+    if not sort_columns:
+        # Nothing to sort by: leave the parameter out of the API
+        sorted_list_all = list_all
+
+        def list_all(**kwargs):
+            return sorted_list_all(sort=None, **kwargs)
+
+        signature = inspect.signature(sorted_list_all)
+        list_all.__signature__ = signature.replace(
+            parameters=[p for p in signature.parameters.values() if p.name != "sort"]
+        )
+
+    def fetch_batch(db: Session, ids, fields, include):
+        """Rows with the given primary keys in request order, plus the keys that do not exist"""
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > MAX_BATCH_SIZE:
+            raise HTTPException(
+                status_code=422, detail=f"At most {MAX_BATCH_SIZE} ids per batch request"
+            )
+        selected = projection(fields)
+        tree = parse_includes(include)
+        hidden = hidden_columns(selected, [primary_key.name, *required_columns(entity, tree)])
+        query = select(*selected, *hidden).where(primary_key.in_(ids))
+        rows = rows_as_dicts(db.execute(query))
+        found = {row[primary_key.name]: row for row in rows}
+        complete_rows(db, rows, tree, hidden)
+        return {
+            "items": [found[id] for id in ids if id in found],
+            "missing": [id for id in ids if id not in found],
+        }
+
+    def get_batch(
+        request: Request,
+        ids: str = Query(..., description="Comma-separated IDs, e.g. `1,2,3`"),
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+        include: Optional[str] = Query(None, description=INCLUDE_DESCRIPTION),
+        db: Session = Depends(get_read_db),
+    ):
+        try:
+            keys = [id_type(id.strip()) for id in ids.split(",") if id.strip()]
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Invalid ids") from None
+        return etag_response(request, fetch_batch(db, keys, fields, include))
+
+    def post_batch(
+        ids: list[id_type] = Body(..., embed=True),
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+        include: Optional[str] = Query(None, description=INCLUDE_DESCRIPTION),
+        db: Session = Depends(get_read_db),
+    ):
+        return FastJSONResponse(fetch_batch(db, ids, fields, include))
+
+    def get_one(
+        request: Request,
+        record_id,
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+        include: Optional[str] = Query(None, description=INCLUDE_DESCRIPTION),
+        db: Session = Depends(get_read_db),
+    ):
+        selected = projection(fields)
+        tree = parse_includes(include)
+        hidden = hidden_columns(selected, required_columns(entity, tree))
+        row = db.execute(select(*selected, *hidden).where(primary_key == record_id)).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail=not_found)
+        (record,) = complete_rows(db, [dict(row._mapping)], tree, hidden)
+        return etag_response(request, record)
+
+    def update(record_id, payload: update_schema):
+        def write(db: Session):
+            record = db.get(model, record_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail=not_found)
+            previous = column_values(record)
+
+            # Archive current state
+            changes = payload.dict(exclude_unset=True)
+            archive_version(db, entity, record, changes)
+
+            # Apply update
+            for field, value in changes.items():
+                setattr(record, field, value)
+            record.version = record.version + 1
+            db.flush()
+            seq = record_change(db, entity, record_id, record.version, UPDATE)
+            run_hooks(db, record, previous)
+
+            return record, change_event(db, record, seq, UPDATE)
+
+        return write_and_publish(write)
+
+    def delete(record_id):
+        def write(db: Session):
+            record = db.get(model, record_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail=not_found)
+            previous = column_values(record)
+
+            # Delete from history tables, then the main table
+            purge_history(db, entity, record_id)
+            db.delete(record)
+            db.flush()
+            record_change(db, entity, record_id, previous["version"], DELETE)
+            run_hooks(db, None, previous)
+
+            return {"ok": True}
+
+        return write_queue.run(write)
+
+    batch_schema = create_model(
+        f"{schema.__name__}Batch", items=(list[schema], ...), missing=(list[id_type], ...)
+    )
+    batch_description = (
+        f"Retrieves the {plural.replace('_', ' ')} with the given IDs in one query, in request "
+        "order, and lists the IDs that do not exist under `missing`."
+    )
+    routes = [
+        (
+            "/create",
+            "POST",
+            f"create_{name}",
+            create,
+            schema,
+            f"Adds a new {label_lower} to the database with versioning.",
+        ),
+        (
+            "/all",
+            "GET",
+            f"list_{plural}",
+            list_all,
+            list[schema],
+            f"Retrieves all {plural.replace('_', ' ')} from the database. Pass `limit` (and then "
+            "`after`, from the `X-Next-After` response header) to page through them, "
+            "`fields` to return only some columns, `include` to embed related records, and the "
+            "filter and `sort` parameters to have the database select and order them.",
+        ),
+        (
+            "/batch",
+            "GET",
+            f"get_{plural}_batch",
+            get_batch,
+            batch_schema,
+            batch_description,
+        ),
+        (
+            "/batch",
+            "POST",
+            f"post_{plural}_batch",
+            post_batch,
+            batch_schema,
+            batch_description + ' Send the IDs as `{"ids": [...]}` for lists too long for a URL.',
+        ),
+        (
+            f"/{{{id_name}}}",
+            "GET",
+            f"get_{name}",
+            get_one,
+            schema,
+            f"Retrieves a single {label_lower} by its ID.",
+        ),
+        (
+            f"/update/{{{id_name}}}",
+            "PUT",
+            f"update_{name}",
+            update,
+            schema,
+            f"Updates a {label_lower} and archives the previous state in the history table.",
+        ),
+        (
+            f"/delete/{{{id_name}}}",
+            "DELETE",
+            f"delete_{name}",
+            delete,
+            None,
+            f"Deletes a {label_lower} and its associated history records.",
+        ),
+    ]
+    for path, method, endpoint_name, fn, response_model, description in routes:
+        if "record_id" in inspect.signature(fn).parameters:
+            fn = _with_path_parameter(fn, id_name, id_type)
+        fn.__name__ = endpoint_name
+        router.add_api_route(
+            path,
+            instrumented(f"{method} {router.prefix}{path}")(fn),
+            methods=[method],
+            response_model=response_model,
+            name=endpoint_name,
+            description=description,
+        )
@@ -1,10 +1,72 @@
-from sqlalchemy import create_engine
+import os
+import tempfile
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./ehr.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DB_PATH", "sqlite:///./ehr.db")
+
+
+def is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if engine.dialect.name == "sqlite":
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself (below); pysqlite's implicit
+        # transactions would commit on every released SAVEPOINT
+        dbapi_connection.isolation_level = None
+        # WAL lets readers keep reading the last committed state while a writer commits
+        if is_sqlite_file(engine.url):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def begin_immediate(connection):
+        # Transactions on this engine are writes: take the write lock up front
+        # instead of failing to upgrade a read lock halfway through
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def read_only_url(url):
+    """Open SQLite database files with mode=ro, so the read pool cannot write even by mistake"""
+    if is_sqlite_file(url):
+        return f"sqlite:///file:{os.path.abspath(make_url(url).database)}?mode=ro&uri=true"
+    return url
+
+
+# Separate pool for GET handlers: read-only connections, no autoflush and no
+# expiry on commit, since nothing read through it is ever written back
+read_engine = create_engine(
+    read_only_url(SQLALCHEMY_DATABASE_URL), connect_args={"check_same_thread": False}
+)
+ReadSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=read_engine
+)
+
+
+@event.listens_for(read_engine, "connect")
+def set_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+
 Base = declarative_base()
+
+
+def lock_path(name):
+    """Path of a cross-process lock file that lives next to the database file"""
+    database_path = engine.url.database
+    if database_path and database_path != ":memory:":
+        return f"{os.path.abspath(database_path)}.{name}.lock"
+    return os.path.join(tempfile.gettempdir(), f"ehr.{name}.lock")
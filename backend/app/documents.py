@@ -0,0 +1,162 @@
+from app.loader import IN_CHUNK_SIZE
+from app.models import BodyMeasurement, Composition, LabAnalyteResult, LabTest, Patient, Specimen
+from app.responses import rows_as_dicts
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+
+def _group_by(rows, key):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.pop(key), []).append(row)
+    return groups
+
+
+def _rows_in(db: Session, query, column, keys):
+    """Rows of ``query`` whose ``column`` is one of ``keys``, in one ``IN`` query per
+    :data:`~app.loader.IN_CHUNK_SIZE` keys (SQLite caps the bound parameters of a statement)
+    """
+    keys = list(dict.fromkeys(keys))
+    rows = []
+    for start in range(0, len(keys), IN_CHUNK_SIZE):
+        chunk = keys[start : start + IN_CHUNK_SIZE]
+        rows.extend(rows_as_dicts(db.execute(query.where(column.in_(chunk)))))
+    return rows
+
+
+def lab_test_documents(db: Session, composition_ids):
+    """Lab tests of the given compositions with their specimen and analytes, keyed by composition.
+
+    Three queries (lab tests, specimens, analytes) however many compositions
+    and tests there are, up to IN_CHUNK_SIZE of them.
+    """
+    lab_tests = _rows_in(
+        db,
+        select(
+            LabTest.composition_id,
+            LabTest.id,
+            LabTest.loinc_code,
+            LabTest.description,
+            LabTest.version,
+            LabTest.specimen_id,
+        ).order_by(LabTest.id),
+        LabTest.composition_id,
+        composition_ids,
+    )
+    specimens = {
+        specimen["id"]: specimen
+        for specimen in _rows_in(
+            db,
+            select(
+                Specimen.id,
+                Specimen.specimen_type.label("type"),
+                Specimen.collection_time,
+                Specimen.snomed_code,
+                Specimen.description,
+                Specimen.version,
+            ),
+            Specimen.id,
+            [lab_test["specimen_id"] for lab_test in lab_tests],
+        )
+    }
+    analytes = _group_by(
+        _rows_in(
+            db,
+            select(
+                LabAnalyteResult.lab_test_id,
+                LabAnalyteResult.id,
+                LabAnalyteResult.loinc_code,
+                LabAnalyteResult.value,
+                LabAnalyteResult.unit,
+                LabAnalyteResult.reference_low,
+                LabAnalyteResult.reference_high,
+                LabAnalyteResult.interpretation,
+                LabAnalyteResult.version,
+            ).order_by(LabAnalyteResult.id),
+            LabAnalyteResult.lab_test_id,
+            [test["id"] for test in lab_tests],
+        ),
+        "lab_test_id",
+    )
+    for lab_test in lab_tests:
+        lab_test["specimen"] = specimens.get(lab_test.pop("specimen_id"))
+        lab_test["analytes"] = analytes.get(lab_test["id"], [])
+    return _group_by(lab_tests, "composition_id")
+
+
+def composition_documents(db: Session, compositions):
+    """Attach ``lab_tests`` (see :func:`lab_test_documents`) to composition rows, in place"""
+    lab_tests = lab_test_documents(db, [composition["id"] for composition in compositions])
+    for composition in compositions:
+        composition["lab_tests"] = lab_tests.get(composition["id"], [])
+    return compositions
+
+
+def compositions_full(db: Session, composition_ids=None, patient_id=None, limit=None):
+    """Full composition documents by ID (in that order) or a patient's most recent ones.
+
+    Four queries (compositions, lab tests, specimens and analytes) up to
+    IN_CHUNK_SIZE IDs of each.
+    """
+    query = select(
+        Composition.id, Composition.patient_id, Composition.start_time, Composition.version
+    )
+    if patient_id is not None:
+        query = query.where(Composition.patient_id == patient_id).order_by(
+            Composition.start_time.desc(), Composition.id.desc()
+        )
+    if limit is not None:
+        query = query.limit(limit)
+    if composition_ids is not None:
+        compositions = _rows_in(db, query, Composition.id, composition_ids)
+        by_id = {composition["id"]: composition for composition in compositions}
+        compositions = [by_id[id] for id in dict.fromkeys(composition_ids) if id in by_id]
+    else:
+        compositions = rows_as_dicts(db.execute(query))
+    return composition_documents(db, compositions)
+
+
+def patient_full(db: Session, patient_id):
+    """A patient with all compositions (lab tests, specimens, analytes) and body measurements.
+
+    Six queries however much history the patient has; None if there is no such patient.
+    """
+    patient = db.execute(
+        select(
+            Patient.id,
+            Patient.first_name,
+            Patient.last_name,
+            Patient.sex,
+            Patient.identifier,
+            Patient.version,
+        ).where(Patient.id == patient_id)
+    ).first()
+    if patient is None:
+        return None
+
+    compositions = rows_as_dicts(
+        db.execute(
+            select(Composition.id, Composition.start_time, Composition.version)
+            .where(Composition.patient_id == patient_id)
+            .order_by(Composition.id)
+        )
+    )
+    measurements = rows_as_dicts(
+        db.execute(
+            select(
+                BodyMeasurement.id,
+                BodyMeasurement.record_time,
+                BodyMeasurement.value,
+                BodyMeasurement.unit,
+                BodyMeasurement.snomed_code,
+                BodyMeasurement.version,
+            )
+            .where(BodyMeasurement.patient_id == patient_id)
+            .order_by(BodyMeasurement.id)
+        )
+    )
+    return {
+        **patient._mapping,
+        "compositions": composition_documents(db, compositions),
+        "body_measurements": measurements,
+    }
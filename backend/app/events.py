@@ -0,0 +1,155 @@
+import asyncio
+import os
+import threading
+
+from app.responses import dumps
+
+# Events a subscriber may fall behind by before it is disconnected
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+# Seconds between keep-alive comments on an idle stream
+EVENT_KEEPALIVE_S = float(os.getenv("EVENT_KEEPALIVE_S", "15"))
+
+
+class Subscription:
+    """One stream's filters and pending events; lives on its event loop"""
+
+    __slots__ = (
+        "queue",
+        "loop",
+        "entities",
+        "patient_id",
+        "loinc_codes",
+        "snomed_codes",
+        "interpretations",
+    )
+
+    def __init__(
+        self, loop, queue_size, entities, patient_id, loinc_codes, snomed_codes, interpretations
+    ):
+        self.queue = asyncio.Queue(queue_size)
+        self.loop = loop
+        self.entities = entities
+        self.patient_id = patient_id
+        self.loinc_codes = loinc_codes
+        self.snomed_codes = snomed_codes
+        self.interpretations = interpretations
+
+    def matches(self, event):
+        data = event["data"]
+        if self.entities and event["entity"] not in self.entities:
+            return False
+        if self.patient_id is not None and event["patient_id"] != self.patient_id:
+            return False
+        if self.loinc_codes and data.get("loinc_code") not in self.loinc_codes:
+            return False
+        if self.snomed_codes and data.get("snomed_code") not in self.snomed_codes:
+            return False
+        if self.interpretations and data.get("interpretation") not in self.interpretations:
+            return False
+        return True
+
+
+class EventBroker:
+    """In-process fanout of committed writes to streaming subscribers.
+
+    Writers call :meth:`publish` once per change from any thread; the event
+    is handed to each subscriber's event loop in one callback, which copies a
+    reference into every matching subscriber's queue. Nothing is re-read from
+    the database, so a write costs the same however many clients listen.
+    Subscribers that fall more than ``queue_size`` events behind are sent an
+    end-of-stream marker and dropped; they can catch up from ``/changes``.
+    """
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(
+        self, entities=(), patient_id=None, loinc_codes=(), snomed_codes=(), interpretations=()
+    ):
+        """Register a subscription on the running event loop"""
+        subscription = Subscription(
+            asyncio.get_running_loop(),
+            self.queue_size,
+            set(entities),
+            patient_id,
+            set(loinc_codes),
+            set(snomed_codes),
+            set(interpretations),
+        )
+        with self._lock:
+            self._subscribers.setdefault(subscription.loop, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.loop)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.loop]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, event):
+        """Fan ``event`` out to matching subscribers (thread-safe, does not block)"""
+        with self._lock:
+            loops = list(self._subscribers)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._fanout, loop, event)
+            except RuntimeError:
+                # The loop has closed; its subscriptions went with it
+                with self._lock:
+                    self._subscribers.pop(loop, None)
+
+    def _fanout(self, loop, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(loop, ()))
+        for subscription in subscribers:
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.unsubscribe(subscription)
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.queue.put_nowait(None)
+
+
+def format_event(event):
+    """Encode an event as a Server-Sent Events message"""
+    return (
+        f"id: {event['seq']}\n"
+        f"event: {event['entity']}.{event['operation']}\n"
+        f"data: {dumps(event).decode()}\n\n"
+    )
+
+
+async def event_stream(broker, is_disconnected, **filters):
+    """Yield SSE messages matching ``filters`` until the client leaves or falls behind"""
+    # Subscribe on first iteration, so the finally below always pairs with it
+    subscription = broker.subscribe(**filters)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), EVENT_KEEPALIVE_S)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                yield "event: overflow\ndata: {}\n\n"
+                return
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+event_broker = EventBroker()
@@ -0,0 +1,431 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+
+from app import database, fhir
+from app.models import BodyMeasurement, Composition, LabAnalyteResult, LabTest, Patient, Specimen
+from app.responses import dumps, rows_as_dicts
+from app.units import UnitConversion, parse_targets
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+# Patients exported per worker task; bounds each worker's memory
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "200"))
+
+# Worker processes for cohort exports (1: export in the calling process); a few
+# by default, so exports leave CPUs for the request handlers
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# FHIR resource types in the order files are written and streams emit them
+RESOURCE_TYPES = ("Patient", "Encounter", "Specimen", "DiagnosticReport", "Observation")
+
+
+# =========================
+# ROW -> FHIR MAPPING
+# =========================
+
+
+def _meta(row):
+    meta = {"versionId": str(row["version"])}
+    if row["updated_at"] is not None:
+        meta["lastUpdated"] = fhir.format_instant(row["updated_at"])
+    return meta
+
+
+def _subject(patient_id):
+    return {"reference": f"Patient/{patient_id}"}
+
+
+def patient_resource(row):
+    return {
+        "resourceType": "Patient",
+        "id": str(row["id"]),
+        "meta": _meta(row),
+        "identifier": [{"value": row["identifier"]}],
+        "name": [{"family": row["last_name"], "given": [row["first_name"]]}],
+        "gender": row["sex"],
+    }
+
+
+def encounter_resource(row):
+    return {
+        "resourceType": "Encounter",
+        "id": str(row["id"]),
+        "meta": _meta(row),
+        "status": "finished",
+        "class": {"system": fhir.ACT_CODE, "code": "AMB"},
+        "subject": _subject(row["patient_id"]),
+        "period": {"start": fhir.format_instant(row["start_time"])},
+    }
+
+
+def specimen_resource(row):
+    specimen_type = {"text": row["specimen_type"]}
+    if row["snomed_code"]:
+        specimen_type["coding"] = [{"system": fhir.SNOMED, "code": row["snomed_code"]}]
+    resource = {
+        "resourceType": "Specimen",
+        "id": str(row["id"]),
+        "meta": _meta(row),
+        "type": specimen_type,
+        "subject": _subject(row["patient_id"]),
+        "collection": {"collectedDateTime": fhir.format_instant(row["collection_time"])},
+    }
+    if row["description"]:
+        resource["note"] = [{"text": row["description"]}]
+    return resource
+
+
+def report_resource(row, result_ids):
+    code = {"text": row["description"]} if row["description"] else {}
+    if row["loinc_code"]:
+        code["coding"] = [{"system": fhir.LOINC, "code": row["loinc_code"]}]
+    return {
+        "resourceType": "DiagnosticReport",
+        "id": str(row["id"]),
+        "meta": _meta(row),
+        "status": "final",
+        "category": [{"coding": [{"system": fhir.REPORT_CATEGORY, "code": "LAB"}]}],
+        "code": code,
+        "subject": _subject(row["patient_id"]),
+        "encounter": {"reference": f"Encounter/{row['composition_id']}"},
+        "effectiveDateTime": fhir.format_instant(row["start_time"]),
+        "specimen": [{"reference": f"Specimen/{row['specimen_id']}"}],
+        "result": [{"reference": f"Observation/lab-{result_id}"} for result_id in result_ids],
+    }
+
+
+def _quantity(row):
+    return {"value": row["value"], "unit": row["unit"]}
+
+
+def analyte_resource(row):
+    resource = {
+        "resourceType": "Observation",
+        "id": f"lab-{row['id']}",
+        "meta": _meta(row),
+        "status": "final",
+        "category": [{"coding": [{"system": fhir.OBSERVATION_CATEGORY, "code": "laboratory"}]}],
+        "code": {"coding": [{"system": fhir.LOINC, "code": row["loinc_code"]}]},
+        "subject": _subject(row["patient_id"]),
+        "encounter": {"reference": f"Encounter/{row['composition_id']}"},
+        "effectiveDateTime": fhir.format_instant(row["collection_time"] or row["start_time"]),
+        "specimen": {"reference": f"Specimen/{row['specimen_id']}"},
+        "valueQuantity": _quantity(row),
+    }
+    if row["interpretation"]:
+        resource["interpretation"] = [
+            {"coding": [{"system": fhir.INTERPRETATION, "code": row["interpretation"]}]}
+        ]
+    reference_range = {}
+    for bound in ("low", "high"):
+        if row[f"reference_{bound}"] is not None:
+            reference_range[bound] = {"value": row[f"reference_{bound}"], "unit": row["unit"]}
+    if reference_range:
+        resource["referenceRange"] = [reference_range]
+    return resource
+
+
+def measurement_resource(row):
+    coding = [{"system": fhir.SNOMED, "code": row["snomed_code"]}]
+    loinc_code = fhir.SNOMED_VITAL_SIGN.get(row["snomed_code"])
+    if loinc_code:
+        coding.append({"system": fhir.LOINC, "code": loinc_code})
+    return {
+        "resourceType": "Observation",
+        "id": f"vital-{row['id']}",
+        "meta": _meta(row),
+        "status": "final",
+        "category": [{"coding": [{"system": fhir.OBSERVATION_CATEGORY, "code": "vital-signs"}]}],
+        "code": {"coding": coding},
+        "subject": _subject(row["patient_id"]),
+        "effectiveDateTime": fhir.format_instant(row["record_time"]),
+        "valueQuantity": _quantity(row),
+    }
+
+
+# =========================
+# EXPORT
+# =========================
+
+
+def _converted_columns(model, code_column, targets):
+    """The columns of ``model`` with value, unit and reference bounds converted to ``targets``"""
+    units = UnitConversion(targets, model.unit, code_column)
+    columns = []
+    for column in model.__table__.columns:
+        if column.key == "unit":
+            columns.append(units.unit())
+        elif column.key in ("value", "reference_low", "reference_high"):
+            columns.append(units.value(column))
+        else:
+            columns.append(column)
+    return columns
+
+
+def chunk_resources(db: Session, patient_ids, types=RESOURCE_TYPES, targets=None):
+    """FHIR resources of the given patients as ``{type: [resource, ...]}``, each in id order.
+
+    One query per requested entity, joined to its patient, so the cost
+    follows the size of the chunk rather than the number of related rows.
+    Quantities are converted to ``targets`` (see :func:`app.units.parse_targets`)
+    by the same queries.
+    """
+    targets = targets or {}
+    resources = {resource_type: [] for resource_type in types}
+    in_chunk = Composition.patient_id.in_(patient_ids)
+
+    if "Patient" in types:
+        query = select(Patient.__table__).where(Patient.id.in_(patient_ids)).order_by(Patient.id)
+        resources["Patient"] = [patient_resource(row) for row in rows_as_dicts(db.execute(query))]
+    if "Encounter" in types:
+        query = select(Composition.__table__).where(in_chunk).order_by(Composition.id)
+        resources["Encounter"] = [
+            encounter_resource(row) for row in rows_as_dicts(db.execute(query))
+        ]
+    if "Specimen" in types:
+        # Once per chunk, however many of its lab tests are in it
+        query = (
+            select(Specimen.__table__, Composition.patient_id)
+            .join(LabTest, LabTest.specimen_id == Specimen.id)
+            .join(Composition, Composition.id == LabTest.composition_id)
+            .where(in_chunk)
+            .group_by(Specimen.id)
+            .order_by(Specimen.id)
+        )
+        resources["Specimen"] = [specimen_resource(row) for row in rows_as_dicts(db.execute(query))]
+
+    if "DiagnosticReport" in types or "Observation" in types:
+        analytes = rows_as_dicts(
+            db.execute(
+                select(
+                    *_converted_columns(LabAnalyteResult, LabAnalyteResult.loinc_code, targets),
+                    LabTest.composition_id,
+                    LabTest.specimen_id,
+                    Composition.patient_id,
+                    Composition.start_time,
+                )
+                .join(LabTest, LabTest.id == LabAnalyteResult.lab_test_id)
+                .join(Composition, Composition.id == LabTest.composition_id)
+                .where(in_chunk)
+                .order_by(LabAnalyteResult.id)
+            )
+        )
+    if "DiagnosticReport" in types:
+        results = {}
+        for analyte in analytes:
+            results.setdefault(analyte["lab_test_id"], []).append(analyte["id"])
+        query = (
+            select(LabTest.__table__, Composition.patient_id, Composition.start_time)
+            .join(Composition, Composition.id == LabTest.composition_id)
+            .where(in_chunk)
+            .order_by(LabTest.id)
+        )
+        resources["DiagnosticReport"] = [
+            report_resource(row, results.get(row["id"], []))
+            for row in rows_as_dicts(db.execute(query))
+        ]
+    if "Observation" in types:
+        query = (
+            select(*_converted_columns(BodyMeasurement, BodyMeasurement.snomed_code, targets))
+            .where(BodyMeasurement.patient_id.in_(patient_ids))
+            .order_by(BodyMeasurement.id)
+        )
+        resources["Observation"] = [analyte_resource(row) for row in analytes] + [
+            measurement_resource(row) for row in rows_as_dicts(db.execute(query))
+        ]
+    return resources
+
+
+def export_chunk(patient_ids, types=RESOURCE_TYPES, targets=None):
+    """NDJSON of one chunk of patients as ``{type: bytes}``; runs in a worker process"""
+    with database.ReadSessionLocal() as db:
+        resources = chunk_resources(db, patient_ids, types, targets)
+    return {
+        resource_type: b"".join(dumps(resource) + b"\n" for resource in items)
+        for resource_type, items in resources.items()
+    }
+
+
+def _init_worker():
+    # Never share pooled SQLite connections with the parent process
+    database.read_engine.dispose(close=False)
+
+
+def _process_pool(workers):
+    # spawn, not fork: the server process runs threads
+    context = get_context("spawn")
+    return ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker)
+
+
+class ExportPool:
+    """Export worker processes shared by every export of one server process.
+
+    Spawning a worker costs an interpreter start and the app imports, so the
+    API starts the pool once in its lifespan rather than per request, and
+    concurrent exports take turns on the same ``workers`` processes.
+    """
+
+    def __init__(self, workers=EXPORT_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """The process pool, or None when stopped or exporting in the calling process"""
+        return self._executor
+
+    def start(self):
+        with self._start_lock:
+            if self._executor is None and self.workers > 1:
+                self._executor = _process_pool(self.workers)
+
+    def stop(self):
+        """Drop the chunks not started yet and stop the worker processes"""
+        with self._start_lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+export_pool = ExportPool()
+
+
+def patient_chunks(patient_ids=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Patient IDs in id order, ``chunk_size`` at a time (every patient when none are given)"""
+    if patient_ids is not None:
+        patient_ids = sorted(set(patient_ids))
+        for start in range(0, len(patient_ids), chunk_size):
+            yield patient_ids[start : start + chunk_size]
+        return
+    after = 0
+    while True:
+        with database.ReadSessionLocal() as db:
+            chunk = (
+                db.execute(
+                    select(Patient.id)
+                    .where(Patient.id > after)
+                    .order_by(Patient.id)
+                    .limit(chunk_size)
+                )
+                .scalars()
+                .all()
+            )
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]
+
+
+def export_ndjson(
+    patient_ids=None,
+    types=RESOURCE_TYPES,
+    workers=EXPORT_WORKERS,
+    chunk_size=EXPORT_CHUNK_SIZE,
+    targets=None,
+    pool=None,
+):
+    """Yield ``{type: ndjson bytes}`` per chunk of patients, in patient id order.
+
+    Chunks are exported by ``workers`` processes in parallel: those of
+    ``pool`` when given (in the calling process while it is not started),
+    else a pool of their own for this export. At most two chunks per worker
+    are in flight, so memory stays bounded however large the cohort and
+    however slowly the output is consumed.
+    """
+    if pool is not None:
+        workers = pool.workers if pool.executor is not None else 1
+    chunks = patient_chunks(patient_ids, chunk_size)
+    single_chunk = patient_ids is not None and len(set(patient_ids)) <= chunk_size
+    if workers <= 1 or single_chunk:
+        for chunk in chunks:
+            yield export_chunk(chunk, types, targets)
+        return
+
+    if pool is not None:
+        yield from _export_chunks(pool.executor, workers, chunks, types, targets)
+        return
+    with _process_pool(workers) as executor:
+        yield from _export_chunks(executor, workers, chunks, types, targets)
+
+
+def _export_chunks(executor, workers, chunks, types, targets):
+    pending = []
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(export_chunk, chunk, types, targets))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        while pending:
+            yield pending.pop(0).result()
+    finally:
+        # An abandoned export (client gone) leaves no work queued on a shared pool
+        for future in pending:
+            future.cancel()
+
+
+def export_directory(
+    directory, patient_ids=None, workers=EXPORT_WORKERS, chunk_size=EXPORT_CHUNK_SIZE, targets=None
+):
+    """Write one ``<type>.ndjson`` per resource type plus a Bulk Data style ``manifest.json``"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    counts = dict.fromkeys(RESOURCE_TYPES, 0)
+    files = {
+        resource_type: (directory / f"{resource_type}.ndjson").open("wb")
+        for resource_type in RESOURCE_TYPES
+    }
+    try:
+        for chunk in export_ndjson(patient_ids, RESOURCE_TYPES, workers, chunk_size, targets):
+            for resource_type, data in chunk.items():
+                files[resource_type].write(data)
+                counts[resource_type] += data.count(b"\n")
+    finally:
+        for handle in files.values():
+            handle.close()
+
+    manifest = {
+        "transactionTime": fhir.format_instant(datetime.utcnow()),
+        "requiresAccessToken": False,
+        "output": [
+            {"type": resource_type, "url": f"{resource_type}.ndjson", "count": count}
+            for resource_type, count in counts.items()
+        ],
+        "error": [],
+    }
+    (directory / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    manifest["seconds"] = round(time.perf_counter() - started, 3)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export patients as FHIR NDJSON files")
+    parser.add_argument("directory", help="output directory")
+    parser.add_argument("--patients", help="comma-separated patient IDs (default: all)")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument(
+        "--unit",
+        action="append",
+        help="convert quantities to this unit, or <code>:<unit> for one code (repeatable)",
+    )
+    args = parser.parse_args()
+
+    patient_ids = [int(value) for value in args.patients.split(",")] if args.patients else None
+    try:
+        targets = parse_targets(args.unit)
+    except ValueError as exc:
+        parser.error(str(exc))
+    manifest = export_directory(args.directory, patient_ids, args.workers, args.chunk_size, targets)
+    total = sum(output["count"] for output in manifest["output"])
+    print(f"Exported {total} resources in {manifest['seconds']:.1f} s to {args.directory}")
+    for output in manifest["output"]:
+        print(f"  {output['url']}: {output['count']}")
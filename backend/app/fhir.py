@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+
+# Code systems
+LOINC = "http://loinc.org"
+SNOMED = "http://snomed.info/sct"
+UCUM = "http://unitsofmeasure.org"
+INTERPRETATION = "http://terminology.hl7.org/CodeSystem/v3-ObservationInterpretation"
+OBSERVATION_CATEGORY = "http://terminology.hl7.org/CodeSystem/observation-category"
+REPORT_CATEGORY = "http://terminology.hl7.org/CodeSystem/v2-0074"
+ACT_CODE = "http://terminology.hl7.org/CodeSystem/v3-ActCode"
+
+# LOINC codes of FHIR vital-signs observations -> the SNOMED CT codes body
+# measurements are stored under
+VITAL_SIGN_SNOMED = {
+    "8302-2": "50373000",  # Body height
+    "29463-7": "27113001",  # Body weight
+    "8480-6": "271649006",  # Systolic blood pressure
+    "8462-4": "271650006",  # Diastolic blood pressure
+    "8310-5": "386725007",  # Body temperature
+}
+SNOMED_VITAL_SIGN = {snomed: loinc for loinc, snomed in VITAL_SIGN_SNOMED.items()}
+
+
+def coding_code(concept, system):
+    """The first code from ``system`` in a CodeableConcept, or None"""
+    for coding in (concept or {}).get("coding", []):
+        if coding.get("system") == system and coding.get("code"):
+            return coding["code"]
+    return None
+
+
+def concept_text(concept):
+    """A CodeableConcept's text, else the display of its first coding that has one"""
+    concept = concept or {}
+    if concept.get("text"):
+        return concept["text"]
+    for coding in concept.get("coding", []):
+        if coding.get("display"):
+            return coding["display"]
+    return None
+
+
+def has_category(resource, code):
+    return any(
+        coding_code(category, OBSERVATION_CATEGORY) == code
+        for category in resource.get("category", [])
+    )
+
+
+def parse_instant(text):
+    """Parse a FHIR dateTime/instant into the naive UTC datetime the database stores"""
+    if not text:
+        return None
+    value = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def format_instant(value):
+    """Format a stored (naive UTC) datetime as a FHIR dateTime"""
+    return value.isoformat() + "Z" if value is not None else None
+
+
+def resource_keys(resource, full_url=None):
+    """Every string another resource may use to reference this one"""
+    keys = []
+    if full_url:
+        keys.append(full_url)
+    if resource.get("id"):
+        keys.append(f"{resource['resourceType']}/{resource['id']}")
+    return keys
+
+
+def reference_key(reference):
+    """The lookup key of a Reference, or None if it only carries an identifier"""
+    return (reference or {}).get("reference")
@@ -0,0 +1,567 @@
+import argparse
+import gzip
+import json
+import os
+import zlib
+from datetime import datetime
+
+from app import database
+from app.changes import CREATE
+from app.models import (
+    BodyMeasurement,
+    BodyMeasurementHistory,
+    ChangeLog,
+    Composition,
+    CompositionHistory,
+    HistoryArchiveIndex,
+    HistoryDelta,
+    LabAnalyteResult,
+    LabAnalyteResultHistory,
+    LabTest,
+    LabTestHistory,
+    Patient,
+    PatientHistory,
+    ReferenceRange,
+    ReferenceRangeHistory,
+    Specimen,
+    SpecimenHistory,
+)
+from app.writer import write_queue
+from sqlalchemy import DateTime, case, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+# Entity name (main table name) -> (model, history model, history column pointing at the record)
+HISTORY_MODELS = {
+    "patient": (Patient, PatientHistory, PatientHistory.patient_id),
+    "composition": (Composition, CompositionHistory, CompositionHistory.composition_id),
+    "specimen": (Specimen, SpecimenHistory, SpecimenHistory.specimen_id),
+    "lab_test": (LabTest, LabTestHistory, LabTestHistory.lab_test_id),
+    "lab_analyte_result": (
+        LabAnalyteResult,
+        LabAnalyteResultHistory,
+        LabAnalyteResultHistory.lab_analyte_result_id,
+    ),
+    "body_measurement": (
+        BodyMeasurement,
+        BodyMeasurementHistory,
+        BodyMeasurementHistory.body_measurement_id,
+    ),
+    "reference_range": (
+        ReferenceRange,
+        ReferenceRangeHistory,
+        ReferenceRangeHistory.reference_range_loinc_code,
+    ),
+}
+
+# Stable codes identifying each entity in history_delta; never renumber
+ENTITY_CODES = {
+    "patient": 1,
+    "composition": 2,
+    "specimen": 3,
+    "lab_test": 4,
+    "lab_analyte_result": 5,
+    "body_measurement": 6,
+    "reference_range": 7,
+}
+
+# How updates archive the previous version: "full" copies every column into the
+# entity's history table, "delta" stores only the changed fields in history_delta.
+# Readers understand both, so the setting can be changed at any time.
+HISTORY_FORMAT = os.getenv("HISTORY_FORMAT", "full")
+# In delta format, every Nth version is stored whole, so reconstructing any
+# version applies at most N - 1 deltas
+SNAPSHOT_INTERVAL = int(os.getenv("HISTORY_SNAPSHOT_INTERVAL", "10"))
+
+# Cold storage for history versions moved out of the database by retention
+ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(database.engine.url.database or ".")), "history_archive"
+)
+
+
+def archive_path(entity, delta=False):
+    suffix = "history_delta" if delta else "history"
+    return os.path.join(ARCHIVE_DIR, f"{entity}_{suffix}.ndjson.gz")
+
+
+def _archive_key(entity, row, delta):
+    """The record a history row (as a dict) belongs to, as history_archive_index stores it"""
+    _, _, owner = HISTORY_MODELS[entity]
+    return row["entity_key"] if delta else str(row[owner.key])
+
+
+def _index_member(db: Session, entity, rows, offset, length, delta):
+    keys = dict.fromkeys(_archive_key(entity, row, delta) for row in rows)
+    db.execute(
+        insert(HistoryArchiveIndex),
+        [
+            {
+                "entity": ENTITY_CODES[entity],
+                "delta": delta,
+                "entity_key": key,
+                "member_offset": offset,
+                "member_length": length,
+            }
+            for key in keys
+        ],
+    )
+
+
+def append_to_archive(db: Session, entity, rows, delta=False):
+    """Append history rows (dicts of history table columns) to the entity's archive file.
+
+    Each call adds one gzip member and indexes it by record in ``db``'s
+    transaction. The file is fsynced before returning, so callers can delete
+    the rows from the database afterwards; if that transaction never
+    commits, the member stays unindexed and readers never see it.
+    """
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    lines = "".join(json.dumps(row, default=_encode, ensure_ascii=False) + "\n" for row in rows)
+    member = gzip.compress(lines.encode("utf-8"))
+    with open(archive_path(entity, delta), "ab") as handle:
+        offset = handle.tell()
+        handle.write(member)
+        handle.flush()
+        os.fsync(handle.fileno())
+    _index_member(db, entity, rows, offset, len(member), delta)
+
+
+def read_archive(db: Session, entity, entity_id):
+    """Yield ``(kind, row)`` for the archived history rows of one record, kind "full" or
+    "delta", decoding datetimes back to Python.
+
+    Only the gzip members the index lists for the record are read, so the
+    cost follows the record's own archived history, not the whole archive.
+    """
+    index = HistoryArchiveIndex.__table__
+    members = db.execute(
+        select(index.c.delta, index.c.member_offset, index.c.member_length)
+        .where(index.c.entity == ENTITY_CODES[entity], index.c.entity_key == str(entity_id))
+        .order_by(index.c.delta, index.c.member_offset)
+    ).all()
+    _, history_model, _ = HISTORY_MODELS[entity]
+    for delta in (False, True):
+        spans = [(offset, length) for kind, offset, length in members if kind == delta]
+        if not spans:
+            continue
+        table = HistoryDelta.__table__ if delta else history_model.__table__
+        datetime_columns = [column.name for column in table.c if isinstance(column.type, DateTime)]
+        with open(archive_path(entity, delta), "rb") as handle:
+            for offset, length in spans:
+                handle.seek(offset)
+                for line in gzip.decompress(handle.read(length)).decode("utf-8").splitlines():
+                    row = json.loads(line)
+                    if _archive_key(entity, row, delta) != str(entity_id):
+                        continue
+                    for name in datetime_columns:
+                        if row.get(name) is not None:
+                            row[name] = datetime.fromisoformat(row[name])
+                    yield ("delta" if delta else "full"), row
+
+
+def _archive_members(path, chunk_size=1 << 16):
+    """Yield ``(offset, length, text)`` for each gzip member of an archive file"""
+    offset = 0
+    pending = b""
+    with open(path, "rb") as handle:
+        while True:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            parts = []
+            length = 0
+            while not decompressor.eof:
+                chunk = pending or handle.read(chunk_size)
+                pending = b""
+                if not chunk:
+                    # End of file (a member cut off by a crash was never indexed)
+                    return
+                parts.append(decompressor.decompress(chunk))
+                length += len(chunk) - len(decompressor.unused_data)
+            pending = decompressor.unused_data
+            yield offset, length, b"".join(parts).decode("utf-8")
+            offset += length
+
+
+def index_archive_files(db: Session):
+    """Index archive files written before history_archive_index existed.
+
+    Files of an entity and format that already have index rows are left
+    alone. Returns the number of gzip members indexed.
+    """
+    index = HistoryArchiveIndex.__table__
+    indexed = 0
+    for entity in HISTORY_MODELS:
+        for delta in (False, True):
+            path = archive_path(entity, delta)
+            if not os.path.exists(path):
+                continue
+            known = db.execute(
+                select(index.c.entity).where(
+                    index.c.entity == ENTITY_CODES[entity], index.c.delta == delta
+                )
+            ).first()
+            if known is not None:
+                continue
+            for offset, length, text in _archive_members(path):
+                rows = [json.loads(line) for line in text.splitlines() if line]
+                if rows:
+                    _index_member(db, entity, rows, offset, length, delta)
+                    indexed += 1
+    return indexed
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def tracked_columns(entity):
+    """Columns of the main table a delta can change (all but the key, version and updated_at)"""
+    model, _, _ = HISTORY_MODELS[entity]
+    return [
+        column
+        for column in model.__table__.c
+        if not column.primary_key and column.key not in ("version", "updated_at")
+    ]
+
+
+def encode_changes(values):
+    return json.dumps(values, default=_encode, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_changes(entity, changes):
+    """Parse a history_delta ``changes`` document back into Python values"""
+    values = json.loads(changes)
+    for column in tracked_columns(entity):
+        if isinstance(column.type, DateTime) and values.get(column.key) is not None:
+            values[column.key] = datetime.fromisoformat(values[column.key])
+    return values
+
+
+def delta_row(entity, entity_id, version, old, new, updated_at):
+    """The history_delta row archiving version ``old``, which ``new`` superseded.
+
+    Stores the old values of the fields that differ, or all of them when the
+    version is due for a snapshot (or ``new`` is unknown).
+    """
+    snapshot = new is None or version % SNAPSHOT_INTERVAL == 0
+    changes = {
+        column.key: old[column.key]
+        for column in tracked_columns(entity)
+        if snapshot or old[column.key] != new.get(column.key)
+    }
+    return {
+        "entity": ENTITY_CODES[entity],
+        "entity_key": str(entity_id),
+        "version": version,
+        "snapshot": snapshot,
+        "changes": encode_changes(changes),
+        "updated_at": updated_at,
+    }
+
+
+def archive_version(db: Session, entity, record, changes):
+    """Archive the current state of ``record`` before ``changes`` are applied to it.
+
+    This is the one place update handlers write history; the storage format
+    follows ``HISTORY_FORMAT``.
+    """
+    model, history_model, owner = HISTORY_MODELS[entity]
+    entity_id = getattr(record, model.__mapper__.primary_key[0].key)
+    updated_at = datetime.utcnow()
+
+    if HISTORY_FORMAT == "delta":
+        old = {column.key: getattr(record, column.key) for column in tracked_columns(entity)}
+        new = {**old, **{key: value for key, value in changes.items() if key in old}}
+        db.execute(
+            insert(HistoryDelta),
+            [delta_row(entity, entity_id, record.version, old, new, updated_at)],
+        )
+        return
+
+    values = {owner.key: entity_id, "updated_at": updated_at}
+    for column in history_model.__table__.c:
+        if column.key not in values and not column.primary_key and hasattr(record, column.key):
+            values[column.key] = getattr(record, column.key)
+    db.add(history_model(**values))
+
+
+def purge_history(db: Session, entity, entity_id):
+    """Delete every stored history version of one record, in either format"""
+    _, history_model, owner = HISTORY_MODELS[entity]
+    db.execute(delete(history_model).where(owner == entity_id))
+    db.execute(
+        delete(HistoryDelta).where(
+            HistoryDelta.entity == ENTITY_CODES[entity],
+            HistoryDelta.entity_key == str(entity_id),
+        )
+    )
+    # Archived versions become unreachable; the archive files are append-only
+    db.execute(
+        delete(HistoryArchiveIndex).where(
+            HistoryArchiveIndex.entity == ENTITY_CODES[entity],
+            HistoryArchiveIndex.entity_key == str(entity_id),
+        )
+    )
+
+
+def version_from_history(entity, row):
+    """Map a history row onto the main table's columns, plus when it was superseded"""
+    model, _, owner = HISTORY_MODELS[entity]
+    version = {}
+    for column in model.__table__.c:
+        if column.primary_key:
+            version[column.name] = row[owner.key]
+        else:
+            version[column.name] = row.get(column.name)
+    version["updated_at"] = row.get("updated_at")
+    return version
+
+
+def _stored_versions(db: Session, entity, entity_id, archived=True, min_version=None):
+    """Archived versions of one record as {version: (kind, row)}, kind "full" or "delta"
+
+    Only versions from ``min_version`` up are read from the database; the cold
+    archive is skipped entirely when ``archived`` is False.
+    """
+    _, history_model, owner = HISTORY_MODELS[entity]
+    stored = {}
+
+    if archived:
+        for kind, row in read_archive(db, entity, entity_id):
+            stored[row["version"]] = (kind, row)
+
+    history_table = history_model.__table__
+    query = select(history_table).where(owner == entity_id)
+    if min_version is not None:
+        query = query.where(history_table.c.version >= min_version)
+    result = db.execute(query)
+    keys = list(result.keys())
+    for values in result:
+        row = dict(zip(keys, values))
+        stored[row["version"]] = ("full", row)
+
+    delta_table = HistoryDelta.__table__
+    query = select(delta_table).where(
+        delta_table.c.entity == ENTITY_CODES[entity],
+        delta_table.c.entity_key == str(entity_id),
+    )
+    if min_version is not None:
+        query = query.where(delta_table.c.version >= min_version)
+    result = db.execute(query)
+    keys = list(result.keys())
+    for values in result:
+        row = dict(zip(keys, values))
+        stored[row["version"]] = ("delta", row)
+
+    return stored
+
+
+def _reconstruct(entity, entity_id, stored, current):
+    """Rebuild full versions from stored ones, newest first.
+
+    Deltas are reverse deltas: each holds the fields of its version that the
+    next version changed, so the walk starts from the current row and undoes
+    one update at a time. Full history rows and snapshots reset the state.
+    """
+    model, _, _ = HISTORY_MODELS[entity]
+    key = model.__mapper__.primary_key[0].key
+    versions = {}
+    state = None
+
+    if current is not None:
+        state = {column.name: getattr(current, column.key) for column in model.__table__.c}
+        state["updated_at"] = None
+        versions[current.version] = state
+
+    for number in sorted(stored, reverse=True):
+        kind, row = stored[number]
+        if kind == "full":
+            state = version_from_history(entity, row)
+        else:
+            changes = decode_changes(entity, row["changes"])
+            if row["snapshot"] or state is None:
+                state = {column.name: None for column in model.__table__.c}
+            state = {**state, **changes, key: entity_id, "version": number}
+            state["updated_at"] = row["updated_at"]
+        versions[number] = state
+
+    return versions
+
+
+def get_versions(db: Session, entity, entity_id, archived=True):
+    """Every known version of one record, oldest first.
+
+    Archived versions are read from the cold archive on demand, then the
+    history tables, then the current row (whose ``updated_at`` is None).
+    """
+    model, _, _ = HISTORY_MODELS[entity]
+    stored = _stored_versions(db, entity, entity_id, archived=archived)
+    versions = _reconstruct(entity, entity_id, stored, db.get(model, entity_id))
+    return [versions[number] for number in sorted(versions)]
+
+
+def get_version(db: Session, entity, entity_id, number):
+    """Rebuild one version, reading only the versions between it and the next snapshot"""
+    model, history_model, owner = HISTORY_MODELS[entity]
+    history_table = history_model.__table__
+    delta_table = HistoryDelta.__table__
+
+    # The nearest version at or above ``number`` stored whole bounds the walk
+    full_version = db.execute(
+        select(func.min(history_table.c.version)).where(
+            owner == entity_id, history_table.c.version >= number
+        )
+    ).scalar()
+    snapshot_version = db.execute(
+        select(func.min(delta_table.c.version)).where(
+            delta_table.c.entity == ENTITY_CODES[entity],
+            delta_table.c.entity_key == str(entity_id),
+            delta_table.c.snapshot.is_(True),
+            delta_table.c.version >= number,
+        )
+    ).scalar()
+    bounds = [value for value in (full_version, snapshot_version) if value is not None]
+
+    stored = _stored_versions(db, entity, entity_id, archived=False, min_version=number)
+    if bounds:
+        stored = {version: row for version, row in stored.items() if version <= min(bounds)}
+        versions = _reconstruct(entity, entity_id, stored, None)
+    else:
+        versions = _reconstruct(entity, entity_id, stored, db.get(model, entity_id))
+
+    if number not in versions:
+        # Older than anything in the database: fall back to the archive
+        versions = {version["version"]: version for version in get_versions(db, entity, entity_id)}
+    return versions.get(number)
+
+
+def created_at(db: Session, entity, entity_id):
+    """When a record was created, from the change feed; None if it has no create entry
+    (rows loaded from seed files)
+    """
+    return db.execute(
+        select(ChangeLog.changed_at)
+        .where(
+            ChangeLog.entity == entity,
+            ChangeLog.entity_id == str(entity_id),
+            ChangeLog.operation == CREATE,
+        )
+        .order_by(ChangeLog.seq.desc())
+        .limit(1)
+    ).scalar()
+
+
+def get_version_as_of(db: Session, entity, entity_id, as_of):
+    """The version of a record that was current at ``as_of``.
+
+    None if the record did not exist yet at ``as_of`` (or is unknown).
+    Retention only moves the oldest versions out of the database, so the
+    cold archive is read only when the oldest version still in the database
+    may not be the answer.
+    """
+    model, history_model, owner = HISTORY_MODELS[entity]
+    history_table = history_model.__table__
+    delta_table = HistoryDelta.__table__
+
+    created = created_at(db, entity, entity_id)
+    if created is not None and as_of < created:
+        return None
+
+    history_filter = [owner == entity_id]
+    delta_filter = [
+        delta_table.c.entity == ENTITY_CODES[entity],
+        delta_table.c.entity_key == str(entity_id),
+    ]
+    # Per table: the first version superseded after ``as_of`` (a version stopped
+    # being current when it was archived at updated_at), and the oldest version
+    candidates = []
+    oldest = []
+    for table, conditions in ((history_table, history_filter), (delta_table, delta_filter)):
+        superseded = case((table.c.updated_at > as_of, table.c.version))
+        first, low = db.execute(
+            select(func.min(superseded), func.min(table.c.version)).where(*conditions)
+        ).one()
+        candidates += [first] if first is not None else []
+        oldest += [low] if low is not None else []
+    oldest = min(oldest, default=None)
+
+    if candidates:
+        number = min(candidates)
+        # The version before it is in the database too, superseded by ``as_of``
+        if number == 1 or number > oldest:
+            return get_version(db, entity, entity_id, number)
+    elif oldest is not None:
+        # Every version in the database was superseded by ``as_of``, and archived
+        # ones even earlier: the current row is the answer
+        current = db.get(model, entity_id)
+        return get_version(db, entity, entity_id, current.version) if current is not None else None
+
+    # Older versions may be archived, and one of them may be the answer
+    for version in get_versions(db, entity, entity_id):
+        if version["updated_at"] is None or version["updated_at"] > as_of:
+            return version
+    return None
+
+
+def convert_to_delta(db: Session, entity, chunk_size):
+    """Convert the full history rows of up to ``chunk_size`` records to history_delta rows.
+
+    Returns the number of history rows converted.
+    """
+    model, history_model, owner = HISTORY_MODELS[entity]
+    history_table = history_model.__table__
+
+    entity_ids = (
+        db.execute(select(owner).distinct().order_by(owner).limit(chunk_size)).scalars().all()
+    )
+    converted = 0
+    for entity_id in entity_ids:
+        versions = {
+            version["version"]: version
+            for version in get_versions(db, entity, entity_id, archived=False)
+        }
+        result = db.execute(select(history_table.c.version).where(owner == entity_id))
+        rows = [
+            delta_row(
+                entity,
+                entity_id,
+                number,
+                versions[number],
+                versions.get(number + 1),
+                versions[number]["updated_at"],
+            )
+            for number in result.scalars()
+        ]
+        db.execute(insert(HistoryDelta), rows)
+        db.execute(delete(history_table).where(owner == entity_id))
+        converted += len(rows)
+    return converted
+
+
+def convert_history(chunk_size=100):
+    """Rewrite every full history table into history_delta, one short transaction per chunk"""
+    converted = {}
+    for entity in HISTORY_MODELS:
+        converted[entity] = 0
+        while True:
+            count = write_queue.run(
+                lambda db, entity=entity: convert_to_delta(db, entity, chunk_size)
+            )
+            if not count:
+                break
+            converted[entity] += count
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="History storage maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    convert = subcommands.add_parser(
+        "convert", help="convert full history rows to the delta format"
+    )
+    convert.add_argument(
+        "--chunk-size", type=int, default=100, help="records converted per transaction"
+    )
+    args = parser.parse_args()
+    if args.command == "convert":
+        print(convert_history(args.chunk_size))
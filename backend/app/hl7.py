@@ -0,0 +1,730 @@
+import argparse
+import math
+import os
+import queue
+import re
+import shutil
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from app import database, models
+from app.filelock import release_file_lock, try_file_lock
+from app.ingest import INGEST_BATCH_SIZE, BatchIngest
+from app.responses import dumps
+
+# Port of the MLLP listener started with the API (unset: no listener)
+HL7_MLLP_PORT = int(os.getenv("HL7_MLLP_PORT", "0"))
+HL7_MLLP_HOST = os.getenv("HL7_MLLP_HOST", "127.0.0.1")
+# Directory watched for dropped HL7 files (unset: not watched)
+HL7_DROP_DIR = os.getenv("HL7_DROP_DIR", "")
+HL7_POLL_INTERVAL = float(os.getenv("HL7_POLL_INTERVAL_S", "1"))
+# Seconds an MLLP connection waits for its message to be written before giving up
+# on the ACK (the sender then resends, as after a lost connection)
+HL7_ACK_TIMEOUT = float(os.getenv("HL7_ACK_TIMEOUT_S", "60"))
+# Seconds between attempts of a standby worker to take over the listener
+HL7_STANDBY_INTERVAL = 5.0
+
+# MLLP framing
+START_BLOCK = b"\x0b"
+END_BLOCK = b"\x1c\x0d"
+
+# Coding systems of CWE/CE fields, as HL7 table 0396 names them
+LOINC_SYSTEMS = ("LN", "LOINC")
+SNOMED_SYSTEMS = ("SCT", "SNM", "SNOMED")
+
+# PID-8 administrative sex
+SEX = {"M": "male", "F": "female"}
+
+_TIMESTAMP = re.compile(
+    r"(\d{4})(\d{2})?(\d{2})?(\d{2})?(\d{2})?(\d{2})?(?:\.(\d{1,4}))?(?:([+-])(\d{2})(\d{2}))?$"
+)
+_RANGE = re.compile(r"\s*(-?[\d.]+)\s*-\s*(-?[\d.]+)\s*$")
+_BOUND = re.compile(r"\s*([<>])=?\s*(-?[\d.]+)\s*$")
+
+
+# =========================
+# PARSING
+# =========================
+
+
+class Message:
+    """One HL7 v2 message, split into segments and fields.
+
+    Fields are numbered as in the standard, so ``message.field(seg, 3)`` is
+    PID-3 on a PID segment and MSH-9 is ``field(msh, 9)`` even though MSH-1
+    is the field separator itself.
+    """
+
+    def __init__(self, text):
+        text = text.strip("\x0b\x1c\r\n ")
+        if not text.startswith("MSH") or len(text) < 8:
+            raise ValueError("Message does not start with an MSH segment")
+        self.separator = text[3]
+        encoding = text[4:8]
+        self.component, self.repetition, self.escape, self.subcomponent = encoding
+        self.segments = [
+            segment.split(self.separator) for segment in re.split(r"\r\n|\r|\n", text) if segment
+        ]
+        # Re-align MSH so MSH-n is index n like every other segment
+        self.segments[0].insert(1, self.separator)
+
+    def field(self, segment, number):
+        return segment[number] if number < len(segment) else ""
+
+    def components(self, segment, number, repetition=0):
+        """Components of one repetition of a field, unescaped"""
+        repetitions = self.field(segment, number).split(self.repetition)
+        if repetition >= len(repetitions):
+            return []
+        return [self.unescape(value) for value in repetitions[repetition].split(self.component)]
+
+    def component_value(self, segment, number, component=1):
+        values = self.components(segment, number)
+        return values[component - 1] if component <= len(values) else ""
+
+    def unescape(self, value):
+        if self.escape not in value:
+            return value
+        replacements = {
+            "F": self.separator,
+            "S": self.component,
+            "T": self.subcomponent,
+            "R": self.repetition,
+            "E": self.escape,
+        }
+        escape = re.escape(self.escape)
+        return re.sub(
+            f"{escape}([FSTRE]){escape}", lambda match: replacements[match.group(1)], value
+        )
+
+    @property
+    def header(self):
+        return self.segments[0]
+
+    @property
+    def control_id(self):
+        return self.field(self.header, 10)
+
+    @property
+    def message_type(self):
+        return "^".join(self.components(self.header, 9)[:2])
+
+
+def split_messages(text):
+    """The messages of a file or stream: one per MSH, batch envelope segments dropped"""
+    messages, current = [], []
+    for segment in re.split(r"\r\n|\r|\n", text.replace("\x0b", "").replace("\x1c", "")):
+        if segment.startswith("MSH"):
+            if current:
+                messages.append("\r".join(current))
+            current = [segment]
+        elif segment[:3] in ("FHS", "BHS", "BTS", "FTS") or not segment.strip():
+            continue
+        elif current:
+            current.append(segment)
+    if current:
+        messages.append("\r".join(current))
+    return messages
+
+
+def parse_timestamp(value):
+    """An HL7 DTM/TS value as the naive UTC datetime the database stores.
+
+    Values with a UTC offset are converted; values without one are stored
+    as sent.
+    """
+    match = _TIMESTAMP.match(value or "")
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction, sign, offset_h, offset_m = match.groups()
+    parsed = datetime(
+        int(year),
+        int(month or 1),
+        int(day or 1),
+        int(hour or 0),
+        int(minute or 0),
+        int(second or 0),
+        int((fraction or "0").ljust(6, "0")),
+    )
+    if sign:
+        offset = timedelta(hours=int(offset_h), minutes=int(offset_m))
+        parsed = parsed - offset if sign == "+" else parsed + offset
+    return parsed
+
+
+def format_timestamp(value):
+    return value.strftime("%Y%m%d%H%M%S")
+
+
+def _coded(components, systems):
+    """The code from a CWE/CE field in one of ``systems``, checking the alternate triplet too"""
+    for start in (0, 3):
+        triplet = components[start : start + 3]
+        if len(triplet) == 3 and triplet[0] and triplet[2].upper() in systems:
+            return triplet[0]
+    return None
+
+
+def _reference_range(text):
+    """(low, high) from OBX-7 such as ``12.0-17.5``, ``<5`` or ``>60``"""
+    match = _RANGE.match(text or "")
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    match = _BOUND.match(text or "")
+    if match:
+        value = float(match.group(2))
+        return (None, value) if match.group(1) == "<" else (value, None)
+    return None, None
+
+
+# =========================
+# HL7 -> ROW MAPPING
+# =========================
+
+
+def patient_row(message, pid):
+    name = message.components(pid, 5)
+    sex = SEX.get(message.field(pid, 8).upper())
+    if not name or not name[0] or sex is None:
+        return None
+    return {
+        "first_name": " ".join(value for value in name[1:3] if value),
+        "last_name": name[0],
+        "sex": sex,
+        "identifier": message.component_value(pid, 3),
+    }
+
+
+def specimen_row(message, spm, obr):
+    """Specimen row from SPM (v2.5+) or, for older messages, OBR-15 and OBR-7"""
+    if spm is not None:
+        specimen_type = message.components(spm, 4)
+        collected = parse_timestamp(message.component_value(spm, 17))
+    else:
+        # OBR-15 specimen source: its first component is a CWE in subcomponents
+        source = message.field(obr, 15).split(message.repetition)[0].split(message.component)[0]
+        specimen_type = [message.unescape(value) for value in source.split(message.subcomponent)]
+        collected = parse_timestamp(message.component_value(obr, 7))
+    text = (specimen_type[1:2] or [""])[0] or (specimen_type[:1] or [""])[0]
+    if not text or collected is None:
+        raise ValueError("Specimen needs a type and a collection time (SPM-4, SPM-17)")
+    return {
+        "specimen_type": text,
+        "collection_time": collected,
+        "snomed_code": _coded(specimen_type, SNOMED_SYSTEMS),
+        "description": None,
+    }
+
+
+def analyte_row(message, obx):
+    value_type = message.field(obx, 2)
+    value = message.components(obx, 5)
+    if value_type == "SN":
+        # Structured numeric: only a plain (or "=") comparator and a single number
+        if len(value) < 2 or value[0] not in ("", "=") or any(value[2:]):
+            raise ValueError(f"Unsupported structured numeric {message.field(obx, 5)}")
+        value = value[1:2]
+    elif value_type != "NM":
+        raise ValueError(f"Non-numeric value type {value_type or 'missing'}")
+    loinc_code = _coded(message.components(obx, 3), LOINC_SYSTEMS)
+    if loinc_code is None:
+        raise ValueError("OBX-3 has no LOINC code")
+    try:
+        number = float(value[0])
+    except (IndexError, ValueError):
+        raise ValueError(f"OBX-5 is not a number: {message.field(obx, 5)!r}") from None
+    unit = message.component_value(obx, 6) or message.component_value(obx, 6, 2)
+    if not unit:
+        raise ValueError("OBX-6 has no unit")
+    low, high = _reference_range(message.field(obx, 7))
+    return {
+        "loinc_code": loinc_code,
+        "value": number,
+        "unit": unit,
+        "reference_low": low,
+        "reference_high": high,
+        "interpretation": message.component_value(obx, 8) or None,
+    }
+
+
+def order_groups(message):
+    """Yield ``(pid, obr, obx_segments, spm)`` per OBR of an ORU^R01"""
+    pid = obr = spm = None
+    observations = []
+    for segment in message.segments[1:]:
+        kind = segment[0]
+        if kind in ("PID", "OBR") and obr is not None:
+            yield pid, obr, observations, spm
+            obr, spm, observations = None, None, []
+        if kind == "PID":
+            pid = segment
+        elif kind == "OBR":
+            obr = segment
+        elif kind == "OBX" and obr is not None and spm is None:
+            observations.append(segment)
+        elif kind == "SPM" and obr is not None and spm is None:
+            # OBX after SPM describe the specimen, not results
+            spm = segment
+    if obr is not None:
+        yield pid, obr, observations, spm
+
+
+# =========================
+# INGEST
+# =========================
+
+
+class Hl7Ingest(BatchIngest):
+    """Maps HL7 v2 ORU^R01 messages onto patients, lab reports and specimens.
+
+    Each OBR group becomes one composition with one lab test (OBR-4), its
+    specimen (SPM, or OBR-15 in pre-2.5 messages) and an analyte result per
+    numeric OBX. A PID with a name and sex creates the patient if PID-3 is
+    not known yet. Records are written in batches like the FHIR ingest
+    (see :class:`~app.ingest.BatchIngest`); :meth:`add` returns the
+    message's state, whose ``errors`` fill in as its records are mapped and
+    written.
+    """
+
+    def __init__(self, batch_size=INGEST_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.messages = 0
+
+    def _record_error(self, record, message):
+        super()._record_error(record, message)
+        record["message"]["errors"].append(f"{record['part']}: {message}")
+
+    def _batch_failed(self, batch, exc):
+        # Nothing of the batch was stored, so its messages are rejected (AR) for the
+        # sender to resend, with the error once per message
+        states = {id(record["message"]): record["message"] for record in batch}
+        for state in states.values():
+            state["rejected"] = True
+            state["errors"].append(f"Not stored: {exc}")
+        for record in batch:
+            self.error(record["position"], record.get("name"), f"Batch not written: {exc}")
+
+    def add(self, position, text):
+        state = {"control_id": "", "errors": [], "header": None}
+        try:
+            message = Message(text)
+            state["control_id"], state["header"] = message.control_id, message.header
+            if message.message_type != "ORU^R01":
+                raise ValueError(f"Unsupported message type {message.message_type or 'missing'}")
+        except ValueError as exc:
+            state["rejected"] = True
+            state["errors"].append(str(exc))
+            self.error(position, None, str(exc))
+            return state
+        self.messages += 1
+        name = f"MSH-10 {state['control_id']}" if state["control_id"] else None
+
+        patients = set()
+        specimens = {}
+        for number, (pid, obr, observations, spm) in enumerate(order_groups(message), 1):
+            record = {
+                "kind": "report",
+                "position": f"{position} OBR {number}",
+                "part": f"OBR {number}",
+                "name": name,
+                "message": state,
+            }
+            try:
+                if pid is None:
+                    raise ValueError("OBR without a PID segment")
+                record["identifier"] = message.component_value(pid, 3)
+                if not record["identifier"]:
+                    raise ValueError("PID-3 has no patient identifier")
+                if record["identifier"] not in patients:
+                    patients.add(record["identifier"])
+                    row = patient_row(message, pid)
+                    if row is not None:
+                        self.queue({**record, "kind": "patient", "row": row})
+                # OBRs of one message that name the same specimen (SPM-2) share it
+                specimen_key = message.component_value(spm, 2) if spm is not None else None
+                if specimen_key and specimen_key in specimens:
+                    record["specimen"] = specimens[specimen_key]
+                else:
+                    row = specimen_row(message, spm, obr)
+                    record["specimen"] = {
+                        "row": row,
+                        "id": None,
+                        "collection_time": row["collection_time"],
+                    }
+                    if specimen_key:
+                        specimens[specimen_key] = record["specimen"]
+                service = message.components(obr, 4)
+                record["lab_test"] = {
+                    "loinc_code": _coded(service, LOINC_SYSTEMS),
+                    "description": (service[1:2] or [None])[0] or None,
+                }
+                record["start_time"] = (
+                    parse_timestamp(message.component_value(obr, 7))
+                    or record["specimen"]["collection_time"]
+                )
+                record["analytes"] = []
+                for obx_number, obx in enumerate(observations, 1):
+                    try:
+                        record["analytes"].append(analyte_row(message, obx))
+                    except ValueError as exc:
+                        part = f"{record['part']} OBX {obx_number}"
+                        self._record_error(
+                            {**record, "position": f"{position} {part}", "part": part}, str(exc)
+                        )
+                if not record["analytes"]:
+                    raise ValueError("OBR has no numeric results")
+            except ValueError as exc:
+                self._record_error(record, str(exc))
+                continue
+            self.queue(record)
+        return state
+
+    def report(self):
+        return {**super().report(), "messages": self.messages}
+
+
+def acknowledgement(state):
+    """The ACK for a message: AA if everything was stored, AE if parts were skipped
+    (those are listed; the rest was stored, so do not resend it unchanged), AR if it
+    could not be read or its batch could not be written (resend it)
+    """
+    header = state["header"] or []
+    code = "AR" if state.get("rejected") else "AE" if state["errors"] else "AA"
+    text = "; ".join(state["errors"])[:200].replace("|", "/").replace("^", "/")
+    # MSH-3..6 of the original: sending/receiving application and facility
+    original = [header[index] if index < len(header) else "" for index in (3, 4, 5, 6)]
+    segments = [
+        "|".join(
+            [
+                "MSH",
+                "^~\\&",
+                original[2] or "EHR",
+                original[3],
+                original[0],
+                original[1],
+                format_timestamp(datetime.utcnow()),
+                "",
+                "ACK^R01^ACK",
+                f"ACK{state['control_id']}",
+                header[11] if len(header) > 11 else "P",
+                header[12] if len(header) > 12 else "2.5.1",
+            ]
+        ),
+        "|".join(["MSA", code, state["control_id"], text]),
+    ]
+    return "\r".join(segments) + "\r"
+
+
+def rejection(text, error):
+    """An AR for a message that could not be processed, with its MSH if it has one"""
+    state = {"control_id": "", "errors": [error], "header": None, "rejected": True}
+    try:
+        message = Message(text)
+        state["control_id"], state["header"] = message.control_id, message.header
+    except ValueError:
+        pass
+    return acknowledgement(state)
+
+
+def ingest_hl7_files(paths, batch_size=INGEST_BATCH_SIZE):
+    """Ingest files of HL7 v2 messages; returns the ingest report (see :class:`Hl7Ingest`)"""
+    ingest = Hl7Ingest(batch_size)
+    for path in paths:
+        name = Path(path).name
+        text = Path(path).read_bytes().decode("utf-8", errors="replace")
+        for number, message in enumerate(split_messages(text), 1):
+            ingest.add(f"{name} message {number}", message)
+    ingest.flush()
+    return ingest.report()
+
+
+# =========================
+# MLLP LISTENER AND DROP DIRECTORY
+# =========================
+
+
+class Hl7Batcher:
+    """Writes messages from many MLLP connections in shared transactions.
+
+    Connections hand over a message and wait for its ACK, which is only sent
+    once its records have committed. The batcher thread takes every message
+    queued while the previous batch was being written (up to ``batch_size``),
+    so concurrent senders share transactions without anyone waiting for a
+    timer; a lone sender gets one transaction per message. A message that
+    fails unexpectedly is rejected (AR) without stopping the thread or the
+    rest of its batch.
+    """
+
+    def __init__(self, batch_size=INGEST_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="hl7-batcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, text) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            group = [item]
+            while len(group) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                group.append(item)
+            try:
+                self._write(group)
+            except Exception as exc:
+                print(f"❌ Error writing HL7 messages: {exc}")
+                for text, future in group:
+                    if not future.done():
+                        future.set_result(rejection(text, f"Not stored: {exc}"))
+
+    def _write(self, group):
+        # A fresh ingest per batch keeps memory flat on a long-running listener. The
+        # group is written in one flush, so a message is either stored or rejected whole
+        ingest = Hl7Ingest(batch_size=math.inf)
+        states = []
+        for text, future in group:
+            try:
+                states.append(ingest.add("MLLP", text))
+            except Exception as exc:
+                # Records it queued before failing may still be written with the batch
+                print(f"❌ Error mapping HL7 message: {exc}")
+                future.set_result(rejection(text, f"Internal error: {exc}"))
+                states.append(None)
+        ingest.flush()
+        for (_, future), state in zip(group, states):
+            if state is not None:
+                future.set_result(acknowledgement(state))
+
+
+class _MllpHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        buffer = b""
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            buffer += data
+            while END_BLOCK in buffer:
+                frame, buffer = buffer.split(END_BLOCK, 1)
+                start = frame.find(START_BLOCK)
+                if start < 0:
+                    continue
+                text = frame[start + 1 :].decode("utf-8", errors="replace")
+                try:
+                    ack = self.server.batcher.submit(text).result(timeout=HL7_ACK_TIMEOUT)
+                except TimeoutError:
+                    # No ACK: the sender resends on a new connection
+                    print(f"❌ No ACK for an HL7 message within {HL7_ACK_TIMEOUT:g} s")
+                    return
+                self.request.sendall(START_BLOCK + ack.encode() + END_BLOCK)
+
+
+class _MllpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class DropDirectoryWatcher:
+    """Ingests files dropped into ``directory`` every ``interval`` seconds.
+
+    A file is claimed by moving it to ``processing/`` (so several watchers
+    never take the same file), then moved to ``processed/`` next to a
+    ``.report.json`` with its ingest report. Files starting with ``.`` are
+    left alone, so senders can write under a hidden name and rename.
+    """
+
+    def __init__(self, directory, interval=HL7_POLL_INTERVAL, batch_size=INGEST_BATCH_SIZE):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        for name in ("processing", "processed"):
+            (self.directory / name).mkdir(parents=True, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="hl7-drop", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def poll(self):
+        """Ingest the files waiting in the directory; returns their reports by name"""
+        reports = {}
+        for path in sorted(self.directory.iterdir()):
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            claimed = self.directory / "processing" / path.name
+            try:
+                path.rename(claimed)
+            except FileNotFoundError:
+                # Another watcher took it
+                continue
+            report = ingest_hl7_files([claimed], self.batch_size)
+            done = self.directory / "processed" / path.name
+            shutil.move(claimed, done)
+            done.with_name(done.name + ".report.json").write_bytes(dumps(report))
+            reports[path.name] = report
+        return reports
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                for name, report in self.poll().items():
+                    print(
+                        f"HL7 {name}: {report['messages']} messages, "
+                        f"{report['records']} records, {report['error_count']} errors"
+                    )
+            except Exception as e:
+                print(f"❌ Error ingesting HL7 files: {e}")
+            self._stop.wait(self.interval)
+
+
+class Hl7Listener:
+    """The MLLP listener and drop directory watcher, each only if configured.
+
+    Only one process runs them: with several uvicorn workers, the first to
+    take the ``hl7`` lock file binds the port, and the others wait on
+    standby and take over if it exits.
+    """
+
+    def __init__(self, port=HL7_MLLP_PORT, host=HL7_MLLP_HOST, drop_dir=HL7_DROP_DIR):
+        self.port = port
+        self.host = host
+        self.drop_dir = drop_dir
+        self.batcher = Hl7Batcher()
+        self.server = None
+        self.watcher = None
+        self._thread = None
+        self._lock_fd = None
+        self._standby = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        if not self.port and not self.drop_dir:
+            return
+        self._stop.clear()
+        if not self._take_over():
+            self._standby = threading.Thread(
+                target=self._wait_for_lock, name="hl7-standby", daemon=True
+            )
+            self._standby.start()
+
+    def _take_over(self):
+        """Start the services if no other process runs them; True if this one does now"""
+        with self._start_lock:
+            if self._stop.is_set():
+                return True
+            self._lock_fd = try_file_lock(database.lock_path("hl7"))
+            if self._lock_fd is None:
+                return False
+            self._start_services()
+            return True
+
+    def _wait_for_lock(self):
+        while not self._stop.wait(HL7_STANDBY_INTERVAL):
+            if self._take_over():
+                return
+
+    def _start_services(self):
+        if self.port:
+            self.batcher.start()
+            self.server = _MllpServer((self.host, self.port), _MllpHandler)
+            self.server.batcher = self.batcher
+            self._thread = threading.Thread(
+                target=self.server.serve_forever, name="hl7-mllp", daemon=True
+            )
+            self._thread.start()
+        if self.drop_dir:
+            self.watcher = DropDirectoryWatcher(self.drop_dir)
+            self.watcher.start()
+
+    def stop(self):
+        with self._start_lock:
+            self._stop.set()
+        if self._standby is not None:
+            self._standby.join()
+            self._standby = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self._thread.join()
+            self.server = None
+        self.batcher.stop()
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        if self._lock_fd is not None:
+            release_file_lock(self._lock_fd)
+            self._lock_fd = None
+
+
+hl7_listener = Hl7Listener()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest HL7 v2 ORU^R01 lab messages")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", help="ingest files of HL7 messages and exit")
+    load.add_argument("paths", nargs="+")
+    load.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    serve = commands.add_parser("serve", help="run the MLLP listener and/or drop directory")
+    serve.add_argument("--port", type=int, default=HL7_MLLP_PORT or 2575)
+    serve.add_argument("--host", default=HL7_MLLP_HOST)
+    serve.add_argument("--drop-dir", default=HL7_DROP_DIR)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    if args.command == "load":
+        report = ingest_hl7_files(args.paths, args.batch_size)
+        print(
+            f"Ingested {report['messages']} messages ({report['records']} records) in "
+            f"{report['seconds']:.1f} s ({report['messages'] / max(report['seconds'], 1e-9):.0f}"
+            f" messages/s), {report['error_count']} errors"
+        )
+        for table, count in report["rows"].items():
+            print(f"  {table}: {count} rows")
+        for error in report["errors"]:
+            print(f"  {error['position']} {error['resource'] or ''}: {error['error']}")
+    else:
+        listener = Hl7Listener(args.port, args.host, args.drop_dir)
+        listener.start()
+        print(f"Listening for MLLP on {args.host}:{args.port}", end="")
+        print(f", watching {args.drop_dir}" if args.drop_dir else "")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            listener.stop()
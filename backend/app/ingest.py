@@ -0,0 +1,673 @@
+import argparse
+import json
+import os
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from app import database, fhir, models, schemas
+from app.changes import CREATE, record_changes
+from app.events import event_broker
+from app.loader import IN_CHUNK_SIZE
+from app.models import BodyMeasurement, Composition, LabAnalyteResult, LabTest, Patient, Specimen
+from app.responses import schema_columns
+from app.summary import refresh_patient_summaries
+from app.writer import write_queue
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+# Records (patients, reports, measurements) written per transaction
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+
+# Characters read from a Bundle file at a time
+READ_CHUNK_SIZE = 1 << 16
+
+# Per-record errors listed in an ingest report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+# Streamed entities and the columns of their events, as the CRUD routes publish them
+EVENT_COLUMNS = {
+    LabAnalyteResult: schema_columns(LabAnalyteResult, schemas.LabAnalyteResult),
+    BodyMeasurement: schema_columns(BodyMeasurement, schemas.BodyMeasurement),
+}
+
+# FHIR administrative gender -> Patient.sex; the API only accepts male and female
+SEX = {"male": "male", "female": "female"}
+
+_WHITESPACE = re.compile(r"\s*")
+_DECODER = json.JSONDecoder()
+
+
+class _JsonStream:
+    """Reads JSON values one at a time from a text stream, holding only the unread part"""
+
+    def __init__(self, handle, chunk_size):
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.text = ""
+        self.pos = 0
+
+    def _fill(self):
+        chunk = self.handle.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.text = self.text[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """The next non-whitespace character, left unconsumed"""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of file")
+
+    def skip(self):
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                # Most likely cut off at the end of the buffer
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.text) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def read_bundle(handle, chunk_size=READ_CHUNK_SIZE):
+    """Yield the entries of a FHIR Bundle one at a time, never holding the whole document.
+
+    Top-level members other than ``entry`` are parsed and dropped as they are
+    passed, so memory follows the largest single entry.
+    """
+    stream = _JsonStream(handle, chunk_size)
+    if stream.peek() != "{":
+        raise ValueError("Expected a FHIR Bundle object")
+    stream.skip()
+    while stream.peek() != "}":
+        if stream.peek() == ",":
+            stream.skip()
+            continue
+        key = stream.value()
+        if stream.peek() != ":":
+            raise ValueError("Malformed Bundle")
+        stream.skip()
+        if key == "entry" and stream.peek() == "[":
+            stream.skip()
+            while stream.peek() != "]":
+                if stream.peek() == ",":
+                    stream.skip()
+                    continue
+                yield stream.value()
+            stream.skip()
+        elif key == "resourceType":
+            resource_type = stream.value()
+            if resource_type != "Bundle":
+                raise ValueError(f"Expected a FHIR Bundle, got {resource_type}")
+        else:
+            stream.value()
+
+
+def _flatten(position, full_url, resource):
+    """Yield the resources of a resource that may itself be a Bundle"""
+    if not isinstance(resource, dict):
+        resource = {}
+    if resource.get("resourceType") == "Bundle":
+        for number, entry in enumerate(resource.get("entry", []), 1):
+            yield from _flatten(
+                f"{position} entry {number}", entry.get("fullUrl"), entry.get("resource") or {}
+            )
+    else:
+        yield position, full_url, resource
+
+
+def read_resources(path, on_error):
+    """Yield ``(position, full_url, resource)`` from a FHIR file, one resource at a time.
+
+    ``.ndjson`` / ``.jsonl`` files hold one resource (or Bundle) per line; any
+    other file is read as a single Bundle. Lines that are not valid JSON are
+    reported through ``on_error(position, resource, message)`` and skipped.
+    """
+    path = Path(path)
+    with path.open(encoding="utf-8") as handle:
+        if path.suffix.lower() in (".ndjson", ".jsonl"):
+            for number, line in enumerate(handle, 1):
+                if not line.strip():
+                    continue
+                try:
+                    resource = json.loads(line)
+                except ValueError as exc:
+                    on_error(f"line {number}", None, f"Invalid JSON: {exc}")
+                    continue
+                yield from _flatten(f"line {number}", None, resource)
+        else:
+            for number, entry in enumerate(read_bundle(handle), 1):
+                yield from _flatten(
+                    f"entry {number}", entry.get("fullUrl"), entry.get("resource") or {}
+                )
+
+
+# =========================
+# FHIR -> ROW MAPPING
+# =========================
+
+
+def _effective_time(resource):
+    period = resource.get("effectivePeriod") or {}
+    text = resource.get("effectiveDateTime") or period.get("start") or resource.get("issued")
+    if not text:
+        raise ValueError(f"{resource['resourceType']} has no effective time")
+    return fhir.parse_instant(text)
+
+
+def _quantity(value):
+    quantity = value.get("valueQuantity")
+    if not quantity or quantity.get("value") is None:
+        raise ValueError("Observation has no valueQuantity")
+    unit = quantity.get("unit") or quantity.get("code")
+    if not unit:
+        raise ValueError("Observation valueQuantity has no unit")
+    return float(quantity["value"]), unit
+
+
+def patient_row(resource):
+    identifiers = [identifier.get("value") for identifier in resource.get("identifier", [])]
+    identifier = next((value for value in identifiers if value), None)
+    if identifier is None:
+        raise ValueError("Patient has no identifier")
+    name = (resource.get("name") or [{}])[0]
+    if not name.get("family") or not resource.get("gender"):
+        raise ValueError("Patient needs a family name and a gender")
+    sex = SEX.get(resource["gender"])
+    if sex is None:
+        raise ValueError(f"Patient gender {resource['gender']!r} is not supported (male or female)")
+    return {
+        "first_name": " ".join(name.get("given", [])),
+        "last_name": name["family"],
+        "sex": sex,
+        "identifier": identifier,
+    }
+
+
+def specimen_row(resource):
+    collection = resource.get("collection") or {}
+    collected = collection.get("collectedDateTime") or (
+        collection.get("collectedPeriod") or {}
+    ).get("start")
+    specimen_type = fhir.concept_text(resource.get("type"))
+    if not specimen_type or not collected:
+        raise ValueError("Specimen needs a type and a collection time")
+    notes = [note.get("text") for note in resource.get("note", []) if note.get("text")]
+    return {
+        "specimen_type": specimen_type,
+        "collection_time": fhir.parse_instant(collected),
+        "snomed_code": fhir.coding_code(resource.get("type"), fhir.SNOMED),
+        "description": notes[0] if notes else None,
+    }
+
+
+def analyte_row(resource):
+    loinc_code = fhir.coding_code(resource.get("code"), fhir.LOINC)
+    if loinc_code is None:
+        raise ValueError("Observation has no LOINC code")
+    value, unit = _quantity(resource)
+    reference_range = (resource.get("referenceRange") or [{}])[0]
+    interpretation = (resource.get("interpretation") or [None])[0]
+    return {
+        "loinc_code": loinc_code,
+        "value": value,
+        "unit": unit,
+        "reference_low": (reference_range.get("low") or {}).get("value"),
+        "reference_high": (reference_range.get("high") or {}).get("value"),
+        "interpretation": fhir.coding_code(interpretation, fhir.INTERPRETATION)
+        or ((interpretation or {}).get("coding") or [{}])[0].get("code"),
+    }
+
+
+def measurement_rows(resource):
+    """Body measurement rows of a vital-signs Observation, one per component if it has them"""
+    record_time = _effective_time(resource)
+    rows = []
+    for part in resource.get("component") or [resource]:
+        snomed_code = fhir.coding_code(part.get("code"), fhir.SNOMED) or fhir.VITAL_SIGN_SNOMED.get(
+            fhir.coding_code(part.get("code"), fhir.LOINC)
+        )
+        if snomed_code is None:
+            raise ValueError("Vital sign has no SNOMED CT code or known LOINC code")
+        value, unit = _quantity(part)
+        rows.append(
+            {
+                "record_time": record_time,
+                "value": value,
+                "unit": unit,
+                "snomed_code": snomed_code,
+            }
+        )
+    return rows
+
+
+# =========================
+# INGEST
+# =========================
+
+
+class BatchIngest:
+    """Writes mapped records (patients, lab reports, body measurements) in batches.
+
+    Finished records are written ``batch_size`` at a time, each batch in one
+    transaction through the write queue. Patients are resolved by identifier
+    with one query per batch for identifiers not yet cached; patient records
+    with an unknown identifier are created, known ones are left as they are.
+    A record that cannot be written is reported with its position in the
+    input and skipped. Analyte results and body measurements are published
+    to :data:`app.events.event_broker` once their batch has committed.
+    Subclasses map their input format onto records.
+    """
+
+    def __init__(self, batch_size=INGEST_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.patient_ids = {}
+        self.batch = []
+        self.records = 0
+        self.skipped = 0
+        self.rows = {}
+        self.errors = []
+        self.error_count = 0
+        self.started = time.perf_counter()
+
+    def error(self, position, resource, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"position": position, "resource": resource, "error": message})
+
+    def _record_error(self, record, message):
+        self.error(record["position"], record.get("name"), message)
+
+    def queue(self, record):
+        """Add a finished record, with its patient ``identifier``, to the next batch"""
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the finished records in one transaction"""
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        try:
+            patient_ids, specimen_ids, rows, failed, events = write_queue.run(
+                lambda db: self._write(db, batch)
+            )
+        except Exception as exc:
+            self._batch_failed(batch, exc)
+            return
+        # Only cache IDs once their transaction has committed
+        self.patient_ids.update(patient_ids)
+        for specimen, specimen_id in specimen_ids:
+            # Later reports only need its ID and collection time
+            specimen["id"], specimen["row"] = specimen_id, None
+        for table, count in rows.items():
+            self.rows[table] = self.rows.get(table, 0) + count
+        for record, message in failed:
+            self._record_error(record, message)
+        self.records += len(batch) - len(failed)
+        for event in events:
+            event_broker.publish(event)
+
+    def _batch_failed(self, batch, exc):
+        """Report the records of a batch whose transaction failed: none of them was stored"""
+        for record in batch:
+            self._record_error(record, f"Batch not written: {exc}")
+
+    def _write(self, db: Session, batch):
+        patient_ids = self._lookup_patients(db, {record["identifier"] for record in batch})
+        rows = {}
+        events = []
+        now = datetime.utcnow()
+
+        def insert_rows(model, values, patients=None):
+            """Insert ``values``; with ``patients`` (one per row), also queue their events"""
+            if not values:
+                return []
+            # The write queue holds the write lock, so IDs after the current maximum are
+            # free; assigning them here keeps this one executemany (as in SeedLoader)
+            first = (db.execute(select(func.max(model.id))).scalar() or 0) + 1
+            ids = list(range(first, first + len(values)))
+            values = [
+                {**row, "id": id, "version": 1, "updated_at": now} for row, id in zip(values, ids)
+            ]
+            db.execute(insert(model.__table__), values)
+            seqs = record_changes(db, model.__tablename__, ids, CREATE)
+            rows[model.__tablename__] = rows.get(model.__tablename__, 0) + len(ids)
+            if patients is not None:
+                columns = EVENT_COLUMNS[model]
+                events.extend(
+                    {
+                        "seq": seq,
+                        "entity": model.__tablename__,
+                        "operation": CREATE,
+                        "patient_id": patient_id,
+                        "data": {column.name: row.get(column.key) for column in columns},
+                    }
+                    for row, seq, patient_id in zip(values, seqs, patients)
+                )
+            return ids
+
+        new_patients = {}
+        for record in batch:
+            if record["kind"] == "patient" and record["identifier"] not in patient_ids:
+                new_patients.setdefault(record["identifier"], record["row"])
+        patient_ids.update(zip(new_patients, insert_rows(Patient, list(new_patients.values()))))
+
+        failed, reports, measurements = [], [], []
+        for record in batch:
+            if record["kind"] == "patient":
+                continue
+            if record["identifier"] not in patient_ids:
+                failed.append((record, f"Unknown patient identifier {record['identifier']}"))
+            elif record["kind"] == "report":
+                reports.append(record)
+            else:
+                measurements.append(record)
+
+        new_specimens = {}
+        for record in reports:
+            if record["specimen"]["id"] is None:
+                new_specimens.setdefault(id(record["specimen"]), record["specimen"])
+        specimen_ids = list(
+            zip(
+                new_specimens.values(),
+                insert_rows(Specimen, [specimen["row"] for specimen in new_specimens.values()]),
+            )
+        )
+        written_specimens = {id(specimen): specimen_id for specimen, specimen_id in specimen_ids}
+
+        composition_ids = insert_rows(
+            Composition,
+            [
+                {
+                    "patient_id": patient_ids[record["identifier"]],
+                    "start_time": record["start_time"],
+                }
+                for record in reports
+            ],
+        )
+        lab_test_ids = insert_rows(
+            LabTest,
+            [
+                {
+                    **record["lab_test"],
+                    "composition_id": composition_id,
+                    "specimen_id": record["specimen"]["id"]
+                    or written_specimens[id(record["specimen"])],
+                }
+                for record, composition_id in zip(reports, composition_ids)
+            ],
+        )
+        insert_rows(
+            LabAnalyteResult,
+            [
+                {
+                    **analyte,
+                    "lab_test_id": lab_test_id,
+                    "collection_time": record["specimen"]["collection_time"],
+                }
+                for record, lab_test_id in zip(reports, lab_test_ids)
+                for analyte in record["analytes"]
+            ],
+            [patient_ids[record["identifier"]] for record in reports for _ in record["analytes"]],
+        )
+        measurement_values = [
+            {**row, "patient_id": patient_ids[record["identifier"]]}
+            for record in measurements
+            for row in record["rows"]
+        ]
+        insert_rows(
+            BodyMeasurement, measurement_values, [row["patient_id"] for row in measurement_values]
+        )
+
+        touched = {patient_ids[record["identifier"]] for record in reports + measurements}
+        touched.update(patient_ids[identifier] for identifier in new_patients)
+        if touched:
+            refresh_patient_summaries(db, touched)
+        return patient_ids, specimen_ids, rows, failed, events
+
+    def _lookup_patients(self, db: Session, identifiers):
+        """Patient IDs by identifier, from the cache or one query per chunk of new ones"""
+        found = {
+            identifier: self.patient_ids[identifier]
+            for identifier in identifiers
+            if identifier in self.patient_ids
+        }
+        unknown = [identifier for identifier in identifiers if identifier not in found]
+        for start in range(0, len(unknown), IN_CHUNK_SIZE):
+            result = db.execute(
+                select(Patient.identifier, Patient.id)
+                .where(Patient.identifier.in_(unknown[start : start + IN_CHUNK_SIZE]))
+                .order_by(Patient.id)
+            )
+            for identifier, patient_id in result:
+                found.setdefault(identifier, patient_id)
+        return found
+
+    def report(self):
+        seconds = time.perf_counter() - self.started
+        return {
+            "records": self.records,
+            "skipped": self.skipped,
+            "rows": self.rows,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "records_per_second": round(self.records / seconds, 1) if seconds else 0.0,
+        }
+
+
+class FhirIngest(BatchIngest):
+    """Maps a stream of FHIR resources onto patients, lab reports and body measurements.
+
+    Resources may arrive in any order: a DiagnosticReport waits until the
+    Observations, Specimen and Patient it references have been read, then
+    becomes one composition with one lab test and an analyte result per
+    Observation. Vital-signs Observations become body measurements and
+    Patient resources become patients. Only resources still waiting on a
+    reference are held in memory; finished records are written in batches
+    (see :class:`BatchIngest`).
+    """
+
+    def __init__(self, batch_size=INGEST_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.patient_refs = {}
+        self.specimens = {}
+        self.observations = {}
+        self.waiting = {}
+
+    def add(self, position, full_url, resource):
+        kind = resource.get("resourceType")
+        keys = fhir.resource_keys(resource, full_url) if kind else []
+        name = f"{kind}/{resource['id']}" if kind and resource.get("id") else None
+        record = {"position": position, "resource": resource, "name": name}
+        try:
+            if kind == "Patient":
+                record["kind"], record["row"] = "patient", patient_row(resource)
+                for key in keys:
+                    self.patient_refs[key] = record["row"]["identifier"]
+                self._ready(record)
+            elif kind == "Specimen":
+                row = specimen_row(resource)
+                specimen = {"row": row, "id": None, "collection_time": row["collection_time"]}
+                for key in keys:
+                    self.specimens[key] = specimen
+            elif kind == "Observation" and fhir.has_category(resource, "vital-signs"):
+                record["kind"], record["rows"] = "measurement", measurement_rows(resource)
+                self._wait(record)
+            elif kind == "Observation":
+                observation = {**record, "keys": keys}
+                for key in keys:
+                    self.observations[key] = observation
+            elif kind == "DiagnosticReport":
+                record["kind"] = "report"
+                self._wait(record)
+            else:
+                self.skipped += 1
+        except (ValueError, TypeError, KeyError) as exc:
+            self._record_error(record, str(exc))
+            return
+        for key in keys:
+            for waiting in self.waiting.pop(key, []):
+                waiting["missing"].discard(key)
+                if not waiting["missing"]:
+                    self._wait(waiting)
+
+    def _subject_key(self, resource):
+        subject = resource.get("subject") or {}
+        if (subject.get("identifier") or {}).get("value"):
+            return None
+        reference = fhir.reference_key(subject)
+        if reference is None:
+            raise ValueError(f"{resource['resourceType']} has no subject")
+        return reference
+
+    def _missing(self, record):
+        """References of ``record`` not read yet"""
+        resource = record["resource"]
+        subject = self._subject_key(resource)
+        missing = [subject] if subject is not None and subject not in self.patient_refs else []
+        if record["kind"] == "report":
+            results = [fhir.reference_key(result) for result in resource.get("result", [])]
+            if not results:
+                raise ValueError("DiagnosticReport has no results")
+            missing += [key for key in results if key not in self.observations]
+            if not missing:
+                missing += [key for key in self._specimen_keys(record) if key not in self.specimens]
+        return missing
+
+    def _specimen_keys(self, record):
+        resource = record["resource"]
+        references = resource.get("specimen") or [
+            observation["resource"]["specimen"]
+            for observation in self._results(record)
+            if observation["resource"].get("specimen")
+        ]
+        if not references:
+            raise ValueError("DiagnosticReport has no specimen")
+        return [fhir.reference_key(references[0])]
+
+    def _results(self, record):
+        return [
+            self.observations[fhir.reference_key(result)]
+            for result in record["resource"].get("result", [])
+        ]
+
+    def _wait(self, record):
+        """Queue ``record`` for writing, or park it until its references have been read"""
+        try:
+            missing = self._missing(record)
+        except ValueError as exc:
+            self._record_error(record, str(exc))
+            return
+        if missing:
+            record["missing"] = set(missing)
+            for key in missing:
+                self.waiting.setdefault(key, []).append(record)
+            return
+        if record["kind"] == "report":
+            try:
+                self._complete_report(record)
+            except (ValueError, TypeError, KeyError) as exc:
+                self._record_error(record, str(exc))
+                return
+        self._ready(record)
+
+    def _complete_report(self, record):
+        """Map a report whose references are all read, claiming its Observations"""
+        resource = record["resource"]
+        observations = self._results(record)
+        try:
+            record["specimen"] = self.specimens[self._specimen_keys(record)[0]]
+            record["start_time"] = _effective_time(resource)
+            record["lab_test"] = {
+                "loinc_code": fhir.coding_code(resource.get("code"), fhir.LOINC),
+                "description": fhir.concept_text(resource.get("code")),
+            }
+            record["analytes"] = [
+                analyte_row(observation["resource"]) for observation in observations
+            ]
+        finally:
+            # Claimed even if the report fails, so they are not reported twice
+            for observation in observations:
+                for key in observation["keys"]:
+                    self.observations.pop(key, None)
+
+    def _ready(self, record):
+        if record["kind"] == "patient":
+            record["identifier"] = record["row"]["identifier"]
+        else:
+            subject = record["resource"]["subject"]
+            identifier = (subject.get("identifier") or {}).get("value")
+            record["identifier"] = identifier or self.patient_refs[fhir.reference_key(subject)]
+        self.queue(record)
+
+    def finish(self):
+        """Write what is left and report the records that never resolved"""
+        self.flush()
+        unresolved = {}
+        for key, records in self.waiting.items():
+            for record in records:
+                unresolved.setdefault(id(record), (record, []))[1].append(key)
+        for record, keys in unresolved.values():
+            self._record_error(record, f"References not found in the input: {', '.join(keys)}")
+        claimed = set()
+        for observation in self.observations.values():
+            if id(observation) not in claimed:
+                claimed.add(id(observation))
+                self._record_error(
+                    observation, "Observation is not a result of any DiagnosticReport"
+                )
+        self.waiting, self.observations = {}, {}
+        return self.report()
+
+
+def ingest_files(paths, batch_size=INGEST_BATCH_SIZE):
+    """Stream FHIR files into the database; returns the ingest report (see :class:`FhirIngest`)"""
+    ingest = FhirIngest(batch_size)
+    for path in paths:
+        name = Path(path).name if len(paths) > 1 else "input"
+        try:
+            for position, full_url, resource in read_resources(path, ingest.error):
+                if len(paths) > 1:
+                    position = f"{name} {position}"
+                ingest.add(position, full_url, resource)
+        except ValueError as exc:
+            # Malformed Bundle: keep what was read before the error
+            ingest.error(name, None, f"Unreadable input, rest skipped: {exc}")
+    return ingest.finish()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest FHIR Bundles or NDJSON files")
+    parser.add_argument("paths", nargs="+", help="FHIR Bundle (.json) or NDJSON files")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    report = ingest_files(args.paths, args.batch_size)
+    print(
+        f"Ingested {report['records']} records in {report['seconds']:.1f} s "
+        f"({report['records_per_second']:.0f} records/s), {report['error_count']} errors"
+    )
+    for table, count in report["rows"].items():
+        print(f"  {table}: {count} rows")
+    for error in report["errors"]:
+        print(f"  {error['position']} {error['resource'] or ''}: {error['error']}")
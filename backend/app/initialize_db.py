@@ -1,33 +1,122 @@
+from datetime import datetime
+
 from app import database, models
+from app.filelock import file_lock
+from app.history import index_archive_files
+from app.loader import ENTITIES
 from app.populate_db import populate_database
+from app.summary import refresh_patient_summaries
+from app.worklist import refresh_collection_times
+from sqlalchemy import inspect, select, update
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 
+# Bump whenever models.py changes in a way create_all has to apply
+SCHEMA_VERSION = 10
+
+
+def get_schema_version():
+    """Return the schema version recorded in the database, or None if it was never initialized"""
+    try:
+        # The read pool never takes the write lock, so a warm start doesn't wait on writers
+        with database.read_engine.connect() as connection:
+            return connection.execute(
+                select(models.SchemaVersion.version).where(models.SchemaVersion.id == 1)
+            ).scalar()
+    except OperationalError:
+        # The database file or the marker table does not exist yet
+        return None
+
+
+def add_missing_columns():
+    """Add columns added to models after their table already existed (create_all skips those)"""
+    with database.engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in models.Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    connection.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+
+
+def create_missing_indexes():
+    """Create indexes added to models after their table already existed (create_all skips those)"""
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=database.engine, checkfirst=True)
+
+
+def fill_missing_updated_at(session):
+    """Stamp rows written before updated_at existed, so updated_since syncs see them once"""
+    now = datetime.utcnow()
+    for model, _ in ENTITIES.values():
+        session.execute(update(model).where(model.updated_at.is_(None)).values(updated_at=now))
+
 
 def initialize_database():
-    """Check if database is empty and populate it if needed"""
-    # Create tables first
-    models.Base.metadata.create_all(bind=database.engine)
+    """Create tables and populate an empty database, once across all worker processes"""
+    # Warm start: the marker is current, so there is nothing to create or seed
+    if get_schema_version() == SCHEMA_VERSION:
+        return
 
-    # Create a database session
-    session = Session(database.engine)
+    with file_lock(database.lock_path("init")):
+        # Another worker may have finished initializing while we waited for the lock
+        if get_schema_version() == SCHEMA_VERSION:
+            return
 
-    try:
-        # Check if patients table is empty (as a proxy for checking if DB is empty)
-        patient_count = session.query(models.Patient).count()
-
-        if patient_count == 0:
-            print("Database is empty. Populating with initial data...")
-            # Close this session and let populate_database create its own session
-            session.close()
-            populate_database()
-        else:
-            print(f"Database already has {patient_count} patients. Skipping initialization.")
-
-    except Exception as e:
-        print(f"❌ Error checking database: {e}")
-    finally:
-        if session.is_active:
-            session.close()
+        # Create tables first
+        models.Base.metadata.create_all(bind=database.engine)
+        add_missing_columns()
+        create_missing_indexes()
+
+        # Create a database session
+        session = Session(database.engine)
+
+        try:
+            # Check if patients table is empty (as a proxy for checking if DB is empty)
+            patient_count = session.query(models.Patient).count()
+
+            if patient_count == 0:
+                print("Database is empty. Populating with initial data...")
+                # Close this session and let populate_database create its own session
+                session.close()
+                if not populate_database():
+                    # Leave the marker unset so the next start retries seeding
+                    return
+            else:
+                print(f"Database already has {patient_count} patients. Skipping initialization.")
+                # Fill denormalized columns added since the database was created
+                refresh_collection_times(session, missing_only=True)
+                fill_missing_updated_at(session)
+                # Archives written before history_archive_index existed
+                index_archive_files(session)
+                session.commit()
+                # Databases created before patient_summary existed need it built once
+                if session.query(models.PatientSummary).count() == 0:
+                    refresh_patient_summaries(session)
+                # Ends the transaction either way; it holds the write lock set_schema_version needs
+                session.commit()
+
+            set_schema_version(SCHEMA_VERSION)
+
+        except Exception as e:
+            print(f"❌ Error checking database: {e}")
+        finally:
+            if session.is_active:
+                session.close()
+
+
+def set_schema_version(version):
+    """Record ``version`` in the schema marker table"""
+    with Session(database.engine) as session:
+        marker = session.get(models.SchemaVersion, 1) or models.SchemaVersion(id=1)
+        marker.version = version
+        marker.applied_at = datetime.utcnow()
+        session.add(marker)
+        session.commit()
 
 
 if __name__ == "__main__":
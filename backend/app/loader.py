@@ -0,0 +1,139 @@
+from collections import namedtuple
+
+from app import models, schemas
+from app.responses import rows_as_dicts, schema_columns
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+# Keys per IN query; stays well below SQLite's bound-parameter limit
+IN_CHUNK_SIZE = 5000
+
+# Entity (table name) -> model and the schema whose columns it is served with
+ENTITIES = {
+    "patient": (models.Patient, schemas.Patient),
+    "composition": (models.Composition, schemas.Composition),
+    "specimen": (models.Specimen, schemas.Specimen),
+    "lab_test": (models.LabTest, schemas.LabTest),
+    "lab_analyte_result": (models.LabAnalyteResult, schemas.LabAnalyteResult),
+    "body_measurement": (models.BodyMeasurement, schemas.BodyMeasurement),
+    "reference_range": (models.ReferenceRange, schemas.ReferenceRange),
+}
+
+# Rows of ``target`` whose ``remote`` column equals this row's ``local`` column;
+# ``many`` relations attach a list, the others a single row (or None)
+Relation = namedtuple("Relation", "target local remote many")
+
+# Entity -> include name -> relation
+RELATIONS = {
+    "patient": {
+        "compositions": Relation("composition", "id", "patient_id", True),
+        "body_measurements": Relation("body_measurement", "id", "patient_id", True),
+    },
+    "composition": {
+        "patient": Relation("patient", "patient_id", "id", False),
+        "lab_tests": Relation("lab_test", "id", "composition_id", True),
+    },
+    "specimen": {
+        "lab_tests": Relation("lab_test", "id", "specimen_id", True),
+    },
+    "lab_test": {
+        "composition": Relation("composition", "composition_id", "id", False),
+        "specimen": Relation("specimen", "specimen_id", "id", False),
+        "analytes": Relation("lab_analyte_result", "id", "lab_test_id", True),
+    },
+    "lab_analyte_result": {
+        "lab_test": Relation("lab_test", "lab_test_id", "id", False),
+        "reference_range": Relation("reference_range", "loinc_code", "loinc_code", False),
+    },
+    "body_measurement": {
+        "patient": Relation("patient", "patient_id", "id", False),
+    },
+    "reference_range": {},
+}
+
+
+def parse_include(entity, include):
+    """Turn ``a.b,a.c,d`` into the tree ``{"a": {"b": {}, "c": {}}, "d": {}}``.
+
+    Raises ValueError naming the first path that is not a relation.
+    """
+    tree = {}
+    for path in include.split(","):
+        path = path.strip()
+        if not path:
+            continue
+        node, current = tree, entity
+        for name in path.split("."):
+            relation = RELATIONS[current].get(name)
+            if relation is None:
+                raise ValueError(f"Unknown include: {path}")
+            node = node.setdefault(name, {})
+            current = relation.target
+    return tree
+
+
+def required_columns(entity, tree):
+    """Columns of ``entity`` the top level of ``tree`` joins on"""
+    return {RELATIONS[entity][name].local for name in tree}
+
+
+class BatchLoader:
+    """Loads rows of one entity by one of its columns, batching and caching keys.
+
+    Every key asked for in one :meth:`load_many` call is fetched with a
+    single ``IN`` query (chunked at :data:`IN_CHUNK_SIZE`), and keys already
+    loaded by an earlier call are served from the cache.
+    """
+
+    def __init__(self, db: Session, entity, key):
+        model, schema = ENTITIES[entity]
+        self.db = db
+        self.columns = schema_columns(model, schema)
+        self.key = model.__table__.c[key]
+        (self.primary_key,) = model.__table__.primary_key.columns
+        self.cache = {}
+
+    def load_many(self, keys):
+        pending = [key for key in dict.fromkeys(keys) if key is not None and key not in self.cache]
+        for start in range(0, len(pending), IN_CHUNK_SIZE):
+            chunk = pending[start : start + IN_CHUNK_SIZE]
+            for key in chunk:
+                self.cache[key] = []
+            query = select(*self.columns).where(self.key.in_(chunk)).order_by(self.primary_key)
+            for row in rows_as_dicts(self.db.execute(query)):
+                self.cache[row[self.key.name]].append(row)
+        return {key: self.cache.get(key, []) for key in keys}
+
+    def clear(self):
+        """Forget the loaded rows, e.g. between the batches of a streamed response"""
+        self.cache.clear()
+
+
+def include_related(db: Session, entity, rows, tree, loaders=None):
+    """Attach the relations in ``tree`` to ``rows`` (dicts of ``entity``), in place.
+
+    One batched query per relation in the tree, so the query count follows
+    the include depth and breadth, not the number of rows.
+    """
+    loaders = {} if loaders is None else loaders
+    for name, children in tree.items():
+        relation = RELATIONS[entity][name]
+        loader = loaders.get((relation.target, relation.remote))
+        if loader is None:
+            loader = loaders[(relation.target, relation.remote)] = BatchLoader(
+                db, relation.target, relation.remote
+            )
+        found = loader.load_many([row[relation.local] for row in rows])
+
+        related = []
+        for row in rows:
+            # Copies, so a row reached along two paths can take different children
+            matches = [dict(match) for match in found.get(row[relation.local], [])]
+            related.extend(matches)
+            if relation.many:
+                row[name] = matches
+            else:
+                row[name] = matches[0] if matches else None
+        if children:
+            include_related(db, relation.target, related, children, loaders)
+    return rows
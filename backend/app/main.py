@@ -1,17 +1,48 @@
+from contextlib import asynccontextmanager
+
+from app.export import export_pool
+from app.hl7 import hl7_listener
 from app.initialize_db import initialize_database
+from app.retention import compaction_scheduler
 from app.routers import (
     body_measurement,
+    changes,
     composition,
+    events,
+    export,
+    history,
+    ingest,
     lab_analyte,
     lab_test,
+    metrics,
     patient,
     reference_range,
     specimen,
 )
+from app.writer import write_queue
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="EHR API", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Initialize database (create tables and populate if empty) before serving requests
+    initialize_database()
+    write_queue.start()
+    compaction_scheduler.start()
+    # Worker processes for FHIR exports, shared by all requests
+    export_pool.start()
+    # MLLP listener / drop directory, only if HL7_MLLP_PORT / HL7_DROP_DIR are set
+    hl7_listener.start()
+    yield
+    hl7_listener.stop()
+    export_pool.stop()
+    compaction_scheduler.stop()
+    # Let queued writes finish before the worker exits
+    write_queue.stop()
+
+
+app = FastAPI(title="EHR API", version="1.0.0", lifespan=lifespan)
 
 # Setup CORS
 app.add_middleware(
@@ -22,10 +53,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-
-# Initialize database (create tables and populate if empty)
-initialize_database()
-
 # Include routers
 app.include_router(patient.router)
 app.include_router(composition.router)
@@ -34,3 +61,9 @@ app.include_router(lab_test.router)
 app.include_router(lab_analyte.router)
 app.include_router(body_measurement.router)
 app.include_router(reference_range.router)
+app.include_router(history.router)
+app.include_router(changes.router)
+app.include_router(ingest.router)
+app.include_router(export.router)
+app.include_router(events.router)
+app.include_router(metrics.router)
@@ -0,0 +1,79 @@
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from app import database
+from fastapi import Response
+from sqlalchemy import event
+
+# SQL statements run by the current instrumented call (None outside of one)
+_statements = ContextVar("statements", default=None)
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count_statement(connection, cursor, statement, parameters, context, executemany):
+    counter = _statements.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+for _engine in (database.engine, database.read_engine):
+    event.listen(_engine, "before_cursor_execute", _count_statement)
+
+
+def record(name, duration_ms, statements):
+    with _stats_lock:
+        stats = _stats.setdefault(
+            name, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "statements": 0}
+        )
+        stats["calls"] += 1
+        stats["total_ms"] += duration_ms
+        stats["max_ms"] = max(stats["max_ms"], duration_ms)
+        stats["statements"] += statements
+
+
+def snapshot():
+    """Per-endpoint call counts, latency and SQL statements since the process started"""
+    with _stats_lock:
+        return {
+            name: {
+                **stats,
+                "mean_ms": stats["total_ms"] / stats["calls"],
+                "statements_per_call": stats["statements"] / stats["calls"],
+            }
+            for name, stats in sorted(_stats.items())
+        }
+
+
+def instrumented(name):
+    """Time a (sync) endpoint and count the SQL statements it runs on the request thread.
+
+    Results are kept per ``name`` for ``GET /metrics``; responses built by the
+    endpoint itself also get a ``Server-Timing`` header. Statements queued to
+    the writer thread run outside the request and are not counted.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = _statements.set([0])
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                duration_ms = (time.perf_counter() - start) * 1000
+                statements = _statements.get()[0]
+                _statements.reset(token)
+                record(name, duration_ms, statements)
+            if isinstance(result, Response):
+                result.headers["Server-Timing"] = (
+                    f'app;dur={duration_ms:.2f}, sql;desc="{statements} statements"'
+                )
+            return result
+
+        return wrapper
+
+    return decorator
@@ -1,10 +1,13 @@
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+# Lab result interpretation codes that mark a result as abnormal
+ABNORMAL_INTERPRETATIONS = ("H", "L")
+
 # =========================
 # MAIN TABLES (LATEST ONLY)
 # =========================
@@ -12,44 +15,69 @@ Base = declarative_base()
 
 class Patient(Base):
     __tablename__ = "patient"
+    __table_args__ = (Index("ix_patient_identifier", "identifier"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     first_name = Column(String(255), nullable=False)
     last_name = Column(String(255), nullable=False)
     sex = Column(String(255), nullable=False)
     identifier = Column(String(255), nullable=False)
     version = Column(Integer, default=1)
+    # Set on every create/update (all main tables); backs updated_since on the list endpoints
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 
 class Composition(Base):
     __tablename__ = "composition"
+    __table_args__ = (
+        Index("ix_composition_patient_id", "patient_id"),
+        Index("ix_composition_start_time", "start_time"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     patient_id = Column(Integer, ForeignKey("patient.id"), nullable=False)
     start_time = Column(DateTime, nullable=False)
     version = Column(Integer, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 
 class Specimen(Base):
     __tablename__ = "specimen"
+    __table_args__ = (
+        Index("ix_specimen_collection_time", "collection_time"),
+        Index("ix_specimen_snomed_code", "snomed_code"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     specimen_type = Column(String(255), nullable=False)
     collection_time = Column(DateTime, nullable=False)
     snomed_code = Column(String(20))
     description = Column(String(255))
     version = Column(Integer, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 
 class LabTest(Base):
     __tablename__ = "lab_test"
+    __table_args__ = (
+        Index("ix_lab_test_composition_id", "composition_id"),
+        Index("ix_lab_test_specimen_id", "specimen_id"),
+        Index("ix_lab_test_loinc_code", "loinc_code"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     composition_id = Column(Integer, ForeignKey("composition.id"), nullable=False)
     specimen_id = Column(Integer, ForeignKey("specimen.id"), nullable=False)
     loinc_code = Column(String(20))
     description = Column(String(255))
     version = Column(Integer, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 
 class LabAnalyteResult(Base):
     __tablename__ = "lab_analyte_result"
+    __table_args__ = (
+        Index("ix_lab_analyte_result_lab_test_id", "lab_test_id"),
+        Index("ix_lab_analyte_result_loinc_value", "loinc_code", "value"),
+        Index("ix_lab_analyte_result_collection_time", "collection_time"),
+        Index("ix_lab_analyte_result_value", "value"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     lab_test_id = Column(Integer, ForeignKey("lab_test.id"), nullable=False)
     loinc_code = Column(String(20), nullable=False)
@@ -58,11 +86,36 @@ class LabAnalyteResult(Base):
     reference_low = Column(Float)
     reference_high = Column(Float)
     interpretation = Column(String(20))
+    # Copy of the specimen's collection time, so time-ordered worklists need no join
+    collection_time = Column(DateTime)
     version = Column(Integer, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+
+# Partial indexes over abnormal results only: worklist queries never touch the
+# (far more numerous) normal results, however many there are
+Index(
+    "ix_lab_analyte_result_abnormal_time",
+    LabAnalyteResult.collection_time,
+    LabAnalyteResult.id,
+    sqlite_where=LabAnalyteResult.interpretation.in_(ABNORMAL_INTERPRETATIONS),
+)
+Index(
+    "ix_lab_analyte_result_abnormal_loinc_time",
+    LabAnalyteResult.loinc_code,
+    LabAnalyteResult.collection_time,
+    LabAnalyteResult.id,
+    sqlite_where=LabAnalyteResult.interpretation.in_(ABNORMAL_INTERPRETATIONS),
+)
 
 
 class BodyMeasurement(Base):
     __tablename__ = "body_measurement"
+    __table_args__ = (
+        Index("ix_body_measurement_patient_code_time", "patient_id", "snomed_code", "record_time"),
+        Index("ix_body_measurement_code_time", "snomed_code", "record_time"),
+        Index("ix_body_measurement_record_time", "record_time"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     patient_id = Column(Integer, ForeignKey("patient.id"), nullable=False)
     record_time = Column(DateTime, nullable=False)
@@ -70,6 +123,7 @@ class BodyMeasurement(Base):
     unit = Column(String(20), nullable=False)
     snomed_code = Column(String(20), nullable=False)
     version = Column(Integer, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 
 class ReferenceRange(Base):
@@ -79,6 +133,7 @@ class ReferenceRange(Base):
     high = Column(Float)
     unit = Column(String(20))
     version = Column(Integer, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 
 # =========================
@@ -88,6 +143,7 @@ class ReferenceRange(Base):
 
 class PatientHistory(Base):
     __tablename__ = "patient_history"
+    __table_args__ = (Index("ix_patient_history_owner_version", "patient_id", "version"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     patient_id = Column(Integer, ForeignKey("patient.id"), nullable=False)
     first_name = Column(String(255), nullable=False)
@@ -100,6 +156,7 @@ class PatientHistory(Base):
 
 class CompositionHistory(Base):
     __tablename__ = "composition_history"
+    __table_args__ = (Index("ix_composition_history_owner_version", "composition_id", "version"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     composition_id = Column(Integer, ForeignKey("composition.id"), nullable=False)
     patient_id = Column(Integer, ForeignKey("patient.id"), nullable=False)
@@ -110,6 +167,7 @@ class CompositionHistory(Base):
 
 class SpecimenHistory(Base):
     __tablename__ = "specimen_history"
+    __table_args__ = (Index("ix_specimen_history_owner_version", "specimen_id", "version"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     specimen_id = Column(Integer, ForeignKey("specimen.id"), nullable=False)
     specimen_type = Column(String(255), nullable=False)
@@ -122,6 +180,7 @@ class SpecimenHistory(Base):
 
 class LabTestHistory(Base):
     __tablename__ = "lab_test_history"
+    __table_args__ = (Index("ix_lab_test_history_owner_version", "lab_test_id", "version"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     lab_test_id = Column(Integer, ForeignKey("lab_test.id"), nullable=False)
     composition_id = Column(Integer, ForeignKey("composition.id"), nullable=False)
@@ -134,6 +193,9 @@ class LabTestHistory(Base):
 
 class LabAnalyteResultHistory(Base):
     __tablename__ = "lab_analyte_result_history"
+    __table_args__ = (
+        Index("ix_lab_analyte_result_history_owner_version", "lab_analyte_result_id", "version"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     lab_analyte_result_id = Column(Integer, ForeignKey("lab_analyte_result.id"), nullable=False)
     lab_test_id = Column(Integer, ForeignKey("lab_test.id"), nullable=False)
@@ -149,6 +211,9 @@ class LabAnalyteResultHistory(Base):
 
 class BodyMeasurementHistory(Base):
     __tablename__ = "body_measurement_history"
+    __table_args__ = (
+        Index("ix_body_measurement_history_owner_version", "body_measurement_id", "version"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     body_measurement_id = Column(Integer, ForeignKey("body_measurement.id"), nullable=False)
     patient_id = Column(Integer, ForeignKey("patient.id"), nullable=False)
@@ -162,6 +227,9 @@ class BodyMeasurementHistory(Base):
 
 class ReferenceRangeHistory(Base):
     __tablename__ = "reference_range_history"
+    __table_args__ = (
+        Index("ix_reference_range_history_owner_version", "reference_range_loinc_code", "version"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     reference_range_loinc_code = Column(
         String(20), ForeignKey("reference_range.loinc_code"), nullable=False
@@ -172,3 +240,92 @@ class ReferenceRangeHistory(Base):
     unit = Column(String(20))
     version = Column(Integer)
     updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Compact history format (HISTORY_FORMAT=delta): per archived version, only the
+# fields the next update changed, plus a full snapshot every N versions.
+# Clustered on its lookup key (WITHOUT ROWID), so it needs no separate index.
+class HistoryDelta(Base):
+    __tablename__ = "history_delta"
+    __table_args__ = {"sqlite_with_rowid": False}
+    entity = Column(Integer, primary_key=True)
+    entity_key = Column(String(255), primary_key=True)
+    version = Column(Integer, primary_key=True)
+    snapshot = Column(Boolean, nullable=False, default=False)
+    changes = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Where the cold archive holds each record's history: one row per record and
+# gzip member of an archive file, written in the transaction that deletes the
+# archived rows, so a reader only decompresses the members it needs
+class HistoryArchiveIndex(Base):
+    __tablename__ = "history_archive_index"
+    __table_args__ = {"sqlite_with_rowid": False}
+    entity = Column(Integer, primary_key=True)
+    delta = Column(Boolean, primary_key=True)
+    entity_key = Column(String(255), primary_key=True)
+    member_offset = Column(Integer, primary_key=True)
+    member_length = Column(Integer, nullable=False)
+
+
+# =========================
+# DERIVED TABLES
+# =========================
+
+
+# One row per patient, kept current by the writes that change its inputs
+# (see app/summary.py); rebuild with `python -m app.summary rebuild`
+class PatientSummary(Base):
+    __tablename__ = "patient_summary"
+    patient_id = Column(Integer, ForeignKey("patient.id"), primary_key=True)
+    last_encounter_time = Column(DateTime)
+    abnormal_result_count = Column(Integer, nullable=False, default=0)
+    weight = Column(Float)
+    weight_unit = Column(String(20))
+    weight_time = Column(DateTime)
+    height = Column(Float)
+    height_unit = Column(String(20))
+    height_time = Column(DateTime)
+    systolic_bp = Column(Float)
+    systolic_bp_unit = Column(String(20))
+    systolic_bp_time = Column(DateTime)
+    diastolic_bp = Column(Float)
+    diastolic_bp_unit = Column(String(20))
+    diastolic_bp_time = Column(DateTime)
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+
+
+# =========================
+# CHANGE FEED
+# =========================
+
+
+# One row per create/update/delete, written in the same transaction as the
+# change. AUTOINCREMENT keeps seq strictly increasing (never reused), so a
+# client can resume from the last seq it saw (see app/changes.py).
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    __table_args__ = (
+        # When a record was created, for history as_of queries
+        Index("ix_change_log_entity_entity_id", "entity", "entity_id"),
+        {"sqlite_autoincrement": True},
+    )
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String(50), nullable=False)
+    entity_id = Column(String(255), nullable=False)
+    version = Column(Integer)
+    operation = Column(String(10), nullable=False)
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+
+# =========================
+# SCHEMA METADATA
+# =========================
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
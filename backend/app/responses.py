@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import tempfile
+from datetime import date, datetime
+from enum import Enum
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+# Bytes of a streamed JSON body kept in memory before it is spooled to a temporary file
+SPOOL_MAX_SIZE = int(os.getenv("RESPONSE_SPOOL_MAX_SIZE", str(1 << 20)))
+
+# Chunk size when sending a spooled body
+SPOOL_READ_SIZE = 1 << 16
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+
+def _default(value):
+    """Encode the non-JSON types our rows contain (stdlib fallback only)"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """Serialize plain Python data (dicts, lists, datetimes) straight to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response that encodes rows and datetimes natively, without jsonable_encoder"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def schema_columns(model, schema):
+    """Table columns of ``model`` exposed by ``schema``, in schema field order"""
+    columns = model.__table__.columns
+    return [columns[name] for name in schema.model_fields if name in columns]
+
+
+def rows_as_dicts(result):
+    """Turn a Core result into a list of dicts keyed by column name"""
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def etag_response(request: Request, content, headers=None) -> Response:
+    """Serialize ``content`` with a content-hash ETag; 304 if the client already has it.
+
+    Saves the transfer (and the client's parse) of unchanged data; the query
+    still runs.
+    """
+    body = dumps(content)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {**(headers or {}), "ETag": etag}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class JSONArraySpool:
+    """A JSON array body written a batch of rows at a time, for :func:`etag_response` semantics
+    without holding every row or the whole body in memory.
+
+    Batches are encoded as they arrive, hashed for the ETag and written to a
+    spool that moves from memory to a temporary file past
+    :data:`SPOOL_MAX_SIZE`. The bytes are the same as ``dumps(all_rows)``, so
+    the ETag matches the one a buffered response would carry.
+    """
+
+    def __init__(self, max_size=SPOOL_MAX_SIZE):
+        self.spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+        self.max_size = max_size
+        self.digest = hashlib.blake2b(digest_size=16)
+        self.size = 0
+        self._write(b"[")
+
+    def _write(self, data):
+        self.digest.update(data)
+        self.spool.write(data)
+        self.size += len(data)
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        if self.size > 1:
+            self._write(b",")
+        # Drop the batch's own brackets: the elements join into one array
+        self._write(dumps(rows)[1:-1])
+
+    def response(self, request: Request, headers=None) -> Response:
+        """Close the array and answer like :func:`etag_response`"""
+        self._write(b"]")
+        etag = f'"{self.digest.hexdigest()}"'
+        headers = {**(headers or {}), "ETag": etag}
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            self.spool.close()
+            return Response(status_code=304, headers=headers)
+        self.spool.seek(0)
+        if self.size <= self.max_size:
+            body = self.spool.read()
+            self.spool.close()
+            return Response(body, media_type="application/json", headers=headers)
+        headers["Content-Length"] = str(self.size)
+        return StreamingResponse(
+            iter(lambda: self.spool.read(SPOOL_READ_SIZE), b""),
+            media_type="application/json",
+            headers=headers,
+            background=BackgroundTask(self.spool.close),
+        )
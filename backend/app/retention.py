@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app import database
+from app.filelock import release_file_lock, try_file_lock
+from app.history import ENTITY_CODES, HISTORY_MODELS, append_to_archive
+from app.models import HistoryDelta
+from app.writer import write_queue
+from pydantic import BaseModel
+from sqlalchemy import and_, delete, func, select, tuple_
+from sqlalchemy.orm import Session
+
+
+class RetentionPolicy(BaseModel):
+    """Which history versions stay in the database; the rest move to the archive.
+
+    A version is kept if it is one of the ``keep_versions`` most recent
+    history versions of its record, or if it was archived less than
+    ``keep_days`` ago. Leaving both unset keeps everything.
+    """
+
+    keep_versions: Optional[int] = None
+    keep_days: Optional[float] = None
+
+
+# Per-entity policies as JSON, e.g.
+# {"lab_analyte_result": {"keep_versions": 10}, "body_measurement": {"keep_days": 365}}
+RETENTION_POLICIES = {
+    entity: RetentionPolicy(**policy)
+    for entity, policy in json.loads(os.getenv("HISTORY_RETENTION", "{}")).items()
+}
+# Rows moved per write transaction, so compaction never holds the write lock for long
+COMPACTION_CHUNK_SIZE = int(os.getenv("HISTORY_COMPACTION_CHUNK_SIZE", "500"))
+# Seconds between scheduled compaction runs
+COMPACTION_INTERVAL = float(os.getenv("HISTORY_COMPACTION_INTERVAL_S", "3600"))
+
+
+def history_source(entity, delta=False):
+    """(table, column identifying the record, primary key columns, filter) of stored history"""
+    if delta:
+        table = HistoryDelta.__table__
+        return (
+            table,
+            table.c.entity_key,
+            list(table.primary_key),
+            table.c.entity == ENTITY_CODES[entity],
+        )
+    _, history_model, owner = HISTORY_MODELS[entity]
+    return history_model.__table__, owner, [history_model.__table__.c.id], None
+
+
+def expired_history_ids(entity, policy: RetentionPolicy, now, limit, delta=False):
+    """SELECT the primary keys of history rows ``policy`` no longer keeps in the database"""
+    history, owner, primary_key, where = history_source(entity, delta)
+    ranked = select(
+        *primary_key,
+        history.c.updated_at,
+        func.row_number()
+        .over(partition_by=owner, order_by=history.c.version.desc())
+        .label("recency"),
+    )
+    if where is not None:
+        ranked = ranked.where(where)
+    ranked = ranked.subquery()
+
+    conditions = []
+    if policy.keep_versions is not None:
+        conditions.append(ranked.c.recency > policy.keep_versions)
+    if policy.keep_days is not None:
+        conditions.append(ranked.c.updated_at < now - timedelta(days=policy.keep_days))
+    key = [ranked.c[column.name] for column in primary_key]
+    return select(*key).where(and_(*conditions)).order_by(*key).limit(limit)
+
+
+def compact_chunk(db: Session, entity, policy: RetentionPolicy, now, chunk_size, delta=False):
+    """Move up to ``chunk_size`` expired history rows to the archive; returns how many moved"""
+    history, _, primary_key, _ = history_source(entity, delta)
+
+    ids = db.execute(expired_history_ids(entity, policy, now, chunk_size, delta)).all()
+    if not ids:
+        return 0
+
+    selected = tuple_(*primary_key).in_([tuple(row) for row in ids])
+    result = db.execute(select(history).where(selected).order_by(*primary_key))
+    keys = list(result.keys())
+    # Archive first: if the delete below never commits, neither does the
+    # member's index entry, and the next run archives the same rows again
+    append_to_archive(db, entity, [dict(zip(keys, row)) for row in result], delta)
+    db.execute(delete(history).where(selected))
+    return len(ids)
+
+
+def compact_history(policies=None, chunk_size=COMPACTION_CHUNK_SIZE, now=None):
+    """Apply the retention policies to every entity, one short write transaction per chunk"""
+    policies = RETENTION_POLICIES if policies is None else policies
+    now = now or datetime.utcnow()
+    moved = {}
+    for entity, policy in policies.items():
+        if policy.keep_versions is None and policy.keep_days is None:
+            continue
+        moved[entity] = 0
+        # Full history rows and deltas expire independently: retention only
+        # ever removes the oldest versions, and reconstruction walks from the newest
+        for delta in (False, True):
+            while True:
+                count = write_queue.run(
+                    lambda db, entity=entity, policy=policy, delta=delta: compact_chunk(
+                        db, entity, policy, now, chunk_size, delta
+                    )
+                )
+                moved[entity] += count
+                if count < chunk_size:
+                    break
+    return moved
+
+
+class CompactionScheduler:
+    """Run :func:`compact_history` every ``interval`` seconds on a background thread.
+
+    Only one process compacts: with several uvicorn workers, the one holding
+    the ``compaction`` lock file runs the passes. The others try to take the
+    lock at each interval, so one of them takes over if that process exits.
+    """
+
+    def __init__(self, interval=COMPACTION_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_fd = None
+
+    def start(self):
+        if not RETENTION_POLICIES or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="history-compaction", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._lock_fd is not None:
+            release_file_lock(self._lock_fd)
+            self._lock_fd = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._lock_fd is None:
+                self._lock_fd = try_file_lock(database.lock_path("compaction"))
+                if self._lock_fd is None:
+                    continue
+            try:
+                moved = compact_history()
+                if any(moved.values()):
+                    print(f"History compaction archived {moved}")
+            except Exception as e:
+                print(f"❌ Error compacting history: {e}")
+
+
+compaction_scheduler = CompactionScheduler()
+
+
+if __name__ == "__main__":
+    print(compact_history())
@@ -1,110 +1,97 @@
 from datetime import datetime
+from typing import Optional
 
-from app import database
-from app.models import BodyMeasurement, BodyMeasurementHistory
+from app.crud import add_crud_routes, get_read_db
+from app.models import BodyMeasurement
+from app.responses import FastJSONResponse
 from app.schemas import BodyMeasurement as BodyMeasurementSchema
-from app.schemas import BodyMeasurementCreate, BodyMeasurementUpdate
-from fastapi import APIRouter, Depends, HTTPException
+from app.schemas import BodyMeasurementCreate, BodyMeasurementUpdate, TrendPoint, UnitStats
+from app.summary import refresh_patient_summaries
+from app.trends import measurement_stats, measurement_trend
+from app.units import UNIT_DESCRIPTION, parse_targets
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/body_measurement", tags=["Body Measurement"])
 
-
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-@router.post("/create", response_model=BodyMeasurementSchema)
-# Create a new body measurement
-# Operation: CREATE
-# Description: Adds a new body measurement to the database with versioning.
-def create_body_measurement(body_measurement: BodyMeasurementCreate, db: Session = Depends(get_db)):
-    db_body_measurement = BodyMeasurement(**body_measurement.dict(), version=1)
-    db.add(db_body_measurement)
-    db.commit()
-    db.refresh(db_body_measurement)
-    return db_body_measurement
-
-
-@router.get("/all", response_model=list[BodyMeasurementSchema])
-# List all body measurements
+BUDGETS = {
+    "/body_measurement/trend?patient_id=1&snomed_code=27113001&unit=lb": {
+        "statements": 1,
+        "rows": 10,
+        "ms": 200,
+    },
+    "/body_measurement/stats?snomed_code=27113001&unit=lb": {"statements": 1, "rows": 2, "ms": 200},
+    "/body_measurement/all?limit=100": {"statements": 1, "rows": 101, "ms": 100},
+    "/body_measurement/batch?ids=1,2,3": {"statements": 1, "rows": 3, "ms": 100},
+    "/body_measurement/1": {"statements": 1, "rows": 1, "ms": 100},
+}
+
+
+@router.get("/trend", response_model=list[TrendPoint])
+# Trend of one body measurement for a patient
 # Operation: READ (LIST)
-# Description: Retrieves all body measurements from the database.
-def list_body_measurements(db: Session = Depends(get_db)):
-    return db.query(BodyMeasurement).all()
-
-
-@router.get("/{body_measurement_id}", response_model=BodyMeasurementSchema)
-# Get a specific body measurement by ID
-# Operation: READ (GET)
-# Description: Retrieves a single body measurement by its ID.
-def get_body_measurement(body_measurement_id: int, db: Session = Depends(get_db)):
-    body_measurement = (
-        db.query(BodyMeasurement).filter(BodyMeasurement.id == body_measurement_id).first()
-    )
-    if not body_measurement:
-        raise HTTPException(status_code=404, detail="Body measurement not found")
-    return body_measurement
-
-
-@router.put("/update/{body_measurement_id}", response_model=BodyMeasurementSchema)
-# Update a specific body measurement by ID
-# Operation: UPDATE
-# Description: Updates a body measurement and archives the previous state in the history table.
-def update_body_measurement(
-    body_measurement_id: int,
-    body_measurement_in: BodyMeasurementUpdate,
-    db: Session = Depends(get_db),
+# Description: Retrieves a patient's measurements for one SNOMED CT code in time order, converted to the requested unit (e.g. lb, in, °F) by the database.
+def get_body_measurement_trend(
+    patient_id: int,
+    snomed_code: str,
+    unit: Optional[str] = Query(None, description=UNIT_DESCRIPTION),
+    since: Optional[datetime] = Query(None, description="Recorded at or after this time"),
+    until: Optional[datetime] = Query(None, description="Recorded before this time"),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_read_db),
 ):
-    db_body_measurement = (
-        db.query(BodyMeasurement).filter(BodyMeasurement.id == body_measurement_id).first()
-    )
-    if not db_body_measurement:
-        raise HTTPException(status_code=404, detail="Body measurement not found")
-
-    # Archive current state
-    history = BodyMeasurementHistory(
-        body_measurement_id=db_body_measurement.id,
-        patient_id=db_body_measurement.patient_id,
-        record_time=db_body_measurement.record_time,
-        value=db_body_measurement.value,
-        unit=db_body_measurement.unit,
-        snomed_code=db_body_measurement.snomed_code,
-        version=db_body_measurement.version,
-        updated_at=datetime.utcnow(),
-    )
-    db.add(history)
-
-    # Apply update
-    for field, value in body_measurement_in.dict(exclude_unset=True).items():
-        setattr(db_body_measurement, field, value)
-    setattr(db_body_measurement, "version", db_body_measurement.version + 1)
-
-    db.commit()
-    db.refresh(db_body_measurement)
-    return db_body_measurement
-
-
-@router.delete("/delete/{body_measurement_id}")
-# Delete a specific body measurement by ID
-# Operation: DELETE
-# Description: Deletes a body measurement and its associated history records.
-def delete_body_measurement(body_measurement_id: int, db: Session = Depends(get_db)):
-    body_measurement = (
-        db.query(BodyMeasurement).filter(BodyMeasurement.id == body_measurement_id).first()
+    try:
+        targets = parse_targets([unit] if unit else [])
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from None
+    return FastJSONResponse(
+        measurement_trend(db, patient_id, snomed_code, targets, since, until, limit)
     )
-    if not body_measurement:
-        raise HTTPException(status_code=404, detail="Body measurement not found")
 
-    # Delete from history table
-    db.query(BodyMeasurementHistory).filter(
-        BodyMeasurementHistory.body_measurement_id == body_measurement_id
-    ).delete()
 
-    db.delete(body_measurement)
-    db.commit()
-    return {"ok": True}
+@router.get("/stats", response_model=list[UnitStats])
+# Aggregate one body measurement
+# Operation: READ (AGGREGATE)
+# Description: Count, min, max and mean of the measurements for one SNOMED CT code, optionally for one patient and time window, converted to the requested unit before aggregating.
+def get_body_measurement_stats(
+    snomed_code: str,
+    unit: Optional[str] = Query(None, description=UNIT_DESCRIPTION),
+    patient_id: Optional[int] = None,
+    since: Optional[datetime] = Query(None, description="Recorded at or after this time"),
+    until: Optional[datetime] = Query(None, description="Recorded before this time"),
+    db: Session = Depends(get_read_db),
+):
+    try:
+        targets = parse_targets([unit] if unit else [])
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from None
+    return FastJSONResponse(measurement_stats(db, snomed_code, targets, patient_id, since, until))
+
+
+def refresh_summaries(db: Session, body_measurement, previous):
+    # Both the old and the new patient's summary can change
+    patient_ids = set()
+    if body_measurement is not None:
+        patient_ids.add(body_measurement.patient_id)
+    if previous is not None:
+        patient_ids.add(previous["patient_id"])
+    refresh_patient_summaries(db, patient_ids)
+
+
+# Create, list, get, update and delete body measurements
+add_crud_routes(
+    router,
+    BodyMeasurement,
+    BodyMeasurementSchema,
+    BodyMeasurementCreate,
+    BodyMeasurementUpdate,
+    entity="body_measurement",
+    name="body_measurement",
+    plural="body_measurements",
+    label="Body measurement",
+    id_name="body_measurement_id",
+    hooks=[refresh_summaries],
+    events=lambda db, body_measurement: body_measurement.patient_id,
+    filters=["patient_id", "snomed_code", "value", "record_time"],
+    sorts=["record_time"],
+)
@@ -0,0 +1,34 @@
+from enum import Enum
+from typing import Optional
+
+from app.changes import changes_page
+from app.crud import get_read_db
+from app.loader import ENTITIES
+from app.responses import FastJSONResponse
+from app.schemas import ChangePage
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+router = APIRouter(tags=["Changes"])
+
+BUDGETS = {
+    "/changes?limit=100": {"statements": 1, "rows": 101, "ms": 100},
+}
+
+ChangeEntity = Enum("ChangeEntity", {entity: entity for entity in ENTITIES}, type=str)
+
+
+@router.get("/changes", response_model=ChangePage)
+# List changes since a sequence number
+# Operation: READ (LIST)
+# Description: Retrieves creates, updates and deletes across all entities in commit order, starting after the given sequence number, so clients can sync incrementally.
+def list_changes(
+    since: int = Query(
+        0, ge=0, description="The next_since of the previous call (0: from the start)"
+    ),
+    limit: int = Query(1000, ge=1, le=10000),
+    entity: Optional[list[ChangeEntity]] = Query(None, description="Only these entities"),
+    db: Session = Depends(get_read_db),
+):
+    entities = [value.value for value in entity] if entity else None
+    return FastJSONResponse(changes_page(db, since, limit, entities))
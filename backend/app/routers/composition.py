@@ -1,101 +1,85 @@
-from datetime import datetime
+from typing import Optional
 
-from app import database
-from app.models import Composition, CompositionHistory
+from app.crud import MAX_BATCH_SIZE, add_crud_routes, get_read_db
+from app.documents import compositions_full
+from app.models import Composition
+from app.responses import FastJSONResponse
 from app.schemas import Composition as CompositionSchema
 from app.schemas import CompositionCreate, CompositionUpdate
-from fastapi import APIRouter, Depends, HTTPException
+from app.summary import refresh_patient_summaries
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/composition", tags=["Composition"])
 
-
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-@router.post("/create", response_model=CompositionSchema)
-# Create a new composition
-# Operation: CREATE
-# Description: Adds a new composition to the database with versioning.
-def create_composition(composition: CompositionCreate, db: Session = Depends(get_db)):
-    db_composition = Composition(**composition.dict(), version=1)
-    db.add(db_composition)
-    db.commit()
-    db.refresh(db_composition)
-    return db_composition
-
-
-@router.get("/all", response_model=list[CompositionSchema])
-# List all compositions
+BUDGETS = {
+    "/composition/full?patient_id=1": {"statements": 4, "rows": 120, "ms": 150},
+    "/composition/full?ids=1,2,3": {"statements": 4, "rows": 80, "ms": 150},
+    "/composition/all?patient_id=1&sort=-start_time": {"statements": 1, "rows": 10, "ms": 100},
+    "/composition/all?limit=100": {"statements": 1, "rows": 101, "ms": 100},
+    "/composition/batch?ids=1,2,3": {"statements": 1, "rows": 3, "ms": 100},
+    "/composition/1": {"statements": 1, "rows": 1, "ms": 100},
+    "/composition/1/full": {"statements": 4, "rows": 30, "ms": 150},
+}
+
+
+def refresh_summaries(db: Session, composition, previous):
+    # Both the old and the new patient's summary can change
+    patient_ids = set()
+    if composition is not None:
+        patient_ids.add(composition.patient_id)
+    if previous is not None:
+        patient_ids.add(previous["patient_id"])
+    refresh_patient_summaries(db, patient_ids)
+
+
+@router.get("/full")
+# Get several compositions with all associated data
 # Operation: READ (LIST)
-# Description: Retrieves all compositions from the database.
-def list_compositions(db: Session = Depends(get_db)):
-    return db.query(Composition).all()
-
-
-@router.get("/{composition_id}", response_model=CompositionSchema)
-# Get a specific composition by ID
-# Operation: READ (GET)
-# Description: Retrieves a single composition by its ID.
-def get_composition(composition_id: int, db: Session = Depends(get_db)):
-    composition = db.query(Composition).filter(Composition.id == composition_id).first()
-    if not composition:
-        raise HTTPException(status_code=404, detail="Composition not found")
-    return composition
-
-
-@router.put("/update/{composition_id}", response_model=CompositionSchema)
-# Update a specific composition by ID
-# Operation: UPDATE
-# Description: Updates a composition and archives the previous state in the history table.
-def update_composition(
-    composition_id: int,
-    composition_in: CompositionUpdate,
-    db: Session = Depends(get_db),
+# Description: Retrieves the compositions with the given IDs (in that order), or a patient's most recent ones, each with its lab tests, specimens and analytes.
+def list_compositions_full(
+    ids: Optional[str] = Query(None, description="Comma-separated composition IDs"),
+    patient_id: Optional[int] = Query(None, description="Most recent compositions of this patient"),
+    limit: int = Query(20, ge=1, le=1000, description="Compositions per patient"),
+    db: Session = Depends(get_read_db),
 ):
-    db_composition = db.query(Composition).filter(Composition.id == composition_id).first()
-    if not db_composition:
-        raise HTTPException(status_code=404, detail="Composition not found")
-
-    # Archive current state
-    history = CompositionHistory(
-        composition_id=db_composition.id,
-        patient_id=db_composition.patient_id,
-        start_time=db_composition.start_time,
-        version=db_composition.version,
-        updated_at=datetime.utcnow(),
-    )
-    db.add(history)
-
-    # Apply update
-    for field, value in composition_in.dict(exclude_unset=True).items():
-        setattr(db_composition, field, value)
-    setattr(db_composition, "version", db_composition.version + 1)
-
-    db.commit()
-    db.refresh(db_composition)
-    return db_composition
-
-
-@router.delete("/delete/{composition_id}")
-# Delete a specific composition by ID
-# Operation: DELETE
-# Description: Deletes a composition and its associated history records.
-def delete_composition(composition_id: int, db: Session = Depends(get_db)):
-    db_composition = db.query(Composition).filter(Composition.id == composition_id).first()
-    if not db_composition:
+    if (ids is None) == (patient_id is None):
+        raise HTTPException(status_code=422, detail="Pass either ids or patient_id")
+    if ids is None:
+        return FastJSONResponse(compositions_full(db, patient_id=patient_id, limit=limit))
+    try:
+        composition_ids = [int(id) for id in ids.split(",") if id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid ids") from None
+    if len(composition_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BATCH_SIZE} ids per request")
+    return FastJSONResponse(compositions_full(db, composition_ids=composition_ids))
+
+
+# Create, list, get, update and delete compositions
+add_crud_routes(
+    router,
+    Composition,
+    CompositionSchema,
+    CompositionCreate,
+    CompositionUpdate,
+    entity="composition",
+    name="composition",
+    plural="compositions",
+    label="Composition",
+    id_name="composition_id",
+    hooks=[refresh_summaries],
+    filters=["patient_id", "start_time"],
+    sorts=["start_time"],
+)
+
+
+@router.get("/{composition_id}/full")
+# Get a composition with all associated data
+# Operation: READ (GET)
+# Description: Retrieves a single composition by ID including its lab tests, their specimens and analytes.
+def get_composition_full(composition_id: int, db: Session = Depends(get_read_db)):
+    documents = compositions_full(db, composition_ids=[composition_id])
+    if not documents:
         raise HTTPException(status_code=404, detail="Composition not found")
-
-    # Delete from history table
-    db.query(CompositionHistory).filter(
-        CompositionHistory.composition_id == composition_id
-    ).delete()
-
-    db.delete(db_composition)
-    db.commit()
-    return {"ok": True}
+    return FastJSONResponse(documents[0])
@@ -0,0 +1,43 @@
+from enum import Enum
+from typing import Optional
+
+from app.events import event_broker, event_stream
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+
+router = APIRouter(prefix="/events", tags=["Events"])
+
+
+class StreamEntity(str, Enum):
+    lab_analyte_result = "lab_analyte_result"
+    body_measurement = "body_measurement"
+
+
+@router.get("/stream")
+# Stream new and updated lab results and measurements
+# Operation: READ (STREAM)
+# Description: Server-Sent Events stream of lab analyte result and body measurement creates/updates as they commit, optionally filtered by entity, patient, LOINC or SNOMED CT code and interpretation.
+async def stream_events(
+    request: Request,
+    entity: Optional[list[StreamEntity]] = Query(None, description="Only these entities"),
+    patient_id: Optional[int] = None,
+    loinc_code: Optional[list[str]] = Query(None, description="Only results with these codes"),
+    snomed_code: Optional[list[str]] = Query(
+        None, description="Only measurements with these codes"
+    ),
+    interpretation: Optional[list[str]] = Query(None, description="Result interpretation, e.g. H"),
+):
+    stream = event_stream(
+        event_broker,
+        request.is_disconnected,
+        entities=[value.value for value in entity or ()],
+        patient_id=patient_id,
+        loinc_codes=loinc_code or (),
+        snomed_codes=snomed_code or (),
+        interpretations=interpretation or (),
+    )
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
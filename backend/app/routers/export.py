@@ -0,0 +1,46 @@
+from enum import Enum
+from typing import Optional
+
+from app.export import RESOURCE_TYPES, export_ndjson, export_pool
+from app.units import parse_targets
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+BUDGETS = {
+    "/export/fhir?patient_id=1": {"statements": 6, "rows": 150, "ms": 250},
+}
+
+ResourceType = Enum("ResourceType", {name: name for name in RESOURCE_TYPES}, type=str)
+
+
+@router.get("/fhir")
+# Export patients as FHIR NDJSON
+# Operation: READ (EXPORT)
+# Description: Streams the FHIR resources (Patient, Encounter, Specimen, DiagnosticReport, Observation) of one patient, a cohort or everyone as NDJSON, in patient id order. Large cohorts are mapped by parallel worker processes.
+def export_fhir(
+    patient_id: Optional[list[int]] = Query(None, description="Patients to export (default: all)"),
+    resource_type: Optional[list[ResourceType]] = Query(
+        None, alias="_type", description="Only these resource types"
+    ),
+    unit: Optional[list[str]] = Query(
+        None,
+        description="Convert quantities to this unit (e.g. mmol/L), or <code>:<unit> for one "
+        "LOINC/SNOMED CT code (e.g. 2345-7:mg/dL); repeatable",
+    ),
+):
+    try:
+        targets = parse_targets(unit)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from None
+    types = [value.value for value in resource_type] if resource_type else RESOURCE_TYPES
+    types = [name for name in RESOURCE_TYPES if name in types]
+
+    def stream():
+        for chunk in export_ndjson(patient_id, types, targets=targets, pool=export_pool):
+            for name in types:
+                if chunk[name]:
+                    yield chunk[name]
+
+    return StreamingResponse(stream(), media_type="application/fhir+ndjson")
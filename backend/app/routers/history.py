@@ -0,0 +1,57 @@
+from datetime import datetime
+from enum import Enum
+
+from app.crud import get_read_db
+from app.history import HISTORY_MODELS, get_version_as_of, get_versions
+from app.responses import FastJSONResponse
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import Integer
+from sqlalchemy.orm import Session
+
+router = APIRouter(prefix="/history", tags=["History"])
+
+BUDGETS = {
+    "/history/patient/1": {"statements": 4, "rows": 5, "ms": 100},
+    "/history/lab_analyte_result/1/as_of?at=2030-01-01T00:00:00": {
+        "statements": 7,
+        "rows": 10,
+        "ms": 100,
+    },
+}
+
+HistoryEntity = Enum("HistoryEntity", {entity: entity for entity in HISTORY_MODELS}, type=str)
+
+
+def parse_entity_id(entity: HistoryEntity, entity_id: str):
+    model, _, _ = HISTORY_MODELS[entity.value]
+    (primary_key,) = model.__table__.primary_key.columns
+    if isinstance(primary_key.type, Integer):
+        try:
+            return int(entity_id)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Record id must be an integer") from None
+    return entity_id
+
+
+@router.get("/{entity}/{entity_id}")
+# List all versions of a record
+# Operation: READ (LIST)
+# Description: Retrieves every version of a record, oldest first, including versions moved to the history archive.
+def list_versions(entity: HistoryEntity, entity_id: str, db: Session = Depends(get_read_db)):
+    versions = get_versions(db, entity.value, parse_entity_id(entity, entity_id))
+    if not versions:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return FastJSONResponse(versions)
+
+
+@router.get("/{entity}/{entity_id}/as_of")
+# Get a record as it was at a point in time
+# Operation: READ (GET)
+# Description: Retrieves the version of a record that was current at the given time.
+def get_version_at(
+    entity: HistoryEntity, entity_id: str, at: datetime, db: Session = Depends(get_read_db)
+):
+    version = get_version_as_of(db, entity.value, parse_entity_id(entity, entity_id), at)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return FastJSONResponse(version)
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+from app.ingest import INGEST_BATCH_SIZE, ingest_files
+from app.schemas import IngestReport
+from fastapi import APIRouter, Query, Request
+from starlette.concurrency import run_in_threadpool
+
+router = APIRouter(prefix="/ingest", tags=["Ingest"])
+
+
+@router.post("/fhir", response_model=IngestReport)
+# Ingest FHIR lab results in bulk
+# Operation: CREATE (BULK)
+# Description: Streams a FHIR Bundle (application/fhir+json) or FHIR NDJSON (application/fhir+ndjson) body into patients, compositions, specimens, lab tests, analyte results and body measurements, in batched transactions. Returns throughput and per-record errors.
+async def ingest_fhir(
+    request: Request,
+    batch_size: int = Query(
+        INGEST_BATCH_SIZE, ge=1, le=10000, description="Records per transaction"
+    ),
+):
+    suffix = ".ndjson" if "ndjson" in request.headers.get("content-type", "") else ".json"
+    # Spool the upload to disk so a large file never sits in memory. Every file
+    # operation runs in the threadpool: only reading the body belongs on the event loop
+    spool = await run_in_threadpool(tempfile.NamedTemporaryFile, suffix=suffix, delete=False)
+    try:
+        try:
+            async for chunk in request.stream():
+                await run_in_threadpool(spool.write, chunk)
+        finally:
+            await run_in_threadpool(spool.close)
+        return await run_in_threadpool(ingest_files, [spool.name], batch_size)
+    finally:
+        await run_in_threadpool(os.unlink, spool.name)
@@ -1,109 +1,149 @@
 from datetime import datetime
+from typing import Optional
 
-from app import database
-from app.models import LabAnalyteResult, LabAnalyteResultHistory
+from app.crud import add_crud_routes, get_read_db
+from app.models import LabAnalyteResult
+from app.responses import FastJSONResponse
 from app.schemas import LabAnalyteResult as LabAnalyteResultSchema
-from app.schemas import LabAnalyteResultCreate, LabAnalyteResultUpdate
-from fastapi import APIRouter, Depends, HTTPException
+from app.schemas import (
+    AbnormalInterpretation,
+    LabAnalyteResultCreate,
+    LabAnalyteResultUpdate,
+    LabAnalyteWorklistPage,
+    TrendPoint,
+    UnitStats,
+)
+from app.summary import patients_of_lab_tests, refresh_patient_summaries
+from app.trends import lab_stats, lab_trend
+from app.units import UNIT_DESCRIPTION, parse_targets
+from app.worklist import abnormal_results_page, collection_time_for, parse_cursor
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/lab_analyte", tags=["Lab Analyte Result"])
 
-
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-@router.post("/create", response_model=LabAnalyteResultSchema)
-# Create a new lab analyte result
-# Operation: CREATE
-# Description: Adds a new lab analyte result to the database with versioning.
-def create_lab_analyte_result(lab_analyte: LabAnalyteResultCreate, db: Session = Depends(get_db)):
-    db_lab_analyte = LabAnalyteResult(**lab_analyte.dict(), version=1)
-    db.add(db_lab_analyte)
-    db.commit()
-    db.refresh(db_lab_analyte)
-    return db_lab_analyte
-
-
-@router.get("/all", response_model=list[LabAnalyteResultSchema])
-# List all lab analyte results
+BUDGETS = {
+    "/lab_analyte/worklist?limit=100": {"statements": 1, "rows": 101, "ms": 100},
+    "/lab_analyte/trend?patient_id=1&loinc_code=2345-7&unit=mg/dL": {
+        "statements": 1,
+        "rows": 20,
+        "ms": 200,
+    },
+    "/lab_analyte/stats?loinc_code=2345-7&unit=mg/dL": {"statements": 1, "rows": 2, "ms": 200},
+    "/lab_analyte/all?limit=100": {"statements": 1, "rows": 101, "ms": 100},
+    "/lab_analyte/all?loinc_code=2345-7&sort=-value&limit=100": {
+        "statements": 1,
+        "rows": 101,
+        "ms": 100,
+    },
+    "/lab_analyte/batch?ids=1,2,3": {"statements": 1, "rows": 3, "ms": 100},
+    "/lab_analyte/1": {"statements": 1, "rows": 1, "ms": 100},
+}
+
+
+@router.get("/worklist", response_model=LabAnalyteWorklistPage)
+# List abnormal lab analyte results across all patients
 # Operation: READ (LIST)
-# Description: Retrieves all lab analyte results from the database.
-def list_lab_analyte_results(db: Session = Depends(get_db)):
-    return db.query(LabAnalyteResult).all()
-
-
-@router.get("/{lab_analyte_result_id}", response_model=LabAnalyteResultSchema)
-# Get a specific lab analyte result by ID
-# Operation: READ (GET)
-# Description: Retrieves a single lab analyte result by its ID.
-def get_lab_analyte_result(lab_analyte_result_id: int, db: Session = Depends(get_db)):
-    lab_analyte = (
-        db.query(LabAnalyteResult).filter(LabAnalyteResult.id == lab_analyte_result_id).first()
-    )
-    if not lab_analyte:
-        raise HTTPException(status_code=404, detail="Lab analyte result not found")
-    return lab_analyte
-
-
-@router.put("/update/{lab_analyte_result_id}", response_model=LabAnalyteResultSchema)
-# Update a specific lab analyte result by ID
-# Operation: UPDATE
-# Description: Updates a lab analyte result and archives the previous state in the history table.
-def update_lab_analyte_result(
-    lab_analyte_result_id: int,
-    lab_analyte_in: LabAnalyteResultUpdate,
-    db: Session = Depends(get_db),
+# Description: Retrieves H/L results, newest collection time first, optionally filtered by LOINC code and time window, one page at a time.
+def list_abnormal_results(
+    interpretation: list[AbnormalInterpretation] = Query(list(AbnormalInterpretation)),
+    loinc_code: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="Collected at or after this time"),
+    until: Optional[datetime] = Query(None, description="Collected before this time"),
+    after: Optional[str] = Query(None, description="The next_after cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db),
 ):
-    db_lab_analyte = (
-        db.query(LabAnalyteResult).filter(LabAnalyteResult.id == lab_analyte_result_id).first()
-    )
-    if not db_lab_analyte:
-        raise HTTPException(status_code=404, detail="Lab analyte result not found")
-
-    history = LabAnalyteResultHistory(
-        lab_analyte_result_id=db_lab_analyte.id,
-        lab_test_id=db_lab_analyte.lab_test_id,
-        loinc_code=db_lab_analyte.loinc_code,
-        value=db_lab_analyte.value,
-        unit=db_lab_analyte.unit,
-        reference_low=db_lab_analyte.reference_low,
-        reference_high=db_lab_analyte.reference_high,
-        interpretation=db_lab_analyte.interpretation,
-        version=db_lab_analyte.version,
-        updated_at=datetime.utcnow(),
-    )
-    db.add(history)
-
-    for field, value in lab_analyte_in.dict(exclude_unset=True).items():
-        setattr(db_lab_analyte, field, value)
-    setattr(db_lab_analyte, "version", db_lab_analyte.version + 1)
-
-    db.commit()
-    db.refresh(db_lab_analyte)
-    return db_lab_analyte
-
-
-@router.delete("/delete/{lab_analyte_result_id}")
-# Delete a specific lab analyte result by ID
-# Operation: DELETE
-# Description: Deletes a lab analyte result and its associated history records.
-def delete_lab_analyte_result(lab_analyte_result_id: int, db: Session = Depends(get_db)):
-    db_lab_analyte = (
-        db.query(LabAnalyteResult).filter(LabAnalyteResult.id == lab_analyte_result_id).first()
+    try:
+        cursor = parse_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid worklist cursor") from None
+    page = abnormal_results_page(
+        db,
+        interpretations=[value.value for value in interpretation],
+        loinc_code=loinc_code,
+        since=since,
+        until=until,
+        after=cursor,
+        limit=limit,
     )
-    if not db_lab_analyte:
-        raise HTTPException(status_code=404, detail="Lab analyte result not found")
+    return FastJSONResponse(page)
 
-    db.query(LabAnalyteResultHistory).filter(
-        LabAnalyteResultHistory.lab_analyte_result_id == lab_analyte_result_id
-    ).delete()
 
-    db.delete(db_lab_analyte)
-    db.commit()
-    return {"ok": True}
+@router.get("/trend", response_model=list[TrendPoint])
+# Trend of one analyte for a patient
+# Operation: READ (LIST)
+# Description: Retrieves a patient's results for one LOINC code in collection time order, with values and reference ranges converted to the requested unit by the database.
+def get_lab_analyte_trend(
+    patient_id: int,
+    loinc_code: str,
+    unit: Optional[str] = Query(None, description=UNIT_DESCRIPTION),
+    since: Optional[datetime] = Query(None, description="Collected at or after this time"),
+    until: Optional[datetime] = Query(None, description="Collected before this time"),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_read_db),
+):
+    try:
+        targets = parse_targets([unit] if unit else [])
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from None
+    return FastJSONResponse(lab_trend(db, patient_id, loinc_code, targets, since, until, limit))
+
+
+@router.get("/stats", response_model=list[UnitStats])
+# Aggregate one analyte's results
+# Operation: READ (AGGREGATE)
+# Description: Count, min, max and mean of the results for one LOINC code, optionally for one patient and time window. Results are converted to the requested unit before aggregating; results in units without a conversion are reported as groups of their own.
+def get_lab_analyte_stats(
+    loinc_code: str,
+    unit: Optional[str] = Query(None, description=UNIT_DESCRIPTION),
+    patient_id: Optional[int] = None,
+    since: Optional[datetime] = Query(None, description="Collected at or after this time"),
+    until: Optional[datetime] = Query(None, description="Collected before this time"),
+    db: Session = Depends(get_read_db),
+):
+    try:
+        targets = parse_targets([unit] if unit else [])
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from None
+    return FastJSONResponse(lab_stats(db, loinc_code, targets, patient_id, since, until))
+
+
+def copy_collection_time(db: Session, lab_analyte, previous):
+    # Results carry their specimen's collection time for the worklist indexes
+    if lab_analyte is not None:
+        lab_analyte.collection_time = collection_time_for(db, lab_analyte.lab_test_id)
+
+
+def refresh_summaries(db: Session, lab_analyte, previous):
+    # Both the old and the new lab test's patient can have their abnormal count change
+    lab_test_ids = set()
+    if lab_analyte is not None:
+        lab_test_ids.add(lab_analyte.lab_test_id)
+    if previous is not None:
+        lab_test_ids.add(previous["lab_test_id"])
+    refresh_patient_summaries(db, patients_of_lab_tests(db, lab_test_ids))
+
+
+def patient_of(db: Session, lab_analyte):
+    # Streams filter results by the patient of the composition they were ordered in
+    return next(iter(patients_of_lab_tests(db, [lab_analyte.lab_test_id])), None)
+
+
+# Create, list, get, update and delete lab analyte results
+add_crud_routes(
+    router,
+    LabAnalyteResult,
+    LabAnalyteResultSchema,
+    LabAnalyteResultCreate,
+    LabAnalyteResultUpdate,
+    entity="lab_analyte_result",
+    name="lab_analyte_result",
+    plural="lab_analyte_results",
+    label="Lab analyte result",
+    id_name="lab_analyte_result_id",
+    hooks=[copy_collection_time, refresh_summaries],
+    events=patient_of,
+    filters=["lab_test_id", "loinc_code", "value", "collection_time"],
+    sorts=["value"],
+)
@@ -1,99 +1,49 @@
-from datetime import datetime
-
-from app import database
-from app.models import LabTest, LabTestHistory
+from app.crud import add_crud_routes
+from app.models import LabTest
 from app.schemas import LabTest as LabTestSchema
 from app.schemas import LabTestCreate, LabTestUpdate
-from fastapi import APIRouter, Depends, HTTPException
+from app.summary import patients_of_compositions, refresh_patient_summaries
+from app.worklist import refresh_collection_times
+from fastapi import APIRouter
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/lab_test", tags=["Laboratory Test"])
 
-
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-@router.post("/create", response_model=LabTestSchema)
-# Create a new lab test
-# Operation: CREATE
-# Description: Adds a new lab test to the database with versioning.
-def create_lab_test(lab_test: LabTestCreate, db: Session = Depends(get_db)):
-    db_lab_test = LabTest(**lab_test.dict(), version=1)
-    db.add(db_lab_test)
-    db.commit()
-    db.refresh(db_lab_test)
-    return db_lab_test
-
-
-@router.get("/all", response_model=list[LabTestSchema])
-# List all lab tests
-# Operation: READ (LIST)
-# Description: Retrieves all lab tests from the database.
-def list_lab_tests(db: Session = Depends(get_db)):
-    return db.query(LabTest).all()
-
-
-@router.get("/{lab_test_id}", response_model=LabTestSchema)
-# Get a specific lab test by ID
-# Operation: READ (GET)
-# Description: Retrieves a single lab test by its ID.
-def get_lab_test(lab_test_id: int, db: Session = Depends(get_db)):
-    lab_test = db.query(LabTest).filter(LabTest.id == lab_test_id).first()
-    if not lab_test:
-        raise HTTPException(status_code=404, detail="Lab test not found")
-    return lab_test
-
-
-@router.put("/update/{lab_test_id}", response_model=LabTestSchema)
-# Update a specific lab test by ID
-# Operation: UPDATE
-# Description: Updates a lab test and archives the previous state in the history table.
-def update_lab_test(
-    lab_test_id: int,
-    lab_test_in: LabTestUpdate,
-    db: Session = Depends(get_db),
-):
-    db_lab_test = db.query(LabTest).filter(LabTest.id == lab_test_id).first()
-    if not db_lab_test:
-        raise HTTPException(status_code=404, detail="Lab test not found")  # Archive current state
-    history = LabTestHistory(
-        lab_test_id=db_lab_test.id,
-        composition_id=db_lab_test.composition_id,
-        specimen_id=db_lab_test.specimen_id,
-        loinc_code=db_lab_test.loinc_code,
-        description=db_lab_test.description,
-        version=db_lab_test.version,
-        updated_at=datetime.utcnow(),
-    )
-    db.add(history)
-
-    # Apply update
-    for field, value in lab_test_in.dict(exclude_unset=True).items():
-        setattr(db_lab_test, field, value)
-    setattr(db_lab_test, "version", db_lab_test.version + 1)
-
-    db.commit()
-    db.refresh(db_lab_test)
-    return db_lab_test
-
-
-@router.delete("/delete/{lab_test_id}")
-# Delete a specific lab test by ID
-# Operation: DELETE
-# Description: Deletes a lab test and its associated history records.
-def delete_lab_test(lab_test_id: int, db: Session = Depends(get_db)):
-    db_lab_test = db.query(LabTest).filter(LabTest.id == lab_test_id).first()
-    if not db_lab_test:
-        raise HTTPException(status_code=404, detail="Lab test not found")
-
-    # Delete from history table
-    db.query(LabTestHistory).filter(LabTestHistory.lab_test_id == lab_test_id).delete()
-
-    db.delete(db_lab_test)
-    db.commit()
-    return {"ok": True}
+BUDGETS = {
+    "/lab_test/all?limit=100": {"statements": 1, "rows": 101, "ms": 100},
+    "/lab_test/batch?ids=1,2,3": {"statements": 1, "rows": 3, "ms": 100},
+    "/lab_test/1": {"statements": 1, "rows": 1, "ms": 100},
+}
+
+
+def refresh_results(db: Session, lab_test, previous):
+    # Moving a lab test to another specimen changes its results' collection time
+    if lab_test is not None and previous is not None:
+        refresh_collection_times(db, lab_test_ids=[lab_test.id])
+
+
+def refresh_summaries(db: Session, lab_test, previous):
+    # Changes to a lab test move its results' abnormal counts between patients
+    if previous is None:
+        return
+    composition_ids = {previous["composition_id"]}
+    if lab_test is not None:
+        composition_ids.add(lab_test.composition_id)
+    refresh_patient_summaries(db, patients_of_compositions(db, composition_ids))
+
+
+# Create, list, get, update and delete lab tests
+add_crud_routes(
+    router,
+    LabTest,
+    LabTestSchema,
+    LabTestCreate,
+    LabTestUpdate,
+    entity="lab_test",
+    name="lab_test",
+    plural="lab_tests",
+    label="Lab test",
+    id_name="lab_test_id",
+    hooks=[refresh_results, refresh_summaries],
+    filters=["composition_id", "specimen_id", "loinc_code"],
+)
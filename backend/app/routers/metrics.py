@@ -0,0 +1,17 @@
+from app.metrics import snapshot
+from app.responses import FastJSONResponse
+from fastapi import APIRouter
+
+router = APIRouter(tags=["Metrics"])
+
+BUDGETS = {
+    "/metrics": {"statements": 0, "rows": 0, "ms": 100},
+}
+
+
+@router.get("/metrics")
+# Get per-endpoint request metrics
+# Operation: READ (GET)
+# Description: Retrieves call counts, latency and SQL statements per call of each CRUD endpoint since the server started.
+def get_metrics():
+    return FastJSONResponse(snapshot())
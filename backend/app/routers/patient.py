@@ -1,194 +1,65 @@
-from datetime import datetime
+from typing import Optional
 
-from app import database
-from app.models import (
-    BodyMeasurement,
-    Composition,
-    LabAnalyteResult,
-    LabTest,
-    Patient,
-    PatientHistory,
-    Specimen,
-)
+from app.crud import add_crud_routes, get_read_db
+from app.documents import patient_full
+from app.models import Patient
+from app.responses import FastJSONResponse
 from app.schemas import Patient as PatientSchema
-from app.schemas import PatientCreate, PatientUpdate
-from fastapi import APIRouter, Depends, HTTPException
+from app.schemas import PatientCreate, PatientSummaryPage, PatientUpdate
+from app.summary import refresh_patient_summaries, summary_page
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/patient", tags=["Patient"])
 
+BUDGETS = {
+    "/patient/summary?limit=20": {"statements": 1, "rows": 21, "ms": 100},
+    "/patient/all?limit=20": {"statements": 1, "rows": 21, "ms": 100},
+    "/patient/batch?ids=1,2,3": {"statements": 1, "rows": 3, "ms": 100},
+    "/patient/1": {"statements": 1, "rows": 1, "ms": 100},
+    "/patient/1/full": {"statements": 6, "rows": 150, "ms": 150},
+}
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+def refresh_summary(db: Session, patient, previous):
+    # Adds the summary row of a new patient and drops that of a deleted one
+    refresh_patient_summaries(db, [patient.id if patient is not None else previous["id"]])
 
-@router.post("/create", response_model=PatientSchema)
-# Create a new patient
-# Operation: CREATE
-# Description: Adds a new patient to the database with versioning.
-def create_patient(patient_in: PatientCreate, db: Session = Depends(get_db)):
-    patient = Patient(**patient_in.dict(), version=1)
-    db.add(patient)
-    db.commit()
-    db.refresh(patient)
-    return patient
 
-
-@router.get("/all", response_model=list[PatientSchema])
-# List all patients
+@router.get("/summary", response_model=PatientSummaryPage)
+# List patient summaries
 # Operation: READ (LIST)
-# Description: Retrieves all patients from the database.
-def list_patients(db: Session = Depends(get_db)):
-    return db.query(Patient).all()
-
-
-@router.get("/{patient_id}", response_model=PatientSchema)
-# Get a specific patient by ID
-# Operation: READ (GET)
-# Description: Retrieves a single patient by its ID.
-def get_patient(patient_id: int, db: Session = Depends(get_db)):
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-    return patient
-
-
-@router.put("/update/{patient_id}", response_model=PatientSchema)
-# Update a specific patient by ID
-# Operation: UPDATE
-# Description: Updates a patient and archives the previous state in the history table.
-def update_patient(patient_id: int, patient_in: PatientUpdate, db: Session = Depends(get_db)):
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-
-    # Archive current state
-    history = PatientHistory(
-        patient_id=patient.id,
-        first_name=patient.first_name,
-        last_name=patient.last_name,
-        sex=patient.sex,
-        identifier=patient.identifier,
-        version=patient.version,
-        updated_at=datetime.utcnow(),
-    )
-    db.add(history)
-
-    # Apply update
-    for field, value in patient_in.dict().items():
-        setattr(patient, field, value)
-    setattr(patient, "version", patient.version + 1)
-
-    db.commit()
-    db.refresh(patient)
-    return patient
-
-
-@router.delete("/delete/{patient_id}")
-# Delete a specific patient by ID
-# Operation: DELETE
-# Description: Deletes a patient and its associated history records.
-def delete_patient(patient_id: int, db: Session = Depends(get_db)):
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-
-    # Delete from history table
-    db.query(PatientHistory).filter(PatientHistory.patient_id == patient_id).delete()
-
-    # Delete from main table
-    db.delete(patient)
-    db.commit()
-    return {"ok": True}
+# Description: Retrieves worklist facts per patient (last encounter, abnormal results, latest vitals), one page at a time.
+def list_patient_summaries(
+    after: Optional[int] = Query(None, description="Return patients with an ID above this cursor"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db),
+):
+    return FastJSONResponse(summary_page(db, after, limit))
+
+
+# Create, list, get, update and delete patients
+add_crud_routes(
+    router,
+    Patient,
+    PatientSchema,
+    PatientCreate,
+    PatientUpdate,
+    entity="patient",
+    name="patient",
+    plural="patients",
+    label="Patient",
+    id_name="patient_id",
+    hooks=[refresh_summary],
+)
 
 
 @router.get("/{patient_id}/full")
 # Get a patient with all associated data
 # Operation: READ (GET)
 # Description: Retrieves a single patient by ID including all compositions, lab tests, specimens, and measurements.
-def get_patient_full(patient_id: int, db: Session = Depends(get_db)):
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
-    if not patient:
+def get_patient_full(patient_id: int, db: Session = Depends(get_read_db)):
+    full_data = patient_full(db, patient_id)
+    if full_data is None:
         raise HTTPException(status_code=404, detail="Patient not found")
-
-    compositions = db.query(Composition).filter(Composition.patient_id == patient.id).all()
-
-    full_data = {
-        "id": patient.id,
-        "first_name": patient.first_name,
-        "last_name": patient.last_name,
-        "sex": patient.sex,
-        "identifier": patient.identifier,
-        "version": patient.version,
-        "compositions": [],
-        "body_measurements": [],
-    }
-
-    for comp in compositions:
-        lab_tests = db.query(LabTest).filter(LabTest.composition_id == comp.id).all()
-        lab_test_data = []
-
-        for test in lab_tests:
-            specimen = db.query(Specimen).filter(Specimen.id == test.specimen_id).first()
-            analytes = (
-                db.query(LabAnalyteResult).filter(LabAnalyteResult.lab_test_id == test.id).all()
-            )
-            lab_test_data.append(
-                {
-                    "id": test.id,
-                    "loinc_code": test.loinc_code,
-                    "description": test.description,
-                    "version": test.version,
-                    "specimen": {
-                        "id": specimen.id,
-                        "type": specimen.specimen_type,
-                        "collection_time": specimen.collection_time,
-                        "snomed_code": specimen.snomed_code,
-                        "description": specimen.description,
-                        "version": specimen.version,
-                    }
-                    if specimen
-                    else None,
-                    "analytes": [
-                        {
-                            "id": a.id,
-                            "loinc_code": a.loinc_code,
-                            "value": a.value,
-                            "unit": a.unit,
-                            "reference_low": a.reference_low,
-                            "reference_high": a.reference_high,
-                            "interpretation": a.interpretation,
-                            "version": a.version,
-                        }
-                        for a in analytes
-                    ],
-                }
-            )
-
-        full_data["compositions"].append(
-            {
-                "id": comp.id,
-                "start_time": comp.start_time,
-                "version": comp.version,
-                "lab_tests": lab_test_data,
-            }
-        )
-
-    measurements = db.query(BodyMeasurement).filter(BodyMeasurement.patient_id == patient.id).all()
-    full_data["body_measurements"] = [
-        {
-            "id": m.id,
-            "record_time": m.record_time,
-            "value": m.value,
-            "unit": m.unit,
-            "snomed_code": m.snomed_code,
-            "version": m.version,
-        }
-        for m in measurements
-    ]
-
-    return full_data
+    return FastJSONResponse(full_data)
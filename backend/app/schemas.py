@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import Optional, Union
 
 from pydantic import BaseModel
 
@@ -31,6 +31,7 @@ class PatientUpdate(PatientBase):
 class Patient(PatientBase):
     id: int
     version: int
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -55,6 +56,7 @@ class CompositionUpdate(CompositionBase):
 class Composition(CompositionBase):
     id: int
     version: int
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -81,6 +83,7 @@ class SpecimenUpdate(SpecimenBase):
 class Specimen(SpecimenBase):
     id: int
     version: int
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -107,6 +110,7 @@ class LabTestUpdate(LabTestBase):
 class LabTest(LabTestBase):
     id: int
     version: int
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -136,11 +140,38 @@ class LabAnalyteResultUpdate(LabAnalyteResultBase):
 class LabAnalyteResult(LabAnalyteResultBase):
     id: int
     version: int
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class AbnormalInterpretation(str, Enum):
+    high = "H"
+    low = "L"
+
+
+class LabAnalyteWorklistItem(BaseModel):
+    id: int
+    lab_test_id: int
+    loinc_code: str
+    value: float
+    unit: str
+    reference_low: Optional[float] = None
+    reference_high: Optional[float] = None
+    interpretation: AbnormalInterpretation
+    collection_time: datetime
+    patient_id: Optional[int] = None
+    identifier: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
+
+class LabAnalyteWorklistPage(BaseModel):
+    items: list[LabAnalyteWorklistItem]
+    next_after: Optional[str] = None
+
+
 # =========================
 # BODY MEASUREMENT
 # =========================
@@ -163,6 +194,7 @@ class BodyMeasurementUpdate(BodyMeasurementBase):
 class BodyMeasurement(BodyMeasurementBase):
     id: int
     version: int
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -188,6 +220,100 @@ class ReferenceRangeUpdate(ReferenceRangeBase):
 
 class ReferenceRange(ReferenceRangeBase):
     version: int
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
+
+
+# =========================
+# PATIENT SUMMARY
+# =========================
+class PatientSummary(BaseModel):
+    patient_id: int
+    identifier: str
+    first_name: str
+    last_name: str
+    last_encounter_time: Optional[datetime] = None
+    abnormal_result_count: int
+    weight: Optional[float] = None
+    weight_unit: Optional[str] = None
+    weight_time: Optional[datetime] = None
+    height: Optional[float] = None
+    height_unit: Optional[str] = None
+    height_time: Optional[datetime] = None
+    systolic_bp: Optional[float] = None
+    systolic_bp_unit: Optional[str] = None
+    systolic_bp_time: Optional[datetime] = None
+    diastolic_bp: Optional[float] = None
+    diastolic_bp_unit: Optional[str] = None
+    diastolic_bp_time: Optional[datetime] = None
+
+
+class PatientSummaryPage(BaseModel):
+    items: list[PatientSummary]
+    next_after: Optional[int] = None
+
+
+# =========================
+# CHANGE FEED
+# =========================
+class ChangeOperation(str, Enum):
+    create = "create"
+    update = "update"
+    delete = "delete"
+
+
+class Change(BaseModel):
+    seq: int
+    entity: str
+    entity_id: Union[int, str]
+    version: Optional[int] = None
+    operation: ChangeOperation
+    changed_at: datetime
+
+
+class ChangePage(BaseModel):
+    items: list[Change]
+    next_since: int
+    has_more: bool
+
+
+# =========================
+# INGEST
+# =========================
+class IngestError(BaseModel):
+    position: str
+    resource: Optional[str] = None
+    error: str
+
+
+class IngestReport(BaseModel):
+    records: int
+    skipped: int
+    rows: dict[str, int]
+    error_count: int
+    errors: list[IngestError]
+    seconds: float
+    records_per_second: float
+
+
+# =========================
+# TRENDS AND UNITS
+# =========================
+class TrendPoint(BaseModel):
+    id: int
+    time: Optional[datetime] = None
+    value: float
+    unit: str
+    reference_low: Optional[float] = None
+    reference_high: Optional[float] = None
+    interpretation: Optional[str] = None
+
+
+class UnitStats(BaseModel):
+    unit: str
+    count: int
+    min: float
+    max: float
+    mean: float
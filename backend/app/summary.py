@@ -0,0 +1,217 @@
+import argparse
+from datetime import datetime
+
+from app.models import (
+    ABNORMAL_INTERPRETATIONS,
+    BodyMeasurement,
+    Composition,
+    LabAnalyteResult,
+    LabTest,
+    Patient,
+    PatientSummary,
+)
+from app.responses import rows_as_dicts
+from app.writer import write_queue
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+# Summary column prefix -> SNOMED CT code of the body measurement it tracks
+SUMMARY_MEASUREMENTS = {
+    "weight": "27113001",
+    "height": "50373000",
+    "systolic_bp": "271649006",
+    "diastolic_bp": "271650006",
+}
+
+# Patients refreshed per write transaction by a full rebuild
+REBUILD_CHUNK_SIZE = 500
+
+
+def _for_patients(query, column, patient_ids):
+    return query if patient_ids is None else query.where(column.in_(patient_ids))
+
+
+def summary_rows(db: Session, patient_ids=None):
+    """Compute patient_summary rows from the clinical tables.
+
+    Covers the given patients, or every patient if ``patient_ids`` is None.
+    Each fact is one grouped query, so the cost does not depend on how many
+    patients are refreshed at once.
+    """
+    now = datetime.utcnow()
+    empty = {column.name: None for column in PatientSummary.__table__.c}
+    rows = {
+        patient_id: {
+            **empty,
+            "patient_id": patient_id,
+            "abnormal_result_count": 0,
+            "refreshed_at": now,
+        }
+        for patient_id in db.execute(
+            _for_patients(select(Patient.id), Patient.id, patient_ids)
+        ).scalars()
+    }
+
+    encounters = _for_patients(
+        select(Composition.patient_id, func.max(Composition.start_time)),
+        Composition.patient_id,
+        patient_ids,
+    ).group_by(Composition.patient_id)
+    for patient_id, start_time in db.execute(encounters):
+        if patient_id in rows:
+            rows[patient_id]["last_encounter_time"] = start_time
+
+    abnormal = (
+        _for_patients(
+            select(Composition.patient_id, func.count())
+            .select_from(LabAnalyteResult)
+            .join(LabTest, LabTest.id == LabAnalyteResult.lab_test_id)
+            .join(Composition, Composition.id == LabTest.composition_id)
+            .where(LabAnalyteResult.interpretation.in_(ABNORMAL_INTERPRETATIONS)),
+            Composition.patient_id,
+            patient_ids,
+        )
+    ).group_by(Composition.patient_id)
+    for patient_id, count in db.execute(abnormal):
+        if patient_id in rows:
+            rows[patient_id]["abnormal_result_count"] = count
+
+    ranked = _for_patients(
+        select(
+            BodyMeasurement.patient_id,
+            BodyMeasurement.snomed_code,
+            BodyMeasurement.value,
+            BodyMeasurement.unit,
+            BodyMeasurement.record_time,
+            func.row_number()
+            .over(
+                partition_by=(BodyMeasurement.patient_id, BodyMeasurement.snomed_code),
+                order_by=(BodyMeasurement.record_time.desc(), BodyMeasurement.id.desc()),
+            )
+            .label("recency"),
+        ).where(BodyMeasurement.snomed_code.in_(SUMMARY_MEASUREMENTS.values())),
+        BodyMeasurement.patient_id,
+        patient_ids,
+    ).subquery()
+    prefixes = {code: prefix for prefix, code in SUMMARY_MEASUREMENTS.items()}
+    latest = select(
+        ranked.c.patient_id,
+        ranked.c.snomed_code,
+        ranked.c.value,
+        ranked.c.unit,
+        ranked.c.record_time,
+    ).where(ranked.c.recency == 1)
+    for patient_id, snomed_code, value, unit, record_time in db.execute(latest):
+        if patient_id in rows:
+            prefix = prefixes[snomed_code]
+            rows[patient_id][prefix] = value
+            rows[patient_id][f"{prefix}_unit"] = unit
+            rows[patient_id][f"{prefix}_time"] = record_time
+
+    return list(rows.values())
+
+
+def refresh_patient_summaries(db: Session, patient_ids=None):
+    """Recompute the summary rows of the given patients inside the caller's transaction.
+
+    Write handlers call this after changing anything a summary is derived
+    from, so the summary commits (or rolls back) together with the change.
+    Patients that no longer exist lose their row. ``None`` refreshes everyone.
+    """
+    if patient_ids is not None:
+        patient_ids = {patient_id for patient_id in patient_ids if patient_id is not None}
+        if not patient_ids:
+            return
+    db.flush()
+    rows = summary_rows(db, patient_ids)
+    db.execute(_for_patients(delete(PatientSummary), PatientSummary.patient_id, patient_ids))
+    if rows:
+        db.execute(insert(PatientSummary), rows)
+
+
+def patients_of_lab_tests(db: Session, lab_test_ids):
+    """IDs of the patients whose compositions contain the given lab tests"""
+    db.flush()
+    return set(
+        db.execute(
+            select(Composition.patient_id)
+            .join(LabTest, LabTest.composition_id == Composition.id)
+            .where(LabTest.id.in_([id for id in lab_test_ids if id is not None]))
+        ).scalars()
+    )
+
+
+def patients_of_compositions(db: Session, composition_ids):
+    """IDs of the patients the given compositions belong to"""
+    db.flush()
+    return set(
+        db.execute(
+            select(Composition.patient_id).where(
+                Composition.id.in_([id for id in composition_ids if id is not None])
+            )
+        ).scalars()
+    )
+
+
+def summary_page(db: Session, after=None, limit=100):
+    """One page of summaries ordered by patient ID, plus the cursor for the next page"""
+    query = (
+        select(
+            Patient.identifier,
+            Patient.first_name,
+            Patient.last_name,
+            *[column for column in PatientSummary.__table__.c if column.name != "refreshed_at"],
+        )
+        .join(Patient, Patient.id == PatientSummary.patient_id)
+        .order_by(PatientSummary.patient_id)
+        .limit(limit + 1)
+    )
+    if after is not None:
+        query = query.where(PatientSummary.patient_id > after)
+    items = rows_as_dicts(db.execute(query))
+    next_after = items[limit - 1]["patient_id"] if len(items) > limit else None
+    return {"items": items[:limit], "next_after": next_after}
+
+
+def rebuild_patient_summaries(chunk_size=REBUILD_CHUNK_SIZE):
+    """Recompute every summary from scratch, one short write transaction per chunk of patients"""
+
+    def drop_orphans(db: Session):
+        db.execute(
+            delete(PatientSummary).where(PatientSummary.patient_id.not_in(select(Patient.id)))
+        )
+
+    def refresh_chunk(db: Session, after):
+        patient_ids = (
+            db.execute(
+                select(Patient.id).where(Patient.id > after).order_by(Patient.id).limit(chunk_size)
+            )
+            .scalars()
+            .all()
+        )
+        refresh_patient_summaries(db, patient_ids)
+        return patient_ids
+
+    write_queue.run(drop_orphans)
+    after, refreshed = 0, 0
+    while True:
+        patient_ids = write_queue.run(lambda db: refresh_chunk(db, after))
+        if not patient_ids:
+            return refreshed
+        after = patient_ids[-1]
+        refreshed += len(patient_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Patient summary maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild = subcommands.add_parser("rebuild", help="recompute every patient summary")
+    rebuild.add_argument(
+        "--chunk-size",
+        type=int,
+        default=REBUILD_CHUNK_SIZE,
+        help="patients refreshed per transaction",
+    )
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        print(f"✅ Rebuilt {rebuild_patient_summaries(args.chunk_size)} patient summaries.")
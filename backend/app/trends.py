@@ -0,0 +1,114 @@
+from app.models import BodyMeasurement, Composition, LabAnalyteResult, LabTest
+from app.responses import rows_as_dicts
+from app.units import UnitConversion
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+
+def _lab_results(patient_id=None, since=None, until=None):
+    """Lab analyte results filtered by patient and collection time"""
+    query = select().select_from(LabAnalyteResult)
+    if patient_id is not None:
+        query = (
+            query.join(LabTest, LabTest.id == LabAnalyteResult.lab_test_id)
+            .join(Composition, Composition.id == LabTest.composition_id)
+            .where(Composition.patient_id == patient_id)
+        )
+    if since is not None:
+        query = query.where(LabAnalyteResult.collection_time >= since)
+    if until is not None:
+        query = query.where(LabAnalyteResult.collection_time < until)
+    return query
+
+
+def _measurements(patient_id=None, since=None, until=None):
+    """Body measurements filtered by patient and record time"""
+    query = select().select_from(BodyMeasurement)
+    if patient_id is not None:
+        query = query.where(BodyMeasurement.patient_id == patient_id)
+    if since is not None:
+        query = query.where(BodyMeasurement.record_time >= since)
+    if until is not None:
+        query = query.where(BodyMeasurement.record_time < until)
+    return query
+
+
+def lab_trend(db: Session, patient_id, loinc_code, targets, since=None, until=None, limit=1000):
+    """A patient's results for one LOINC code in collection order, converted to ``targets``"""
+    units = UnitConversion(targets, LabAnalyteResult.unit, LabAnalyteResult.loinc_code)
+    query = (
+        _lab_results(patient_id, since, until)
+        .add_columns(
+            LabAnalyteResult.id,
+            LabAnalyteResult.collection_time.label("time"),
+            units.value(LabAnalyteResult.value),
+            units.unit(),
+            units.value(LabAnalyteResult.reference_low),
+            units.value(LabAnalyteResult.reference_high),
+            LabAnalyteResult.interpretation,
+        )
+        .where(LabAnalyteResult.loinc_code == loinc_code)
+        .order_by(LabAnalyteResult.collection_time, LabAnalyteResult.id)
+        .limit(limit)
+    )
+    return rows_as_dicts(db.execute(query))
+
+
+def measurement_trend(
+    db: Session, patient_id, snomed_code, targets, since=None, until=None, limit=1000
+):
+    """A patient's measurements for one SNOMED CT code in time order, converted to ``targets``"""
+    units = UnitConversion(targets, BodyMeasurement.unit, BodyMeasurement.snomed_code)
+    query = (
+        _measurements(patient_id, since, until)
+        .add_columns(
+            BodyMeasurement.id,
+            BodyMeasurement.record_time.label("time"),
+            units.value(BodyMeasurement.value),
+            units.unit(),
+        )
+        .where(BodyMeasurement.snomed_code == snomed_code)
+        .order_by(BodyMeasurement.record_time, BodyMeasurement.id)
+        .limit(limit)
+    )
+    return rows_as_dicts(db.execute(query))
+
+
+def _stats(db: Session, query, units, value_column):
+    """count / min / max / mean per (converted) unit, aggregated in the database"""
+    value = units.value(value_column)
+    unit = units.unit()
+    query = (
+        query.add_columns(
+            unit,
+            func.count().label("count"),
+            func.min(value).label("min"),
+            func.max(value).label("max"),
+            func.avg(value).label("mean"),
+        )
+        # The CASE itself, not its label, which SQLite would take for the unit column
+        .group_by(unit.element)
+        .order_by(func.count().desc())
+    )
+    return rows_as_dicts(db.execute(query))
+
+
+def lab_stats(db: Session, loinc_code, targets, patient_id=None, since=None, until=None):
+    """Aggregates of one LOINC code's results, one group per unit after conversion.
+
+    Results that convert to the requested unit are aggregated together; any
+    left in a unit without a conversion get a group of their own rather
+    than being mixed in.
+    """
+    units = UnitConversion(targets, LabAnalyteResult.unit, LabAnalyteResult.loinc_code)
+    query = _lab_results(patient_id, since, until).where(LabAnalyteResult.loinc_code == loinc_code)
+    return _stats(db, query, units, LabAnalyteResult.value)
+
+
+def measurement_stats(db: Session, snomed_code, targets, patient_id=None, since=None, until=None):
+    """Aggregates of one SNOMED CT code's body measurements, one group per unit after conversion"""
+    units = UnitConversion(targets, BodyMeasurement.unit, BodyMeasurement.snomed_code)
+    query = _measurements(patient_id, since, until).where(
+        BodyMeasurement.snomed_code == snomed_code
+    )
+    return _stats(db, query, units, BodyMeasurement.value)
@@ -0,0 +1,234 @@
+from itertools import product
+
+from sqlalchemy import and_, case, literal
+
+# Units by dimension -> (factor, offset) taking a value to the dimension's base
+# unit: base = value * factor + offset
+DIMENSIONS = {
+    "mass concentration": {
+        "g/L": (1.0, 0.0),
+        "g/dL": (10.0, 0.0),
+        "mg/dL": (0.01, 0.0),
+        "mg/L": (0.001, 0.0),
+        "µg/L": (1e-6, 0.0),
+    },
+    "substance concentration": {
+        "mol/L": (1.0, 0.0),
+        "mmol/L": (1e-3, 0.0),
+        "µmol/L": (1e-6, 0.0),
+        "nmol/L": (1e-9, 0.0),
+    },
+    "mass": {
+        "kg": (1.0, 0.0),
+        "g": (1e-3, 0.0),
+        "lb": (0.45359237, 0.0),
+        "oz": (0.028349523125, 0.0),
+    },
+    "length": {
+        "m": (1.0, 0.0),
+        "cm": (0.01, 0.0),
+        "mm": (0.001, 0.0),
+        "in": (0.0254, 0.0),
+        "ft": (0.3048, 0.0),
+    },
+    "pressure": {
+        "mmHg": (1.0, 0.0),
+        "kPa": (1 / 0.133322387415, 0.0),
+    },
+    "temperature": {
+        "°C": (1.0, 0.0),
+        "°F": (5 / 9, -32 * 5 / 9),
+        "K": (1.0, -273.15),
+    },
+    "fraction": {
+        "1": (1.0, 0.0),
+        "L/L": (1.0, 0.0),
+        "%": (0.01, 0.0),
+    },
+    "number concentration": {
+        "10^9/L": (1.0, 0.0),
+        "10^12/L": (1000.0, 0.0),
+        "/µL": (1e-3, 0.0),
+    },
+}
+
+# Other spellings (UCUM codes, ASCII "u" for micro, ...) -> the names above
+ALIASES = {
+    "umol/L": "µmol/L",
+    "μmol/L": "µmol/L",
+    "ug/L": "µg/L",
+    "μg/L": "µg/L",
+    "mg/dl": "mg/dL",
+    "g/dl": "g/dL",
+    "mmol/l": "mmol/L",
+    "umol/l": "µmol/L",
+    "[lb_av]": "lb",
+    "lbs": "lb",
+    "[oz_av]": "oz",
+    "[in_i]": "in",
+    "[ft_i]": "ft",
+    "mm[Hg]": "mmHg",
+    "C": "°C",
+    "Cel": "°C",
+    "degC": "°C",
+    "F": "°F",
+    "[degF]": "°F",
+    "degF": "°F",
+    "10*9/L": "10^9/L",
+    "x10E9/L": "10^9/L",
+    "10*12/L": "10^12/L",
+    "x10E12/L": "10^12/L",
+    "/uL": "/µL",
+}
+
+# Molar mass (g/mol) of the analyte a LOINC code measures, so mass and substance
+# concentrations convert into each other
+MOLAR_MASS = {
+    "2345-7": 180.156,  # Glucose
+    "2093-3": 386.654,  # Cholesterol
+    "2085-9": 386.654,  # HDL cholesterol
+    "18262-6": 386.654,  # LDL cholesterol (direct)
+    "13457-7": 386.654,  # LDL cholesterol (calculated)
+    "2571-8": 885.7,  # Triglyceride
+    "1975-2": 584.66,  # Bilirubin, total
+    "2160-0": 113.12,  # Creatinine
+    "3094-0": 28.014,  # Urea nitrogen
+    "2823-3": 39.098,  # Potassium
+    "2951-2": 22.99,  # Sodium
+    "2075-0": 35.45,  # Chloride
+    "17861-6": 40.078,  # Calcium
+    "718-7": 16114.5,  # Hemoglobin (per heme monomer)
+}
+
+UNIT_DESCRIPTION = (
+    "Convert values to this unit (e.g. mg/dL, mmol/L, lb, °F) where the registry has a "
+    "conversion; others keep their own unit"
+)
+
+_DIMENSION = {unit: dimension for dimension, units in DIMENSIONS.items() for unit in units}
+_SPELLINGS = {unit: [unit] for unit in _DIMENSION}
+for _alias, _unit in ALIASES.items():
+    _SPELLINGS[_unit].append(_alias)
+
+
+def canonical(unit):
+    """The registry name of ``unit``, or ``unit`` itself if it is not in the registry"""
+    return ALIASES.get(unit, unit)
+
+
+def _factors():
+    """Every conversion the registry knows, as ``{(code, from, to): (factor, offset)}``.
+
+    ``code`` is None for conversions that hold for any analyte (within one
+    dimension); mass <-> substance concentrations are listed per LOINC code.
+    """
+    factors = {}
+    for units in DIMENSIONS.values():
+        for source, target in product(units, repeat=2):
+            (a, b), (c, d) = units[source], units[target]
+            # target = (source * a + b - d) / c
+            factors[None, source, target] = (a / c, (b - d) / c)
+    mass, substance = DIMENSIONS["mass concentration"], DIMENSIONS["substance concentration"]
+    for code, molar_mass in MOLAR_MASS.items():
+        for source, target in product(mass, substance):
+            # g/L -> mol/L is a division by the molar mass
+            factor = mass[source][0] / molar_mass / substance[target][0]
+            factors[code, source, target] = (factor, 0.0)
+            factors[code, target, source] = (1 / factor, 0.0)
+    return factors
+
+
+# Precomputed once, so a request only looks factors up
+FACTORS = _factors()
+
+
+def conversion(unit, target, code=None):
+    """``(factor, offset)`` taking ``unit`` to ``target`` for analyte ``code``, or None"""
+    key = (canonical(unit), canonical(target))
+    return FACTORS.get((None, *key)) or FACTORS.get((code, *key))
+
+
+def convert(value, unit, target, code=None):
+    """Convert one value; raises ValueError if there is no conversion"""
+    factors = conversion(unit, target, code)
+    if factors is None:
+        raise ValueError(f"Cannot convert {unit} to {target}" + (f" for {code}" if code else ""))
+    return value * factors[0] + factors[1]
+
+
+def parse_targets(values):
+    """``?unit=`` values as ``{code or None: unit}``.
+
+    ``mg/dL`` converts everything that can be converted to mg/dL;
+    ``2345-7:mg/dL`` only that code (and wins over a plain unit). Raises
+    ValueError for a unit the registry does not know.
+    """
+    targets = {}
+    for value in values or []:
+        code, _, unit = value.rpartition(":")
+        unit = canonical(unit.strip())
+        if unit not in _DIMENSION:
+            known = ", ".join(sorted(_DIMENSION))
+            raise ValueError(f"Unknown unit {unit!r}; known units: {known}")
+        targets[code.strip() or None] = unit
+    return targets
+
+
+def _scaled(column, factor, offset):
+    if factor != 1.0:
+        column = column * factor
+    return column + offset if offset else column
+
+
+class UnitConversion:
+    """SQL expressions converting a whole result set at once.
+
+    Built from ``?unit=`` targets and the unit / code columns of the rows,
+    :meth:`value` wraps any value column (the value itself, reference range
+    bounds) in one ``CASE`` over the precomputed factors, so the database
+    converts every row as it reads it. Rows without a conversion keep
+    their value and unit.
+    """
+
+    def __init__(self, targets, unit_column, code_column):
+        self.unit_column = unit_column
+        self.whens = []
+        # Targets for one code first, so they win over a plain unit
+        for code, target in sorted(targets.items(), key=lambda item: item[0] is None):
+            pairs = {}
+            for (factor_code, source, to), factors in FACTORS.items():
+                if to != target or source == target:
+                    continue
+                if factor_code is None or code in (None, factor_code):
+                    pairs.setdefault((code or factor_code, source), factors)
+            for (pair_code, source), factors in pairs.items():
+                condition = unit_column.in_(_SPELLINGS[source])
+                if pair_code is not None:
+                    condition = and_(code_column == pair_code, condition)
+                self.whens.append((condition, factors, target))
+            # Already in the target unit (in any spelling)
+            condition = unit_column.in_(_SPELLINGS[target])
+            if code is not None:
+                condition = and_(code_column == code, condition)
+            self.whens.append((condition, (1.0, 0.0), target))
+
+    def value(self, column, label=None):
+        if not self.whens:
+            return column.label(label or column.key)
+        expression = case(
+            *[
+                (condition, _scaled(column, factor, offset))
+                for condition, (factor, offset), _ in self.whens
+            ],
+            else_=column,
+        )
+        return expression.label(label or column.key)
+
+    def unit(self, label="unit"):
+        if not self.whens:
+            return self.unit_column.label(label)
+        expression = case(
+            *[(condition, literal(target)) for condition, _, target in self.whens],
+            else_=self.unit_column,
+        )
+        return expression.label(label)
@@ -0,0 +1,133 @@
+from datetime import datetime
+
+from app.models import (
+    ABNORMAL_INTERPRETATIONS,
+    Composition,
+    LabAnalyteResult,
+    LabTest,
+    Patient,
+    Specimen,
+)
+from app.responses import rows_as_dicts
+from sqlalchemy import bindparam, select, tuple_, update
+from sqlalchemy.orm import Session
+
+
+def collection_time_for(db: Session, lab_test_id):
+    """Collection time of the specimen a lab test was run on"""
+    return db.execute(
+        select(Specimen.collection_time)
+        .join(LabTest, LabTest.specimen_id == Specimen.id)
+        .where(LabTest.id == lab_test_id)
+    ).scalar()
+
+
+def refresh_collection_times(db: Session, lab_test_ids=None, specimen_ids=None, missing_only=False):
+    """Recopy specimen collection times onto the analyte results of the given lab tests/specimens.
+
+    With neither given, every result is refreshed (or, with ``missing_only``,
+    every result that has none yet).
+
+    collection_time is internal (no API response includes it) and the specimen or
+    lab test change that triggers a refresh has its own change feed entry, so
+    the results keep their ``version`` and ``updated_at``: this is not a
+    change ``/changes`` or ``updated_since`` consumers could see.
+    """
+    db.flush()
+    statement = update(LabAnalyteResult).values(
+        collection_time=select(Specimen.collection_time)
+        .join(LabTest, LabTest.specimen_id == Specimen.id)
+        .where(LabTest.id == LabAnalyteResult.lab_test_id)
+        .scalar_subquery(),
+        # Overrides the column's onupdate
+        updated_at=LabAnalyteResult.updated_at,
+    )
+    if lab_test_ids is not None:
+        statement = statement.where(LabAnalyteResult.lab_test_id.in_(lab_test_ids))
+    if specimen_ids is not None:
+        statement = statement.where(
+            LabAnalyteResult.lab_test_id.in_(
+                select(LabTest.id).where(LabTest.specimen_id.in_(specimen_ids))
+            )
+        )
+    if missing_only:
+        statement = statement.where(LabAnalyteResult.collection_time.is_(None))
+    db.execute(statement.execution_options(synchronize_session=False))
+
+
+def parse_cursor(cursor):
+    """Split an ``<collection time>|<id>`` worklist cursor; raises ValueError if malformed"""
+    collection_time, _, result_id = cursor.rpartition("|")
+    return datetime.fromisoformat(collection_time), int(result_id)
+
+
+def abnormal_results_page(
+    db: Session,
+    interpretations=ABNORMAL_INTERPRETATIONS,
+    loinc_code=None,
+    since=None,
+    until=None,
+    after=None,
+    limit=100,
+):
+    """One page of abnormal results, newest collection first, plus the cursor for the next page.
+
+    The page is picked from the partial indexes over abnormal results with
+    keyset pagination, so its cost depends on ``limit`` only; patient details
+    are joined onto that page afterwards.
+    """
+    result = LabAnalyteResult.__table__.c
+    # Repeat the indexes' WHERE clause verbatim (rendered inline, not as bound
+    # parameters) so SQLite can prove the partial indexes cover this query
+    page = (
+        select(result.id, result.collection_time)
+        .where(
+            result.interpretation.in_(
+                bindparam("abnormal", ABNORMAL_INTERPRETATIONS, literal_execute=True)
+            ),
+            result.collection_time.is_not(None),
+        )
+        .order_by(result.collection_time.desc(), result.id.desc())
+        .limit(limit + 1)
+    )
+    if set(interpretations) != set(ABNORMAL_INTERPRETATIONS):
+        page = page.where(result.interpretation.in_(interpretations))
+    if loinc_code is not None:
+        page = page.where(result.loinc_code == loinc_code)
+    if since is not None:
+        page = page.where(result.collection_time >= since)
+    if until is not None:
+        page = page.where(result.collection_time < until)
+    if after is not None:
+        page = page.where(tuple_(result.collection_time, result.id) < tuple_(*after))
+    page = page.subquery()
+
+    query = (
+        select(
+            result.id,
+            result.lab_test_id,
+            result.loinc_code,
+            result.value,
+            result.unit,
+            result.reference_low,
+            result.reference_high,
+            result.interpretation,
+            result.collection_time,
+            Composition.patient_id,
+            Patient.identifier,
+            Patient.first_name,
+            Patient.last_name,
+        )
+        .select_from(page)
+        .join(LabAnalyteResult, LabAnalyteResult.id == page.c.id)
+        .outerjoin(LabTest, LabTest.id == LabAnalyteResult.lab_test_id)
+        .outerjoin(Composition, Composition.id == LabTest.composition_id)
+        .outerjoin(Patient, Patient.id == Composition.patient_id)
+        .order_by(page.c.collection_time.desc(), page.c.id.desc())
+    )
+    items = rows_as_dicts(db.execute(query))
+    next_after = None
+    if len(items) > limit:
+        last = items[limit - 1]
+        next_after = f"{last['collection_time'].isoformat()}|{last['id']}"
+    return {"items": items[:limit], "next_after": next_after}
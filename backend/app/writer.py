@@ -0,0 +1,136 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+from app import database
+from app.filelock import file_lock
+
+# Group commit: wait up to this many milliseconds after a write arrives for
+# more writes to share its transaction (0 disables grouping)
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("WRITE_GROUP_COMMIT_WINDOW_MS", "0"))
+# ... but never put more than this many writes in one transaction
+GROUP_COMMIT_MAX_WRITES = int(os.getenv("WRITE_GROUP_COMMIT_MAX_WRITES", "100"))
+
+
+class WriteQueue:
+    """Funnel every write transaction through one dedicated thread.
+
+    Handlers submit a function taking a session; the writer thread runs it,
+    commits, and hands the result (or exception) back through a future. Each
+    transaction also holds a cross-process file lock, so with several uvicorn
+    workers there is still only one SQLite writer at a time and writers queue
+    up instead of failing with ``database is locked``.
+
+    With group commit enabled, writes that arrive within ``window_ms`` of each
+    other share one transaction, and so one fsync. In a group every write runs
+    in its own SAVEPOINT, so a failing write is rolled back and reported to its
+    caller alone while the others in the group still commit.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        lock_name="write",
+        window_ms=GROUP_COMMIT_WINDOW_MS,
+        max_writes=GROUP_COMMIT_MAX_WRITES,
+    ):
+        self._session_factory = session_factory
+        self._lock_name = lock_name
+        self.window = window_ms / 1000
+        self.max_writes = max_writes if window_ms > 0 else 1
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Finish the queued writes and stop the writer thread"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._queue.put(None)
+                self._thread.join()
+            self._thread = None
+
+    def submit(self, work) -> Future:
+        """Queue ``work(session)`` to run in its own transaction (or savepoint)"""
+        self.start()
+        future = Future()
+        self._queue.put((work, future))
+        return future
+
+    def run(self, work):
+        """Run ``work(session)`` on the writer thread and wait for its result"""
+        return self.submit(work).result()
+
+    def _new_session(self):
+        if self._session_factory is not None:
+            return self._session_factory()
+        # Results are handed to other threads after commit, so keep them loaded
+        return database.SessionLocal(expire_on_commit=False)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            group = [item]
+            deadline = time.monotonic() + self.window
+            while len(group) < self.max_writes:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = (
+                        self._queue.get(timeout=timeout)
+                        if timeout > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                group.append(item)
+            self._commit(group)
+
+    def _commit(self, group):
+        done = []
+        with file_lock(database.lock_path(self._lock_name)):
+            session = self._new_session()
+            # A savepoint keeps one failed write from undoing the others in its
+            # group; a write on its own can roll back the whole transaction instead
+            shared = len(group) > 1
+            try:
+                for work, future in group:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with session.begin_nested() if shared else nullcontext():
+                            result = work(session)
+                    except Exception as exc:
+                        if not shared:
+                            session.rollback()
+                        future.set_exception(exc)
+                    else:
+                        done.append((future, result))
+                session.commit()
+            except BaseException as exc:
+                session.rollback()
+                for _, future in group:
+                    if not future.done():
+                        future.set_exception(exc)
+            else:
+                for future, result in done:
+                    future.set_result(result)
+            finally:
+                session.close()
+
+
+write_queue = WriteQueue()
@@ -0,0 +1,47 @@
+"""Batch fetch benchmark: resolving N related records one GET at a time vs one batch request.
+
+Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_batch [--patients N] [--ids 10,100,1000]
+"""
+
+import argparse
+
+from benchmarks.common import seed_synthetic, summarize, temp_database_url, timed, use_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--ids", default="10,100,1000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    url = temp_database_url("batch")
+    seed_synthetic(url, patients=args.patients)
+    use_database(url)
+
+    from app.main import app
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        for count in [int(size) for size in args.ids.split(",")]:
+            ids = list(range(1, count + 1))
+
+            def one_by_one():
+                for id in ids:
+                    client.get(f"/specimen/{id}").raise_for_status()
+
+            def batch():
+                client.get("/specimen/batch", params={"ids": ",".join(map(str, ids))})
+
+            def batch_post():
+                client.post("/specimen/batch", json={"ids": ids})
+
+            print(summarize(f"{count} specimens, one GET each", timed(one_by_one, args.repeat)))
+            print(summarize(f"{count} specimens, GET /batch", timed(batch, args.repeat)))
+            print(summarize(f"{count} specimens, POST /batch", timed(batch_post, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""FHIR export benchmark: /patient/{id}/full per patient vs the NDJSON export.
+
+The baseline fetches every patient's ``/patient/{id}/full`` document from a
+running server, the way a client converting to FHIR has to. The export then
+writes the same patients as NDJSON files with ``python -m app.export`` for
+each ``--workers`` count, reporting time and the peak resident memory of the
+export processes. Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_export [--patients 2000] [--workers 1,2,4]
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+
+from benchmarks.common import running_server, seed_synthetic, temp_database_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--workers", default="1,2,4")
+    args = parser.parse_args()
+
+    url = temp_database_url("export")
+    counts = seed_synthetic(url, patients=args.patients)
+    print(f"Dataset: {sum(counts.values())} rows, {args.patients} patients")
+
+    with running_server(url) as base_url:
+        start = time.perf_counter()
+        size = 0
+        for patient_id in range(1, args.patients + 1):
+            size += len(urlopen(f"{base_url}/patient/{patient_id}/full").read())
+        elapsed = time.perf_counter() - start
+    print(f"{'GET /patient/{id}/full each':<32} {elapsed:8.2f} s   {size / 1e6:7.1f} MB of JSON")
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for workers in [int(value) for value in args.workers.split(",")]:
+        directory = tempfile.mkdtemp(prefix="ehr-export-")
+        command = [sys.executable, "-m", "app.export", directory, "--workers", str(workers)]
+        start = time.perf_counter()
+        subprocess.run(
+            command,
+            cwd=backend_dir,
+            env=dict(os.environ, DB_PATH=url),
+            check=True,
+            capture_output=True,
+        )
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        peak_kib = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        label = f"app.export, {workers} workers"
+        print(
+            f"{label:<32} {elapsed:8.2f} s   {size / 1e6:7.1f} MB of NDJSON"
+            f"   peak RSS so far {peak_kib / 1024:.0f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Group commit benchmark: create throughput vs latency at several window sizes.
+
+Concurrent client threads push analyte-result inserts straight into a
+WriteQueue (no HTTP), so the numbers isolate transaction and fsync cost.
+Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_group_commit [--clients N] [--windows 0,1,2,5]
+"""
+
+import argparse
+import threading
+import time
+
+from benchmarks.common import seed_synthetic, summarize, temp_database_url, use_database
+
+
+def run(write_queue, clients, duration):
+    from app.models import LabAnalyteResult
+
+    stop = threading.Event()
+    latencies = []
+
+    def client(seed):
+        def create(db):
+            result = LabAnalyteResult(
+                lab_test_id=1, loinc_code="718-7", value=14.0 + seed / 100, unit="g/dL", version=1
+            )
+            db.add(result)
+            return result
+
+        while not stop.is_set():
+            start = time.perf_counter()
+            write_queue.run(create)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--windows", default="0,1,2,5,10")
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    url = temp_database_url("group-commit")
+    seed_synthetic(url, patients=10)
+    use_database(url)
+
+    from app import database
+    from app.writer import WriteQueue
+    from sqlalchemy import event
+
+    commits = []
+    event.listen(database.engine, "commit", lambda connection: commits.append(1))
+
+    for window in [float(value) for value in args.windows.split(",")]:
+        write_queue = WriteQueue(window_ms=window)
+        commits.clear()
+        latencies = run(write_queue, args.clients, args.duration)
+        write_queue.stop()
+        print(
+            summarize(
+                f"window {window:4.1f} ms: {len(latencies) / args.duration:7.0f} rows/s, "
+                f"{len(latencies) / max(len(commits), 1):5.1f} rows/commit",
+                latencies,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
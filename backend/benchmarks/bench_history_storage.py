@@ -0,0 +1,139 @@
+"""History storage benchmark: full-row history tables vs the delta format.
+
+Builds a dataset where every lab analyte result and body measurement has been
+updated ``--versions`` times (only the value and interpretation change, as
+with corrected results), stores that history as full rows, then converts it
+with ``python -m app.history convert``'s code path. Reports the database size
+after VACUUM and the latency of rebuilding versions in both formats. Run from
+the ``backend`` directory::
+
+    python -m benchmarks.bench_history_storage [--patients N] [--versions N]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import (
+    seed_synthetic,
+    summarize,
+    synthetic_rows,
+    temp_database_url,
+    timed,
+    use_database,
+)
+
+
+def history_rows(rows, versions, seed=7):
+    """Full history rows for ``versions - 1`` past updates of every analyte and measurement"""
+    rng = random.Random(seed)
+    updated = datetime(2025, 6, 1, 8, 0, 0)
+    history = {"lab_analyte_result_history": [], "body_measurement_history": []}
+
+    for number, result in enumerate(rows["lab_analyte_result"], start=1):
+        for version in range(1, versions):
+            value = round(result["value"] * rng.uniform(0.9, 1.1), 2)
+            history["lab_analyte_result_history"].append(
+                {
+                    "lab_analyte_result_id": result["id"],
+                    **{key: result[key] for key in ("lab_test_id", "loinc_code", "unit")},
+                    "value": value,
+                    "reference_low": result["reference_low"],
+                    "reference_high": result["reference_high"],
+                    "interpretation": "L"
+                    if value < result["reference_low"]
+                    else "H"
+                    if value > result["reference_high"]
+                    else "N",
+                    "version": version,
+                    "updated_at": updated + timedelta(minutes=number + version),
+                }
+            )
+    for number, measurement in enumerate(rows["body_measurement"], start=1):
+        for version in range(1, versions):
+            history["body_measurement_history"].append(
+                {
+                    "body_measurement_id": number,
+                    **{
+                        key: measurement[key]
+                        for key in ("patient_id", "record_time", "unit", "snomed_code")
+                    },
+                    "value": round(measurement["value"] * rng.uniform(0.98, 1.02), 1),
+                    "version": version,
+                    "updated_at": updated + timedelta(minutes=number + version),
+                }
+            )
+    return history
+
+
+def database_size(path):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    connection.execute("VACUUM")
+    connection.close()
+    return os.path.getsize(path)
+
+
+def measure(db, entity, ids, versions, rng):
+    from app.history import get_version, get_versions
+
+    single = timed(lambda: get_version(db, entity, rng.choice(ids), rng.randrange(1, versions)))
+    every = timed(lambda: get_versions(db, entity, rng.choice(ids), archived=False))
+    return single, every
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--versions", type=int, default=20)
+    args = parser.parse_args()
+
+    url = temp_database_url("history-storage")
+    seed_synthetic(url, patients=args.patients)
+    use_database(url)
+
+    from app import database, history, models
+    from sqlalchemy import func, insert, select, update
+
+    rows = synthetic_rows(patients=args.patients)
+    with database.engine.begin() as connection:
+        for name, table_rows in history_rows(rows, args.versions).items():
+            connection.execute(insert(models.Base.metadata.tables[name]), table_rows)
+        for model in (models.LabAnalyteResult, models.BodyMeasurement):
+            connection.execute(update(model).values(version=args.versions))
+
+    with database.engine.connect() as connection:
+        archived = sum(
+            connection.execute(select(func.count()).select_from(model)).scalar()
+            for model in (models.LabAnalyteResultHistory, models.BodyMeasurementHistory)
+        )
+    print(f"{archived} archived versions, {args.versions} versions per record")
+
+    rng = random.Random(1)
+    ids = [row["id"] for row in rows["lab_analyte_result"]]
+    reports = []
+    for label in ("full", "delta"):
+        if label == "delta":
+            start = time.perf_counter()
+            converted = history.convert_history(chunk_size=500)
+            elapsed = time.perf_counter() - start
+            history.write_queue.stop()
+            print(f"converted {sum(converted.values())} rows in {elapsed:.1f} s")
+        size = database_size(database.engine.url.database)
+        db = database.ReadSessionLocal()
+        single, every = measure(db, "lab_analyte_result", ids, args.versions, rng)
+        db.close()
+        reports.append((label, size, single, every))
+
+    full_size = reports[0][1]
+    for label, size, single, every in reports:
+        print(f"{label:<6} database {size / 2**20:8.2f} MiB ({size / full_size:6.1%} of full)")
+        print(summarize(f"{label:<6} one version", single))
+        print(summarize(f"{label:<6} all {args.versions} versions", every))
+
+
+if __name__ == "__main__":
+    main()
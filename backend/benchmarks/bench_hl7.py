@@ -0,0 +1,188 @@
+"""HL7 v2 ingest benchmark: ORU^R01 messages per second, native vs one POST per OBX.
+
+Turns the synthetic dataset into ORU^R01 messages (PID, OBR, one OBX per
+analyte result, SPM), one per lab test, and measures:
+
+* ``python -m app.hl7 load`` on a file holding all of them,
+* the MLLP listener (``python -m app.hl7 serve``) with 1 and ``--senders``
+  concurrent connections, each waiting for its ACK before sending the next
+  message, as analyzers do,
+* the old converter path for ``--rest-messages`` messages: one
+  ``POST /lab_analyte/create`` per OBX against a running server.
+
+Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_hl7 [--patients 500] [--senders 8]
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.request import Request, urlopen
+
+from benchmarks.common import (
+    free_port,
+    running_server,
+    seed_synthetic,
+    synthetic_rows,
+    temp_database_url,
+)
+
+
+def timestamp(value):
+    return value.strftime("%Y%m%d%H%M%S")
+
+
+def oru_messages(rows):
+    """One ORU^R01 per lab test of the synthetic rows"""
+    patients = {row["id"]: row for row in rows["patient"]}
+    compositions = {row["id"]: row for row in rows["composition"]}
+    specimens = {row["id"]: row for row in rows["specimen"]}
+    analytes = {}
+    for row in rows["lab_analyte_result"]:
+        analytes.setdefault(row["lab_test_id"], []).append(row)
+
+    for lab_test in rows["lab_test"]:
+        composition = compositions[lab_test["composition_id"]]
+        patient = patients[composition["patient_id"]]
+        specimen = specimens[lab_test["specimen_id"]]
+        sex = "M" if patient["sex"] == "male" else "F"
+        spm = ["SPM", "1", f"SP{specimen['id']}", ""]
+        spm.append(f"{specimen['snomed_code']}^{specimen['specimen_type']}^SCT")
+        spm += [""] * 12 + [timestamp(specimen["collection_time"])]
+        segments = [
+            "MSH|^~\\&|ANALYZER|LAB|EHR|HOSPITAL|"
+            f"{timestamp(composition['start_time'])}||ORU^R01^ORU_R01|MSG{lab_test['id']}|P|2.5.1",
+            f"PID|1||{patient['identifier']}^^^HOSPITAL^MR||"
+            f"{patient['last_name']}^{patient['first_name']}|||{sex}",
+            f"OBR|1|||{lab_test['loinc_code']}^{lab_test['description']}^LN|||"
+            f"{timestamp(composition['start_time'])}",
+        ]
+        for number, analyte in enumerate(analytes.get(lab_test["id"], []), 1):
+            segments.append(
+                f"OBX|{number}|NM|{analyte['loinc_code']}^^LN||{analyte['value']}|"
+                f"{analyte['unit']}^^UCUM|{analyte['reference_low']}-{analyte['reference_high']}|"
+                f"{analyte['interpretation'] or ''}|||F"
+            )
+        segments.append("|".join(spm))
+        yield "\r".join(segments) + "\r"
+
+
+def send_messages(port, messages, senders):
+    """Send ``messages`` over ``senders`` MLLP connections; returns (seconds, ACK codes)"""
+    codes = []
+
+    def sender(part):
+        with socket.create_connection(("127.0.0.1", port)) as sock:
+            for message in part:
+                sock.sendall(b"\x0b" + message.encode() + b"\x1c\r")
+                reply = b""
+                while not reply.endswith(b"\x1c\r"):
+                    reply += sock.recv(4096)
+                codes.append(reply.split(b"MSA|")[1][:2].decode())
+
+    threads = [
+        threading.Thread(target=sender, args=(messages[index::senders],))
+        for index in range(senders)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, codes
+
+
+def mllp_rate(backend_dir, messages, senders):
+    port = free_port()
+    env = dict(os.environ, DB_PATH=temp_database_url("hl7-mllp"))
+    command = [sys.executable, "-m", "app.hl7", "serve", "--port", str(port)]
+    process = subprocess.Popen(
+        command, cwd=backend_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        seconds, codes = send_messages(port, messages, senders)
+    finally:
+        process.terminate()
+        process.wait()
+    rejected = len(codes) - codes.count("AA")
+    return len(messages) / seconds, rejected
+
+
+def rest_rate(messages):
+    """Messages per second when every OBX becomes one POST /lab_analyte/create"""
+    url = temp_database_url("hl7-rest")
+    seed_synthetic(url, patients=1)
+    with running_server(url) as base_url:
+        start = time.perf_counter()
+        for message in messages:
+            for segment in message.split("\r"):
+                if not segment.startswith("OBX"):
+                    continue
+                fields = segment.split("|")
+                body = {
+                    "lab_test_id": 1,
+                    "loinc_code": fields[3].split("^")[0],
+                    "value": float(fields[5]),
+                    "unit": fields[6].split("^")[0],
+                }
+                request = Request(
+                    f"{base_url}/lab_analyte/create",
+                    data=json.dumps(body).encode(),
+                    headers={"Content-Type": "application/json"},
+                )
+                urlopen(request).read()
+        return len(messages) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--senders", type=int, default=8)
+    parser.add_argument("--mllp-messages", type=int, default=2000)
+    parser.add_argument("--rest-messages", type=int, default=100)
+    args = parser.parse_args()
+
+    messages = list(oru_messages(synthetic_rows(patients=args.patients)))
+    path = os.path.join(tempfile.mkdtemp(prefix="ehr-hl7-"), "results.hl7")
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write("\n".join(messages))
+    print(f"Messages: {len(messages)} ORU^R01, {os.path.getsize(path) / 1e6:.1f} MB")
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DB_PATH=temp_database_url("hl7-file"))
+    output = subprocess.run(
+        [sys.executable, "-m", "app.hl7", "load", path],
+        cwd=backend_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    print("File: " + (output.stdout.splitlines() or [output.stderr.rstrip()])[0])
+
+    sample = messages[: args.mllp_messages]
+    for senders in sorted({1, args.senders}):
+        rate, rejected = mllp_rate(backend_dir, sample, senders)
+        print(f"MLLP, {senders} senders: {rate:.0f} messages/s ({rejected} not AA)")
+
+    rate = rest_rate(messages[: args.rest_messages])
+    print(f"REST, one POST per OBX: {rate:.1f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
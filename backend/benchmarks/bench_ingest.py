@@ -0,0 +1,194 @@
+"""FHIR bulk ingest benchmark: bulk ingest CLI vs one REST call per row.
+
+Writes the synthetic dataset as one FHIR Bundle (Patient, Specimen,
+Observation and DiagnosticReport entries plus vital-signs Observations) and
+ingests it into an empty database with ``python -m app.ingest``, reporting
+its rows per second and peak resident memory against the file size. For
+comparison, ``--rest-rows`` analyte results are then created one
+``POST /lab_analyte/create`` at a time against a running server. Run from
+the ``backend`` directory::
+
+    python -m benchmarks.bench_ingest [--patients 2000]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import Request, urlopen
+
+from benchmarks.common import (
+    running_server,
+    seed_synthetic,
+    synthetic_rows,
+    temp_database_url,
+)
+
+
+def bundle_entries(rows):
+    """FHIR Bundle entries for the synthetic rows, a patient's resources together"""
+    from app import fhir
+
+    def instant(value):
+        return value.isoformat() + "Z"
+
+    def loinc(code):
+        return {"coding": [{"system": fhir.LOINC, "code": code}]}
+
+    specimens = {row["id"]: row for row in rows["specimen"]}
+    lab_tests = {}
+    for row in rows["lab_test"]:
+        lab_tests.setdefault(row["composition_id"], []).append(row)
+    analytes = {}
+    for row in rows["lab_analyte_result"]:
+        analytes.setdefault(row["lab_test_id"], []).append(row)
+    compositions, measurements = {}, {}
+    for row in rows["composition"]:
+        compositions.setdefault(row["patient_id"], []).append(row)
+    for row in rows["body_measurement"]:
+        measurements.setdefault(row["patient_id"], []).append(row)
+
+    for patient in rows["patient"]:
+        patient_url = f"urn:uuid:patient-{patient['id']}"
+        subject = {"reference": patient_url}
+        yield {
+            "fullUrl": patient_url,
+            "resource": {
+                "resourceType": "Patient",
+                "identifier": [{"value": patient["identifier"]}],
+                "name": [{"family": patient["last_name"], "given": [patient["first_name"]]}],
+                "gender": patient["sex"],
+            },
+        }
+        for composition in compositions.get(patient["id"], []):
+            for lab_test in lab_tests[composition["id"]]:
+                specimen = specimens[lab_test["specimen_id"]]
+                specimen_url = f"urn:uuid:specimen-{specimen['id']}"
+                yield {
+                    "fullUrl": specimen_url,
+                    "resource": {
+                        "resourceType": "Specimen",
+                        "type": {
+                            "coding": [{"system": fhir.SNOMED, "code": specimen["snomed_code"]}],
+                            "text": specimen["specimen_type"],
+                        },
+                        "collection": {"collectedDateTime": instant(specimen["collection_time"])},
+                    },
+                }
+                results = []
+                for analyte in analytes[lab_test["id"]]:
+                    url = f"urn:uuid:observation-{analyte['id']}"
+                    results.append({"reference": url})
+                    yield {
+                        "fullUrl": url,
+                        "resource": {
+                            "resourceType": "Observation",
+                            "status": "final",
+                            "code": loinc(analyte["loinc_code"]),
+                            "subject": subject,
+                            "specimen": {"reference": specimen_url},
+                            "valueQuantity": {"value": analyte["value"], "unit": analyte["unit"]},
+                            "referenceRange": [
+                                {
+                                    "low": {"value": analyte["reference_low"]},
+                                    "high": {"value": analyte["reference_high"]},
+                                }
+                            ],
+                            "interpretation": [
+                                {
+                                    "coding": [
+                                        {
+                                            "system": fhir.INTERPRETATION,
+                                            "code": analyte["interpretation"],
+                                        }
+                                    ]
+                                }
+                            ],
+                        },
+                    }
+                yield {
+                    "fullUrl": f"urn:uuid:report-{lab_test['id']}",
+                    "resource": {
+                        "resourceType": "DiagnosticReport",
+                        "status": "final",
+                        "code": {**loinc(lab_test["loinc_code"]), "text": lab_test["description"]},
+                        "subject": subject,
+                        "effectiveDateTime": instant(composition["start_time"]),
+                        "specimen": [{"reference": specimen_url}],
+                        "result": results,
+                    },
+                }
+        for measurement in measurements.get(patient["id"], []):
+            yield {
+                "resource": {
+                    "resourceType": "Observation",
+                    "status": "final",
+                    "category": [
+                        {"coding": [{"system": fhir.OBSERVATION_CATEGORY, "code": "vital-signs"}]}
+                    ],
+                    "code": {
+                        "coding": [{"system": fhir.SNOMED, "code": measurement["snomed_code"]}]
+                    },
+                    "subject": subject,
+                    "effectiveDateTime": instant(measurement["record_time"]),
+                    "valueQuantity": {"value": measurement["value"], "unit": measurement["unit"]},
+                }
+            }
+
+
+def write_bundle(rows, path):
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write('{"resourceType": "Bundle", "type": "collection", "entry": [\n')
+        for number, entry in enumerate(bundle_entries(rows)):
+            handle.write((",\n" if number else "") + json.dumps(entry))
+        handle.write("\n]}\n")
+
+
+def post_rows(base_url, count):
+    """Create ``count`` analyte results one request at a time; returns rows per second"""
+    body = json.dumps(
+        {"lab_test_id": 1, "loinc_code": "718-7", "value": 14.2, "unit": "g/dL"}
+    ).encode()
+    start = time.perf_counter()
+    for _ in range(count):
+        request = Request(
+            f"{base_url}/lab_analyte/create",
+            data=body,
+            headers={"Content-Type": "application/json"},
+        )
+        urlopen(request).read()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--rest-rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="ehr-ingest-"), "bundle.json")
+    write_bundle(synthetic_rows(patients=args.patients), path)
+    print(f"Bundle: {os.path.getsize(path) / 1e6:.1f} MB")
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, "-m", "app.ingest", path, "--batch-size", str(args.batch_size)]
+    env = dict(os.environ, DB_PATH=temp_database_url("ingest"))
+    output = subprocess.run(command, cwd=backend_dir, env=env, capture_output=True, text=True)
+    print(output.stdout.rstrip() or output.stderr.rstrip())
+    peak_kib = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(f"  ingest process peak RSS {peak_kib / 1024:.1f} MiB")
+
+    url = temp_database_url("ingest-rest")
+    seed_synthetic(url, patients=1)
+    with running_server(url) as base_url:
+        rate = post_rows(base_url, args.rest_rows)
+    print(f"REST, one POST per analyte row: {rate:.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""List endpoint memory benchmark: tracemalloc peak per request as the page grows.
+
+For each ``--limits`` page size of ``/lab_analyte/all`` (0 means no limit),
+compares the peak Python memory of:
+
+* ORM + Pydantic: ``db.query(Model).limit(n).all()`` validated into the
+  response schema and encoded, as the list path first did,
+* buffered rows: every row as a dict, encoded as one body (the list path
+  before batching),
+* the endpoint: ``GET /lab_analyte/all?limit=n`` called through the ASGI
+  app with the response body discarded, so only server-side memory counts.
+
+Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_list_memory [--patients 2000] [--limits 100,1000,5000,10000,0]
+"""
+
+import argparse
+import asyncio
+import gc
+import tracemalloc
+
+from benchmarks.common import seed_synthetic, temp_database_url, use_database
+
+
+def peak(fn):
+    """Peak traced memory (MiB) while ``fn`` runs, above what was allocated before"""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        fn()
+        return (tracemalloc.get_traced_memory()[1] - baseline) / (1 << 20)
+    finally:
+        tracemalloc.stop()
+
+
+def call_endpoint(app, path, query):
+    """Run one GET through the ASGI app; returns the body size, dropping the body itself"""
+    size = 0
+    received = False
+
+    async def receive():
+        # The request, then nothing until the response is done: a streaming
+        # response waits on this for the client to disconnect
+        nonlocal received
+        if received:
+            await asyncio.Event().wait()
+        received = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [],
+        "client": ("127.0.0.1", 1),
+        "server": ("127.0.0.1", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--limits", default="100,1000,5000,10000,0")
+    args = parser.parse_args()
+
+    url = temp_database_url("list-memory")
+    counts = seed_synthetic(url, patients=args.patients)
+    use_database(url)
+
+    from app import database
+    from app.main import app
+    from app.models import LabAnalyteResult
+    from app.responses import dumps, rows_as_dicts, schema_columns
+    from app.schemas import LabAnalyteResult as LabAnalyteResultSchema
+    from sqlalchemy import select
+
+    print(f"{counts['lab_analyte_result']} lab analyte results")
+    print(f"{'page size':>10} {'ORM + Pydantic':>16} {'buffered rows':>15} {'endpoint':>10}")
+    for limit in [int(value) for value in args.limits.split(",")]:
+
+        def orm():
+            with database.ReadSessionLocal() as db:
+                query = db.query(LabAnalyteResult).order_by(LabAnalyteResult.id)
+                records = (query.limit(limit) if limit else query).all()
+                dumps(
+                    [
+                        LabAnalyteResultSchema.model_validate(record).model_dump(mode="json")
+                        for record in records
+                    ]
+                )
+
+        def buffered():
+            with database.ReadSessionLocal() as db:
+                query = select(*schema_columns(LabAnalyteResult, LabAnalyteResultSchema))
+                query = query.order_by(LabAnalyteResult.id)
+                dumps(rows_as_dicts(db.execute(query.limit(limit) if limit else query)))
+
+        def endpoint():
+            call_endpoint(app, "/lab_analyte/all", f"limit={limit}" if limit else "")
+
+        endpoint()  # warm up imports and caches
+        print(
+            f"{limit or 'all':>10} {peak(orm):>13.1f} MiB {peak(buffered):>11.1f} MiB"
+            f" {peak(endpoint):>6.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Mixed read/write throughput against a running uvicorn server.
+
+Reader threads fetch single analyte results and full patient records while
+writer threads update analyte results. Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_mixed_load [--workers N] [--readers N] [--writers N]
+"""
+
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+
+import httpx
+from benchmarks.common import running_server, seed_synthetic, summarize, temp_database_url
+
+
+def reader(base_url, stop, counts, latencies, patients, analytes, seed):
+    rng = random.Random(seed)
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        while not stop.is_set():
+            if rng.random() < 0.2:
+                path = f"/patient/{rng.randint(1, patients)}/full"
+            else:
+                path = f"/lab_analyte/{rng.randint(1, analytes)}"
+            start = time.perf_counter()
+            response = client.get(path)
+            latencies.append((time.perf_counter() - start) * 1000)
+            counts["read ok" if response.status_code == 200 else "read error"] += 1
+
+
+def writer(base_url, stop, counts, analytes, seed):
+    rng = random.Random(seed)
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        while not stop.is_set():
+            analyte_id = rng.randint(1, analytes)
+            response = client.put(
+                f"/lab_analyte/update/{analyte_id}",
+                json={
+                    "lab_test_id": (analyte_id - 1) // 6 + 1,
+                    "loinc_code": "718-7",
+                    "value": round(rng.uniform(10, 18), 1),
+                    "unit": "g/dL",
+                },
+            )
+            counts["write ok" if response.status_code == 200 else "write error"] += 1
+
+
+def run(base_url, args, patients, analytes):
+    stop = threading.Event()
+    counts = Counter()
+    latencies = []
+    threads = [
+        threading.Thread(
+            target=reader, args=(base_url, stop, counts, latencies, patients, analytes, i)
+        )
+        for i in range(args.readers)
+    ] + [
+        threading.Thread(target=writer, args=(base_url, stop, counts, analytes, 1000 + i))
+        for i in range(args.writers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    url = temp_database_url("mixed")
+    counts = seed_synthetic(url, patients=args.patients)
+    with running_server(url, workers=args.workers) as base_url:
+        result, latencies = run(base_url, args, args.patients, counts["lab_analyte_result"])
+
+    print(
+        f"workers={args.workers} readers={args.readers} writers={args.writers} "
+        f"duration={args.duration:.0f}s"
+    )
+    for kind in ["read ok", "read error", "write ok", "write error"]:
+        print(f"  {kind:<12} {result[kind]:8d}   {result[kind] / args.duration:8.1f} req/s")
+    if latencies:
+        print(summarize("  read latency", latencies))
+
+
+if __name__ == "__main__":
+    main()
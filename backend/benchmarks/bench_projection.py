@@ -0,0 +1,39 @@
+"""Column projection benchmark: ``/lab_analyte/all`` with and without ``fields=``.
+
+Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_projection [--patients N]
+"""
+
+import argparse
+
+from benchmarks.common import seed_synthetic, summarize, temp_database_url, timed, use_database
+
+# What a results table view renders
+FIELDS = "id,loinc_code,value,interpretation"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    url = temp_database_url("projection")
+    counts = seed_synthetic(url, patients=args.patients)
+    use_database(url)
+
+    from app.main import app
+    from fastapi.testclient import TestClient
+
+    print(f"{counts['lab_analyte_result']} lab analyte results")
+    with TestClient(app) as client:
+        for label, params in [("all columns", {}), (f"fields={FIELDS}", {"fields": FIELDS})]:
+            response = client.get("/lab_analyte/all", params=params)
+            response.raise_for_status()
+            timings = timed(lambda: client.get("/lab_analyte/all", params=params), args.repeat)
+            print(summarize(f"GET /lab_analyte/all {label} ({len(response.content)} B)", timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Seed loading benchmark: bulk NDJSON loader vs per-object ORM inserts.
+
+Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_seed [--patients N]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.common import synthetic_rows, temp_database_url, use_database
+from sqlalchemy import create_engine
+
+PARENTS = {
+    "composition": ("patient_id", "patient"),
+    "lab_test": ("composition_id", "composition"),
+    "lab_analyte_result": ("lab_test_id", "lab_test"),
+    "body_measurement": ("patient_id", "patient"),
+}
+
+
+def write_ndjson(rows, path):
+    """Write the synthetic rows in dependency order, the way the sample file is laid out"""
+    from app import models
+
+    with open(path, "w", encoding="utf-8") as handle:
+        for table in models.Base.metadata.sorted_tables:
+            for row in rows[table.name]:
+                record = {"table": table.name}
+                for key, value in row.items():
+                    if key != "version":
+                        record[key] = value.isoformat() if hasattr(value, "isoformat") else value
+                handle.write(json.dumps(record) + "\n")
+
+
+def load_with_orm(rows):
+    """Insert one ORM object at a time, flushing parents to learn their ids"""
+    from app import database, models
+    from sqlalchemy.orm import Session
+
+    models.Base.metadata.create_all(bind=database.engine)
+    classes = {mapper.local_table.name: mapper.class_ for mapper in models.Base.registry.mappers}
+    id_maps = {}
+    with Session(database.engine) as session:
+        for table in models.Base.metadata.sorted_tables:
+            for row in rows[table.name]:
+                row = dict(row)
+                local_id = row.pop("id", None)
+                if table.name in PARENTS:
+                    column, parent = PARENTS[table.name]
+                    row[column] = id_maps[parent][row[column]]
+                obj = classes[table.name](**row)
+                session.add(obj)
+                session.flush()
+                id_maps.setdefault(table.name, {})[local_id] = obj.id
+        session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=1000)
+    args = parser.parse_args()
+
+    use_database(temp_database_url("seed-orm"))
+    from app import database
+    from app.populate_db import load_seed_files
+
+    rows = synthetic_rows(patients=args.patients)
+    total = sum(len(table_rows) for table_rows in rows.values())
+    path = os.path.join(tempfile.mkdtemp(prefix="ehr-seed-"), "seed.ndjson")
+    write_ndjson(rows, path)
+    print(f"Dataset: {total} rows, {os.path.getsize(path) / 1e6:.1f} MB of NDJSON")
+
+    start = time.perf_counter()
+    load_with_orm(rows)
+    elapsed = time.perf_counter() - start
+    print(f"{'ORM add + flush per object':<32} {elapsed:8.2f} s   {total / elapsed:10.0f} rows/s")
+
+    # Same process, so point the app at a second empty database
+    database.engine = create_engine(temp_database_url("seed-bulk"))
+    start = time.perf_counter()
+    load_seed_files([path])
+    elapsed = time.perf_counter() - start
+    print(f"{'bulk NDJSON loader':<32} {elapsed:8.2f} s   {total / elapsed:10.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Response serialization benchmark for list and aggregate endpoints.
+
+Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_serialization [--patients N]
+"""
+
+import argparse
+
+from benchmarks.common import seed_synthetic, summarize, temp_database_url, timed, use_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    url = temp_database_url("serialization")
+    counts = seed_synthetic(url, patients=args.patients)
+    use_database(url)
+
+    from app.main import app
+    from fastapi.testclient import TestClient
+
+    print(f"Dataset: {counts}")
+    with TestClient(app) as client:
+        for path in [
+            "/lab_analyte/all",
+            "/body_measurement/all",
+            "/patient/all",
+            "/patient/1/full",
+        ]:
+            response = client.get(path)
+            response.raise_for_status()
+            timings = timed(lambda: client.get(path), repeat=args.repeat)
+            print(summarize(f"GET {path} ({len(response.content)} B)", timings))
+
+
+if __name__ == "__main__":
+    main()
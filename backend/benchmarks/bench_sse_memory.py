@@ -0,0 +1,133 @@
+"""Server-Sent Events benchmark: memory per idle subscriber and fanout latency of one write.
+
+Starts the app under uvicorn, opens ``--subscribers`` idle ``/events/stream``
+connections (half filtered to patient 1, half to patient 2) and reports how
+much the server's resident memory grew per connection. It then creates one
+body measurement for patient 1 and times how long until every patient-1
+subscriber has received it, checking that no patient-2 subscriber did.
+Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_sse_memory [--subscribers 2000]
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import time
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+from benchmarks.common import running_server, seed_synthetic, temp_database_url
+
+
+def server_pid(port):
+    """PID of the uvicorn process listening on ``port``"""
+    for path in glob.glob("/proc/[0-9]*/cmdline"):
+        try:
+            with open(path, "rb") as cmdline:
+                arguments = cmdline.read().split(b"\0")
+        except OSError:
+            continue
+        if b"uvicorn" in arguments and str(port).encode() in arguments:
+            return int(path.split("/")[2])
+    raise RuntimeError(f"No uvicorn process on port {port}")
+
+
+def resident_kib(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+
+
+async def subscribe(host, port, patient_id):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(
+        f"GET /events/stream?patient_id={patient_id} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+    )
+    await writer.drain()
+    # Headers, then the stream's opening retry: line
+    while b"retry:" not in await reader.readline():
+        pass
+    return reader, writer
+
+
+async def wait_for_event(reader):
+    while True:
+        line = await reader.readline()
+        if line.startswith(b"event: body_measurement.create"):
+            return time.perf_counter()
+
+
+async def run(base_url, subscribers):
+    url = urlparse(base_url)
+    pid = server_pid(url.port)
+
+    warm = await subscribe(url.hostname, url.port, 1)
+    warm[1].close()
+    await asyncio.sleep(0.5)
+    before = resident_kib(pid)
+
+    connections = []
+    for start in range(0, subscribers, 200):
+        connections += await asyncio.gather(
+            *[
+                subscribe(url.hostname, url.port, 1 + index % 2)
+                for index in range(start, min(start + 200, subscribers))
+            ]
+        )
+    await asyncio.sleep(1)
+    after = resident_kib(pid)
+    print(
+        f"{subscribers} idle subscribers: server RSS {before / 1024:.1f} -> {after / 1024:.1f} MiB"
+    )
+    print(f"  {(after - before) / subscribers:.1f} KiB per connection")
+
+    patient_1 = [reader for index, (reader, _) in enumerate(connections) if index % 2 == 0]
+    patient_2 = [reader for index, (reader, _) in enumerate(connections) if index % 2 == 1]
+    waiters = [asyncio.ensure_future(wait_for_event(reader)) for reader in patient_1]
+    others = [asyncio.ensure_future(wait_for_event(reader)) for reader in patient_2]
+    body = json.dumps(
+        {
+            "patient_id": 1,
+            "record_time": "2025-06-01T08:00:00",
+            "value": 80,
+            "unit": "kg",
+            "snomed_code": "27113001",
+        }
+    ).encode()
+    request = Request(
+        f"{base_url}/body_measurement/create",
+        data=body,
+        headers={"Content-Type": "application/json"},
+    )
+    start = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, lambda: urlopen(request).read())
+    received = await asyncio.gather(*waiters)
+    await asyncio.sleep(0.5)
+    leaked = sum(other.done() for other in others)
+    print(
+        f"  one write reached {len(received)} patient-1 subscribers: last after "
+        f"{(max(received) - start) * 1000:.1f} ms; {leaked} patient-2 subscribers got it"
+    )
+
+    for other in others:
+        other.cancel()
+    for _, writer in connections:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=2000)
+    args = parser.parse_args()
+
+    url = temp_database_url("sse")
+    seed_synthetic(url, patients=10)
+    with running_server(url) as base_url:
+        asyncio.run(run(base_url, args.subscribers))
+
+
+if __name__ == "__main__":
+    main()
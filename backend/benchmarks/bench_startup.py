@@ -0,0 +1,95 @@
+"""Cold vs warm startup benchmark for database initialization.
+
+Each measurement runs in a fresh interpreter, the way a uvicorn worker
+starts, and times the initialization itself (module imports excluded).
+Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_startup [--repeat N] [--workers N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import temp_database_url
+
+INITIALIZE = """
+import time
+from app.initialize_db import initialize_database
+start = time.perf_counter()
+initialize_database()
+print(f"RESULT {(time.perf_counter() - start) * 1000:.3f}")
+"""
+
+# What every worker used to run at import time on a warm database
+LEGACY_WARM = """
+import time
+from app import database, models
+from sqlalchemy.orm import Session
+start = time.perf_counter()
+models.Base.metadata.create_all(bind=database.engine)
+with Session(database.engine) as session:
+    session.query(models.Patient).count()
+print(f"RESULT {(time.perf_counter() - start) * 1000:.3f}")
+"""
+
+COUNT_PATIENTS = """
+from app import database, models
+from sqlalchemy.orm import Session
+with Session(database.engine) as session:
+    print(f"RESULT {session.query(models.Patient).count()}")
+"""
+
+
+def spawn(script, url):
+    env = dict(os.environ, DB_PATH=url)
+    return subprocess.Popen(
+        [sys.executable, "-c", script], env=env, stdout=subprocess.PIPE, text=True
+    )
+
+
+def result(process):
+    output, _ = process.communicate()
+    for line in output.splitlines():
+        if line.startswith("RESULT "):
+            return float(line.split()[1])
+    raise RuntimeError(f"benchmark subprocess failed:\n{output}")
+
+
+def run(script, url):
+    return result(spawn(script, url))
+
+
+def report(label, timings):
+    print(f"{label:<40} median {statistics.median(timings):8.2f} ms   max {max(timings):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    cold, warm, legacy = [], [], []
+    for _ in range(args.repeat):
+        url = temp_database_url("startup")
+        cold.append(run(INITIALIZE, url))
+        warm.append(run(INITIALIZE, url))
+        legacy.append(run(LEGACY_WARM, url))
+
+    report("cold start (create + seed)", cold)
+    report("warm start (schema marker)", warm)
+    report("warm start (create_all + count, legacy)", legacy)
+
+    # Start several workers against one empty database at the same time
+    url = temp_database_url("startup-race")
+    processes = [spawn(INITIALIZE, url) for _ in range(args.workers)]
+    race = [result(process) for process in processes]
+    report(f"{args.workers} concurrent workers, empty db", race)
+    print(f"patients after concurrent start: {int(run(COUNT_PATIENTS, url))}")
+
+
+if __name__ == "__main__":
+    main()
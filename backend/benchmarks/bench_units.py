@@ -0,0 +1,79 @@
+"""Unit conversion benchmark: converting in the query vs converting fetched rows in Python.
+
+Rewrites every other glucose result of the synthetic dataset to mg/dL (and
+every other weight to lb), then answers "glucose in mmol/L" and "weights in
+lb" two ways: with :mod:`app.trends`, whose queries convert through one
+``CASE`` over the precomputed factors, and by fetching value and unit and
+converting each row in Python, as a client of ``/all`` has to. Run from the
+``backend`` directory::
+
+    python -m benchmarks.bench_units [--patients 2000]
+"""
+
+import argparse
+import statistics
+
+from benchmarks.common import seed_synthetic, summarize, temp_database_url, timed, use_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=2000)
+    args = parser.parse_args()
+
+    url = temp_database_url("units")
+    seed_synthetic(url, patients=args.patients)
+    use_database(url)
+
+    from app import database
+    from app.models import BodyMeasurement, LabAnalyteResult
+    from app.trends import lab_stats, measurement_stats
+    from app.units import convert, parse_targets
+    from sqlalchemy import select, text
+
+    with database.engine.begin() as connection:
+        connection.execute(
+            text(
+                "UPDATE lab_analyte_result SET value = value * 18.0156, unit = 'mg/dL' "
+                "WHERE loinc_code = '2345-7' AND id % 2 = 0"
+            )
+        )
+        connection.execute(
+            text(
+                "UPDATE body_measurement SET value = value / 0.45359237, unit = 'lb' "
+                "WHERE snomed_code = '27113001' AND id % 2 = 0"
+            )
+        )
+
+    db = database.ReadSessionLocal()
+    cases = [
+        ("glucose mmol/L", LabAnalyteResult, "loinc_code", "2345-7", "mmol/L", lab_stats),
+        ("weight lb", BodyMeasurement, "snomed_code", "27113001", "lb", measurement_stats),
+    ]
+    for label, model, code_name, code, unit, stats in cases:
+        code_column = getattr(model, code_name)
+        rows = db.execute(select(model.value).where(code_column == code)).all()
+        targets = parse_targets([unit])
+
+        def in_python():
+            values = [
+                convert(value, row_unit, unit, code)
+                for value, row_unit in db.execute(
+                    select(model.value, model.unit).where(code_column == code)
+                )
+            ]
+            return min(values), max(values), statistics.fmean(values)
+
+        def in_query():
+            return stats(db, code, targets)
+
+        (group,) = in_query()
+        low, high, mean = in_python()
+        assert abs(group["mean"] - mean) < 1e-6 * abs(mean), (group, mean)
+        print(f"{label}: {len(rows)} rows, mean {mean:.2f} {unit}")
+        print(summarize("  converted in the query", timed(in_query)))
+        print(summarize("  fetched and converted in Python", timed(in_python)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Abnormal-results worklist benchmark: partial-index keyset pages vs a join over all results.
+
+For each dataset size, times the first worklist page, a page deep into the
+list (via its cursor), a LOINC-filtered page and a last-24h page. The
+comparison query answers the same first page the only way the schema
+allowed before: joining every result to its specimen for the collection
+time and sorting. Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_worklist [--sizes 500,2000,5000]
+"""
+
+import argparse
+import subprocess
+import sys
+
+
+def run_size(patients):
+    from datetime import timedelta
+
+    from benchmarks.common import seed_synthetic, summarize, temp_database_url, timed, use_database
+
+    url = temp_database_url("worklist")
+    counts = seed_synthetic(url, patients=patients)
+    use_database(url)
+
+    from app import database
+    from app.initialize_db import initialize_database
+    from app.models import ABNORMAL_INTERPRETATIONS, LabAnalyteResult, LabTest, Specimen
+    from app.worklist import abnormal_results_page, parse_cursor
+    from sqlalchemy import func, select
+
+    # Backfills collection_time on the synthetic rows, like a migrated database
+    initialize_database()
+    db = database.ReadSessionLocal()
+    abnormal = db.execute(
+        select(func.count()).where(LabAnalyteResult.interpretation.in_(ABNORMAL_INTERPRETATIONS))
+    ).scalar()
+    latest = db.execute(select(func.max(LabAnalyteResult.collection_time))).scalar()
+    print(f"{patients} patients: {counts['lab_analyte_result']} results, {abnormal} abnormal")
+
+    deep = {"after": None}
+    for _ in range(20):
+        deep["after"] = parse_cursor(abnormal_results_page(db, after=deep["after"])["next_after"])
+
+    def join_scan():
+        return db.execute(
+            select(LabAnalyteResult.id, Specimen.collection_time)
+            .join(LabTest, LabTest.id == LabAnalyteResult.lab_test_id)
+            .join(Specimen, Specimen.id == LabTest.specimen_id)
+            .where(LabAnalyteResult.interpretation.in_(ABNORMAL_INTERPRETATIONS))
+            .order_by(Specimen.collection_time.desc(), LabAnalyteResult.id.desc())
+            .limit(100)
+        ).all()
+
+    cases = [
+        ("join over all results (before)", join_scan),
+        ("worklist first page", lambda: abnormal_results_page(db)),
+        ("worklist page 21 (cursor)", lambda: abnormal_results_page(db, after=deep["after"])),
+        ("worklist LOINC 718-7", lambda: abnormal_results_page(db, loinc_code="718-7")),
+        (
+            "worklist last 24h",
+            lambda: abnormal_results_page(db, since=latest - timedelta(hours=24)),
+        ),
+    ]
+    for label, fn in cases:
+        print(summarize(f"  {label}", timed(fn)))
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="500,2000,5000")
+    parser.add_argument("--patients", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.patients:
+        run_size(args.patients)
+        return
+    # One process per size: the app binds to its database at import time
+    for size in args.sizes.split(","):
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_worklist", "--patients", size], check=True
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Shared helpers for the backend benchmarks.
+
+Benchmarks are plain scripts run from the ``backend`` directory, e.g.::
+
+    python -m benchmarks.bench_serialization
+
+Each one builds a throwaway SQLite database with a synthetic dataset and
+points the application at it through the ``DB_PATH`` environment variable,
+so the app must not be imported before :func:`use_database` is called.
+"""
+
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from sqlalchemy import create_engine, insert
+
+SNOMED_MEASUREMENTS = [
+    ("27113001", "kg", 50, 120),  # Weight
+    ("50373000", "cm", 150, 200),  # Height
+    ("271649006", "mmHg", 100, 160),  # Systolic BP
+    ("271650006", "mmHg", 60, 100),  # Diastolic BP
+]
+
+ANALYTES = [
+    ("718-7", "g/dL", 12.0, 17.5),  # Hemoglobin
+    ("6690-2", "10^9/L", 4.0, 10.0),  # White Blood Cell Count
+    ("777-3", "10^9/L", 150, 400),  # Platelets
+    ("2345-7", "mmol/L", 3.9, 5.6),  # Glucose
+    ("2823-3", "mmol/L", 3.5, 5.0),  # Potassium
+    ("2951-2", "mmol/L", 136, 145),  # Sodium
+]
+
+
+def temp_database_url(name="bench"):
+    """Return a SQLite URL pointing at a fresh file in a temporary directory"""
+    directory = tempfile.mkdtemp(prefix=f"ehr-{name}-")
+    return f"sqlite:///{os.path.join(directory, 'ehr.db')}"
+
+
+def use_database(url):
+    """Point the application at ``url``; call before importing ``app``"""
+    os.environ["DB_PATH"] = url
+
+
+def synthetic_rows(patients=100, compositions=5, tests=2, measurements=20, seed=42):
+    """Build a deterministic synthetic dataset as ``{table_name: [row, ...]}``"""
+    from app import models
+
+    rng = random.Random(seed)
+    base_time = datetime(2025, 1, 1, 8, 0, 0)
+    rows = {table: [] for table in models.Base.metadata.tables}
+    ids = {"composition": 0, "specimen": 0, "lab_test": 0, "lab_analyte_result": 0}
+
+    for patient_id in range(1, patients + 1):
+        rows["patient"].append(
+            {
+                "id": patient_id,
+                "first_name": f"First{patient_id}",
+                "last_name": f"Last{patient_id}",
+                "sex": rng.choice(["male", "female"]),
+                "identifier": f"PAT-{patient_id:06d}",
+                "version": 1,
+            }
+        )
+        for _ in range(compositions):
+            ids["composition"] += 1
+            start_time = base_time + timedelta(minutes=rng.randrange(0, 60 * 24 * 365))
+            rows["composition"].append(
+                {
+                    "id": ids["composition"],
+                    "patient_id": patient_id,
+                    "start_time": start_time,
+                    "version": 1,
+                }
+            )
+            for _ in range(tests):
+                ids["specimen"] += 1
+                ids["lab_test"] += 1
+                rows["specimen"].append(
+                    {
+                        "id": ids["specimen"],
+                        "specimen_type": "Venous blood",
+                        "collection_time": start_time - timedelta(minutes=15),
+                        "snomed_code": "122555007",
+                        "description": "Venous blood specimen",
+                        "version": 1,
+                    }
+                )
+                rows["lab_test"].append(
+                    {
+                        "id": ids["lab_test"],
+                        "composition_id": ids["composition"],
+                        "specimen_id": ids["specimen"],
+                        "loinc_code": "57021-8",
+                        "description": "Complete Blood Count (CBC)",
+                        "version": 1,
+                    }
+                )
+                for loinc_code, unit, low, high in ANALYTES:
+                    ids["lab_analyte_result"] += 1
+                    value = round(rng.uniform(low * 0.8, high * 1.2), 2)
+                    interpretation = "L" if value < low else "H" if value > high else "N"
+                    rows["lab_analyte_result"].append(
+                        {
+                            "id": ids["lab_analyte_result"],
+                            "lab_test_id": ids["lab_test"],
+                            "loinc_code": loinc_code,
+                            "value": value,
+                            "unit": unit,
+                            "reference_low": low,
+                            "reference_high": high,
+                            "interpretation": interpretation,
+                            "version": 1,
+                        }
+                    )
+        for _ in range(measurements):
+            snomed_code, unit, low, high = rng.choice(SNOMED_MEASUREMENTS)
+            rows["body_measurement"].append(
+                {
+                    "patient_id": patient_id,
+                    "record_time": base_time + timedelta(minutes=rng.randrange(0, 60 * 24 * 365)),
+                    "value": round(rng.uniform(low, high), 1),
+                    "unit": unit,
+                    "snomed_code": snomed_code,
+                    "version": 1,
+                }
+            )
+    return rows
+
+
+def seed_synthetic(url, **kwargs):
+    """Fill the database at ``url`` with :func:`synthetic_rows`"""
+    from app import models
+
+    rows = synthetic_rows(**kwargs)
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for table in models.Base.metadata.sorted_tables:
+            if rows[table.name]:
+                connection.execute(insert(table), rows[table.name])
+    engine.dispose()
+    return {table: len(table_rows) for table, table_rows in rows.items() if table_rows}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def running_server(url, workers=1, env=None, timeout=30):
+    """Run the app under uvicorn against the database at ``url`` and yield its base URL"""
+    port = free_port()
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=backend_dir,
+        env=dict(os.environ, DB_PATH=url, **(env or {})),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                urlopen(f"{base_url}/patient/1", timeout=1).close()
+                break
+            except (URLError, ConnectionError, OSError):
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn did not start") from None
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=timeout)
+
+
+def timed(fn, repeat=20, warmup=2):
+    """Run ``fn`` repeatedly and return per-call timings in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(label, timings):
+    """Format median / p95 of ``timings`` as one report line"""
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"{label:<40} median {statistics.median(ordered):8.2f} ms   p95 {p95:8.2f} ms"
@@ -0,0 +1,165 @@
+"""Query budget harness for the API.
+
+Each router module declares ``BUDGETS``: for a request path on the seeded
+test dataset, the most SQL statements it may run, rows it may fetch from
+SQLite and milliseconds it may take. ``test_budgets.py`` requests every
+declared path through the app and fails with the SQL that ran when one
+goes over, so an N+1 query shows up as the same statement repeated. Time
+is the fastest of :data:`TIMED_RUNS` requests, and time budgets leave a
+wide margin over a laptop's timings; scale them on slower machines.
+
+Run from the ``backend`` directory::
+
+    python -m pytest [--budget-time-scale 2]
+"""
+
+import re
+import time
+from collections import Counter
+
+import pytest
+from benchmarks.common import seed_synthetic, temp_database_url, use_database
+
+# Size of the seeded dataset the budgets are declared against
+TEST_PATIENTS = 50
+
+# Requests timed per path; the fastest counts, so one slow run (GC, a busy CI
+# neighbour) does not fail the budget
+TIMED_RUNS = 3
+
+
+class QueryRecorder:
+    """Collects the SQL statements both engines run, and the rows fetched for each.
+
+    Rows are counted by a sqlite3 ``row_factory`` on every pooled connection,
+    so rows streamed in batches (``yield_per``) count as much as ``.all()``.
+    """
+
+    def __init__(self):
+        self.statements = None
+        self._cursors = {}
+
+    def install(self, engines):
+        from sqlalchemy import event
+
+        for engine in engines:
+            event.listen(engine, "connect", self._on_connect)
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+            # Connections opened so far have no row factory
+            engine.dispose()
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        dbapi_connection.row_factory = self._count_row
+
+    def _on_execute(self, connection, cursor, statement, parameters, context, executemany):
+        if self.statements is not None:
+            entry = [statement, 0]
+            self.statements.append(entry)
+            self._cursors[id(cursor)] = entry
+
+    def _count_row(self, cursor, row):
+        if self.statements is not None:
+            entry = self._cursors.get(id(cursor))
+            if entry is not None:
+                entry[1] += 1
+        return row
+
+    def record(self, fn):
+        """Run ``fn``; returns its result, the ``[statement, rows]`` list and milliseconds"""
+        self.statements = []
+        self._cursors = {}
+        start = time.perf_counter()
+        try:
+            result = fn()
+            return result, self.statements, (time.perf_counter() - start) * 1000
+        finally:
+            self.statements = None
+
+
+def format_statements(statements, limit=20):
+    """Statements grouped by SQL text, most repeated first, with the rows each fetched"""
+    counts = Counter()
+    rows = Counter()
+    for statement, fetched in statements:
+        sql = re.sub(r"\s+", " ", statement).strip()
+        counts[sql] += 1
+        rows[sql] += fetched
+    lines = [
+        f"  {count:>4} x {rows[sql]:>6} rows  {sql[:300]}"
+        for sql, count in counts.most_common(limit)
+    ]
+    if len(counts) > limit:
+        lines.append(f"  ... and {len(counts) - limit} more distinct statements")
+    return "\n".join(lines)
+
+
+recorder = QueryRecorder()
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--budget-time-scale",
+        type=float,
+        default=1.0,
+        help="Multiply the declared time budgets, e.g. on slow CI machines",
+    )
+
+
+def pytest_configure(config):
+    # The app reads DB_PATH when it is imported, and test modules import the
+    # routers for their budgets, so the database must exist before collection
+    url = temp_database_url("tests")
+    seed_synthetic(url, patients=TEST_PATIENTS)
+    use_database(url)
+
+    from app import database, models
+    from app.initialize_db import initialize_database
+    from app.populate_db import SAMPLE_DATA_PATH, read_records
+    from sqlalchemy import insert
+
+    initialize_database()
+    # The synthetic dataset has no reference ranges; take those of the bundled sample
+    ranges = [row for table, row in read_records(SAMPLE_DATA_PATH) if table == "reference_range"]
+    with database.engine.begin() as connection:
+        connection.execute(insert(models.ReferenceRange.__table__), ranges)
+    recorder.install([database.engine, database.read_engine])
+
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+    from fastapi.testclient import TestClient
+
+    # Without the lifespan: the database is initialized above, and GET
+    # requests need neither the write queue nor the background services
+    return TestClient(app)
+
+
+@pytest.fixture
+def within_budget(client, request):
+    """Request a path and fail if it goes over its statement, row or time budget"""
+    scale = request.config.getoption("--budget-time-scale")
+
+    def check(path, statements, rows, ms):
+        # Warm up imports, compiled statement caches and the page cache first
+        client.get(path)
+        response, executed, elapsed_ms = recorder.record(lambda: client.get(path))
+        assert response.status_code == 200, f"GET {path}: {response.status_code} {response.text}"
+        for _ in range(TIMED_RUNS - 1):
+            elapsed_ms = min(elapsed_ms, recorder.record(lambda: client.get(path))[2])
+        fetched = sum(entry[1] for entry in executed)
+        problems = []
+        if len(executed) > statements:
+            problems.append(f"{len(executed)} statements (budget {statements})")
+        if fetched > rows:
+            problems.append(f"{fetched} rows fetched (budget {rows})")
+        if elapsed_ms > ms * scale:
+            problems.append(f"{elapsed_ms:.1f} ms (budget {ms * scale:.0f} ms)")
+        if problems:
+            pytest.fail(
+                f"GET {path} is over budget: {', '.join(problems)}\n{format_statements(executed)}",
+                pytrace=False,
+            )
+        return response
+
+    return check
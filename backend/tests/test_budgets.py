@@ -0,0 +1,44 @@
+import pkgutil
+from importlib import import_module
+
+import pytest
+from app import routers
+from fastapi.routing import APIRoute
+from starlette.routing import Match
+
+ROUTER_MODULES = [
+    import_module(f"app.routers.{module.name}") for module in pkgutil.iter_modules(routers.__path__)
+]
+
+BUDGETS = [
+    (path, budget)
+    for module in ROUTER_MODULES
+    for path, budget in getattr(module, "BUDGETS", {}).items()
+]
+
+# GET routes that cannot be measured as one request: the event stream never ends
+UNBUDGETED = {"/events/stream"}
+
+
+@pytest.mark.parametrize("path, budget", BUDGETS, ids=[path for path, _ in BUDGETS])
+def test_within_budget(within_budget, path, budget):
+    within_budget(path, **budget)
+
+
+@pytest.mark.parametrize("module", ROUTER_MODULES, ids=lambda module: module.__name__)
+def test_every_get_route_has_a_budget(module):
+    routes = [route for route in module.router.routes if isinstance(route, APIRoute)]
+    # The route each budgeted path is served by, found the way the router does
+    covered = set()
+    for path in getattr(module, "BUDGETS", {}):
+        scope = {"type": "http", "method": "GET", "path": path.split("?")[0]}
+        for route in routes:
+            if route.matches(scope)[0] == Match.FULL:
+                covered.add(route.path)
+                break
+    missing = [
+        route.path
+        for route in routes
+        if "GET" in route.methods and route.path not in covered | UNBUDGETED
+    ]
+    assert not missing, f"GET routes without a query budget: {', '.join(missing)}"
@@ -0,0 +1,95 @@
+import io
+import json
+
+import pytest
+from app.ingest import patient_row, read_bundle, read_resources
+
+BUNDLE = {
+    "resourceType": "Bundle",
+    "type": "collection",
+    "entry": [
+        {
+            "fullUrl": "urn:uuid:1",
+            "resource": {"resourceType": "Patient", "gender": "female", "name": [{"family": "Ö"}]},
+        },
+        {
+            "fullUrl": "urn:uuid:2",
+            "resource": {
+                "resourceType": "Observation",
+                "valueQuantity": {"value": 123456.789, "unit": "mg/dL"},
+                "note": [{"text": 'brackets ] and } and "quotes" in a string'}],
+            },
+        },
+    ],
+    "meta": {"lastUpdated": "2025-01-01T00:00:00Z"},
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 16])
+def test_read_bundle_matches_json_loads(chunk_size):
+    # Small chunks cut strings, numbers and separators at every position
+    text = json.dumps(BUNDLE, indent=1, ensure_ascii=False)
+    entries = list(read_bundle(io.StringIO(text), chunk_size=chunk_size))
+    assert entries == BUNDLE["entry"]
+
+
+def test_read_bundle_entries_after_other_members():
+    text = json.dumps({"entry": BUNDLE["entry"], "total": 2, "resourceType": "Bundle"})
+    assert list(read_bundle(io.StringIO(text), chunk_size=5)) == BUNDLE["entry"]
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ('[{"resourceType": "Bundle"}]', "Expected a FHIR Bundle object"),
+        ('{"resourceType": "Patient", "entry": []}', "Expected a FHIR Bundle, got Patient"),
+        ('{"resourceType" "Bundle"}', "Malformed Bundle"),
+        ('{"resourceType": "Bundle", "entry": [{"resource": {}}', "Unexpected end of file"),
+        ("", "Unexpected end of file"),
+    ],
+)
+def test_read_bundle_rejects_malformed_documents(text, message):
+    with pytest.raises(ValueError, match=message):
+        list(read_bundle(io.StringIO(text), chunk_size=4))
+
+
+def test_read_bundle_rejects_invalid_json_inside_an_entry():
+    text = '{"resourceType": "Bundle", "entry": [{"resource": {"id": tru}}]}'
+    with pytest.raises(json.JSONDecodeError):
+        list(read_bundle(io.StringIO(text), chunk_size=4))
+
+
+def test_read_resources_reports_invalid_ndjson_lines(tmp_path):
+    path = tmp_path / "resources.ndjson"
+    nested = {"resourceType": "Bundle", "entry": BUNDLE["entry"]}
+    path.write_text(
+        "\n".join([json.dumps({"resourceType": "Patient"}), "{not json", "", json.dumps(nested)]),
+        encoding="utf-8",
+    )
+    errors = []
+    resources = list(read_resources(path, lambda *error: errors.append(error)))
+
+    assert [(position, url) for position, url, _ in resources] == [
+        ("line 1", None),
+        ("line 4 entry 1", "urn:uuid:1"),
+        ("line 4 entry 2", "urn:uuid:2"),
+    ]
+    assert [(position, resource) for position, resource, _ in errors] == [("line 2", None)]
+    assert errors[0][2].startswith("Invalid JSON")
+
+
+def test_read_resources_reads_other_files_as_one_bundle(tmp_path):
+    path = tmp_path / "bundle.json"
+    path.write_text(json.dumps(BUNDLE), encoding="utf-8")
+    resources = list(read_resources(path, pytest.fail))
+    assert [position for position, _, _ in resources] == ["entry 1", "entry 2"]
+    assert [resource for _, _, resource in resources] == [
+        entry["resource"] for entry in BUNDLE["entry"]
+    ]
+
+
+@pytest.mark.parametrize("gender", ["other", "unknown", "Male"])
+def test_patient_row_rejects_unsupported_genders(gender):
+    resource = {"identifier": [{"value": "PAT-1"}], "name": [{"family": "Doe"}], "gender": gender}
+    with pytest.raises(ValueError, match="not supported"):
+        patient_row(resource)
@@ -0,0 +1,118 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from app import history, models
+from benchmarks.common import temp_database_url
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+# First names of the patient's versions; every third update also changes the last name
+FIRST_NAMES = [f"First{number}" for number in range(1, 27)]
+
+
+@pytest.fixture
+def history_db():
+    """A session on an empty database of its own, so history written here stays out
+    of the shared test dataset
+    """
+    url = temp_database_url("history")
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        yield url, session
+    engine.dispose()
+
+
+def edited_patient(db: Session):
+    """A patient updated through ``archive_version`` once per name in FIRST_NAMES"""
+    patient = models.Patient(
+        first_name="First0", last_name="Last0", sex="female", identifier="PAT-1", version=1
+    )
+    db.add(patient)
+    db.flush()
+    for number, first_name in enumerate(FIRST_NAMES, start=1):
+        changes = {"first_name": first_name}
+        if number % 3 == 0:
+            changes["last_name"] = f"Last{number}"
+        history.archive_version(db, "patient", patient, changes)
+        for key, value in changes.items():
+            setattr(patient, key, value)
+        patient.version += 1
+    db.flush()
+    return patient.id
+
+
+def fields(version):
+    """A version without the values two records with the same edits differ in"""
+    return {key: value for key, value in version.items() if key not in ("id", "updated_at")}
+
+
+def test_delta_versions_match_full_versions(history_db, monkeypatch):
+    _, db = history_db
+    full_id = edited_patient(db)
+    monkeypatch.setattr(history, "HISTORY_FORMAT", "delta")
+    delta_id = edited_patient(db)
+
+    full = history.get_versions(db, "patient", full_id)
+    delta = history.get_versions(db, "patient", delta_id)
+    assert [version["version"] for version in delta] == list(range(1, len(FIRST_NAMES) + 2))
+    assert [fields(version) for version in delta] == [fields(version) for version in full]
+    for version in full:
+        rebuilt = history.get_version(db, "patient", delta_id, version["version"])
+        assert fields(rebuilt) == fields(version)
+
+
+def test_deltas_store_changed_fields_between_snapshots(history_db, monkeypatch):
+    _, db = history_db
+    monkeypatch.setattr(history, "HISTORY_FORMAT", "delta")
+    monkeypatch.setattr(history, "SNAPSHOT_INTERVAL", 4)
+    patient_id = edited_patient(db)
+
+    rows = db.execute(
+        select(models.HistoryDelta).where(models.HistoryDelta.entity_key == str(patient_id))
+    ).scalars()
+    stored = {row.version: (row.snapshot, row.changes) for row in rows}
+    assert sorted(stored) == list(range(1, len(FIRST_NAMES) + 1))
+    snapshots = [number for number, (snapshot, _) in stored.items() if snapshot]
+    assert snapshots == [4, 8, 12, 16, 20, 24]
+    # A reverse delta holds the old values of the fields the next update changed
+    assert history.decode_changes("patient", stored[1][1]) == {"first_name": "First0"}
+    assert history.decode_changes("patient", stored[3][1]) == {
+        "first_name": "First2",
+        "last_name": "Last0",
+    }
+    assert history.decode_changes("patient", stored[8][1]) == {
+        "first_name": "First7",
+        "last_name": "Last6",
+        "sex": "female",
+        "identifier": "PAT-1",
+    }
+
+
+def test_convert_command_keeps_every_version(history_db):
+    url, db = history_db
+    patient_ids = [edited_patient(db) for _ in range(3)]
+    db.commit()
+    before = {
+        patient_id: history.get_versions(db, "patient", patient_id) for patient_id in patient_ids
+    }
+
+    # Chunks smaller than the number of records, so conversion takes several transactions
+    subprocess.run(
+        [sys.executable, "-m", "app.history", "convert", "--chunk-size", "2"],
+        check=True,
+        capture_output=True,
+        env={**os.environ, "DB_PATH": url},
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+    db.expire_all()
+    assert db.execute(select(func.count()).select_from(models.PatientHistory)).scalar() == 0
+    deltas = db.execute(select(func.count()).select_from(models.HistoryDelta)).scalar()
+    assert deltas == len(patient_ids) * len(FIRST_NAMES)
+    for patient_id in patient_ids:
+        assert history.get_versions(db, "patient", patient_id) == before[patient_id]
+        for version in before[patient_id]:
+            assert history.get_version(db, "patient", patient_id, version["version"]) == version
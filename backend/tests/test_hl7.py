@@ -0,0 +1,149 @@
+from concurrent.futures import Future
+from datetime import datetime
+
+import pytest
+from app import ingest
+from app.hl7 import Hl7Batcher, Message, analyte_row, parse_timestamp, split_messages
+from sqlalchemy.exc import OperationalError
+
+MSH = "MSH|^~\\&|ANALYZER|LAB|EHR|HOSPITAL|20250102130405||ORU^R01^ORU_R01|MSG00001|P|2.5.1"
+
+
+def obx(value_type="NM", value="5.2", code="2345-7^Glucose^LN", unit="mmol/L", rng="3.9-5.6"):
+    message = Message(f"{MSH}\rOBX|1|{value_type}|{code}||{value}|{unit}|{rng}|N")
+    return message, message.segments[1]
+
+
+def test_message_fields_are_numbered_as_in_the_standard():
+    message = Message(f"\x0b{MSH}\nPID|1||PAT-1^^^HOSP||Doe^John\x1c\r")
+    assert message.control_id == "MSG00001"
+    assert message.message_type == "ORU^R01"
+    pid = message.segments[1]
+    assert message.field(pid, 3) == "PAT-1^^^HOSP"
+    assert message.component_value(pid, 5, 2) == "John"
+    assert message.field(pid, 30) == ""
+    assert message.component_value(pid, 5, 9) == ""
+
+
+def test_message_uses_its_own_separators_and_escapes():
+    message = Message("MSH#:*!%#APP\rNTE#1##a!F!b!S!c!T!d!R!e!E!f#x:y*z:w")
+    note = message.segments[1]
+    assert message.field(note, 3) == "a!F!b!S!c!T!d!R!e!E!f"
+    assert message.components(note, 3) == ["a#b:c%d*e!f"]
+    assert message.components(note, 4) == ["x", "y"]
+    assert message.components(note, 4, repetition=1) == ["z", "w"]
+    assert message.components(note, 4, repetition=2) == []
+
+
+@pytest.mark.parametrize("text", ["", "PID|1", "MSH|^~"])
+def test_message_needs_an_msh_segment(text):
+    with pytest.raises(ValueError, match="MSH"):
+        Message(text)
+
+
+def test_split_messages_drops_batch_envelopes():
+    text = f"FHS|^~\\&\rBHS|^~\\&\r{MSH}\rPID|1\r\r{MSH}\rPID|2\rBTS|2\rFTS|1\r"
+    assert split_messages(text) == [f"{MSH}\rPID|1", f"{MSH}\rPID|2"]
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("2025", datetime(2025, 1, 1)),
+        ("202503", datetime(2025, 3, 1)),
+        ("202501021304", datetime(2025, 1, 2, 13, 4)),
+        ("20250102130405.1234", datetime(2025, 1, 2, 13, 4, 5, 123400)),
+        ("20250102130405+0200", datetime(2025, 1, 2, 11, 4, 5)),
+        ("20250102230405-0130", datetime(2025, 1, 3, 0, 34, 5)),
+        ("", None),
+        (None, None),
+        ("2025-01-02", None),
+        ("20250102130405Z", None),
+    ],
+)
+def test_parse_timestamp(value, expected):
+    assert parse_timestamp(value) == expected
+
+
+def test_analyte_row():
+    message, segment = obx()
+    assert analyte_row(message, segment) == {
+        "loinc_code": "2345-7",
+        "value": 5.2,
+        "unit": "mmol/L",
+        "reference_low": 3.9,
+        "reference_high": 5.6,
+        "interpretation": "N",
+    }
+
+
+@pytest.mark.parametrize(
+    "fields, expected",
+    [
+        ({"value_type": "SN", "value": "^7.5"}, {"value": 7.5}),
+        ({"value_type": "SN", "value": "=^-1"}, {"value": -1.0}),
+        # The LOINC code may be the alternate identifier
+        ({"code": "GLU^Glucose^L^2345-7^Glucose^LN"}, {"loinc_code": "2345-7"}),
+        # A unit coded as CWE with only its text
+        ({"unit": "^mmol/L^UCUM"}, {"unit": "mmol/L"}),
+        ({"rng": "<5"}, {"reference_low": None, "reference_high": 5.0}),
+        ({"rng": ">=60"}, {"reference_low": 60.0, "reference_high": None}),
+        ({"rng": "normal"}, {"reference_low": None, "reference_high": None}),
+    ],
+)
+def test_analyte_row_variants(fields, expected):
+    message, segment = obx(**fields)
+    row = analyte_row(message, segment)
+    assert {key: row[key] for key in expected} == expected
+
+
+@pytest.mark.parametrize(
+    "fields, error",
+    [
+        ({"value_type": "ST", "value": "positive"}, "Non-numeric value type ST"),
+        ({"value_type": ""}, "Non-numeric value type missing"),
+        ({"value_type": "SN", "value": "<^5"}, "Unsupported structured numeric"),
+        ({"value_type": "SN", "value": "^1^-^2"}, "Unsupported structured numeric"),
+        ({"code": "GLU^Glucose^L"}, "no LOINC code"),
+        ({"value": "5,2"}, "not a number"),
+        ({"value": ""}, "not a number"),
+        ({"unit": ""}, "no unit"),
+    ],
+)
+def test_analyte_row_rejects(fields, error):
+    message, segment = obx(**fields)
+    with pytest.raises(ValueError, match=error):
+        analyte_row(message, segment)
+
+
+ORU = "\r".join(
+    [
+        MSH,
+        "PID|1||PAT-HL7-1^^^HOSPITAL^MR||Doe^Jane|||F",
+        "OBR|1|||2345-7^Glucose^LN|||20250102130405",
+        "OBX|1|NM|2345-7^^LN||5.2|mmol/L^^UCUM|3.9-5.6|N|||F",
+        "SPM|1|SP1||119297000^Blood^SCT|||||||||||||20250102120000",
+    ]
+)
+
+
+def batch_acks(messages):
+    batcher = Hl7Batcher()
+    group = [(text, Future()) for text in messages]
+    batcher._write(group)
+    return [future.result(timeout=0) for _, future in group]
+
+
+def test_failed_batch_rejects_its_messages(monkeypatch):
+    def locked(work):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(ingest.write_queue, "run", locked)
+    second = ORU.replace("MSG00001", "MSG00002").replace("PAT-HL7-1", "PAT-HL7-2")
+    acks = batch_acks([ORU, second])
+
+    for ack, control_id in zip(acks, ["MSG00001", "MSG00002"]):
+        msa = ack.split("\r")[1].split("|")
+        assert msa[:3] == ["MSA", "AR", control_id]
+        # Once per message, not per record of it
+        assert msa[3].count("database is locked") == 1
@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime
+from enum import Enum
+
+import pytest
+from app.responses import JSONArraySpool, dumps, etag_response
+from fastapi.responses import StreamingResponse
+from starlette.requests import Request
+
+
+class Kind(str, Enum):
+    BLOOD = "blood"
+
+
+ROWS = [
+    {"id": number, "text": f'Ö{number} "quoted"', "at": datetime(2025, 1, 2, 3, 4, number)}
+    for number in range(1, 8)
+] + [{"id": 8, "kind": Kind.BLOOD, "value": 5.25, "missing": None}]
+
+
+def request(if_none_match=None):
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def body(response):
+    if isinstance(response, StreamingResponse):
+
+        async def collect():
+            return b"".join([chunk async for chunk in response.body_iterator])
+
+        return asyncio.run(collect())
+    return response.body
+
+
+def spooled(batches, max_size, if_none_match=None):
+    spool = JSONArraySpool(max_size=max_size)
+    for batch in batches:
+        spool.write_rows(batch)
+    return spool.response(request(if_none_match), {"X-Next-After": "8"})
+
+
+@pytest.mark.parametrize("max_size", [1 << 20, 16], ids=["in memory", "spooled to disk"])
+@pytest.mark.parametrize(
+    "batches",
+    [[ROWS], [ROWS[:3], [], ROWS[3:7], ROWS[7:]], [[row] for row in ROWS], [], [[]]],
+    ids=["one batch", "uneven batches", "row by row", "no batches", "empty batch"],
+)
+def test_spool_matches_buffered_response(batches, max_size):
+    rows = [row for batch in batches for row in batch]
+    buffered = etag_response(request(), rows, {"X-Next-After": "8"})
+    response = spooled(batches, max_size)
+
+    assert response.status_code == 200
+    assert body(response) == body(buffered) == dumps(rows)
+    assert response.headers["ETag"] == buffered.headers["ETag"]
+    assert response.headers["X-Next-After"] == "8"
+    assert response.headers["Content-Length"] == str(len(dumps(rows)))
+    # A body past max_size is sent from the temporary file
+    assert isinstance(response, StreamingResponse) == (len(dumps(rows)) > max_size)
+
+
+@pytest.mark.parametrize("max_size", [1 << 20, 16], ids=["in memory", "spooled to disk"])
+def test_spool_answers_304_for_a_known_etag(max_size):
+    etag = etag_response(request(), ROWS).headers["ETag"]
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}'):
+        response = spooled([ROWS[:4], ROWS[4:]], max_size, if_none_match)
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+    assert spooled([ROWS], max_size, '"other"').status_code == 200
@@ -0,0 +1,65 @@
+import pytest
+from app.units import FACTORS, convert, parse_targets
+
+
+@pytest.mark.parametrize(
+    "value, unit, target, code, expected",
+    [
+        (1, "g/dL", "mg/dL", None, 1000),
+        (250, "µg/L", "mg/L", None, 0.25),
+        (100, "mg/dL", "mmol/L", "2345-7", 5.5507),
+        (5.5, "mmol/L", "mg/dL", "2345-7", 99.0858),
+        (1, "mmol/L", "µmol/L", None, 1000),
+        (1, "lb", "kg", None, 0.45359237),
+        (16, "oz", "lb", None, 1),
+        (12, "in", "ft", None, 1),
+        (72, "in", "cm", None, 182.88),
+        (1, "kPa", "mmHg", None, 7.50062),
+        (212, "°F", "°C", None, 100),
+        (-40, "°C", "°F", None, -40),
+        (0, "°C", "K", None, 273.15),
+        (45, "%", "L/L", None, 0.45),
+        (1, "10^12/L", "10^9/L", None, 1000),
+        (250, "10^9/L", "/µL", None, 250000),
+        # Other spellings of the same units
+        (10, "umol/l", "mmol/L", None, 0.01),
+        (1, "[lb_av]", "kg", None, 0.45359237),
+        (98.6, "[degF]", "Cel", None, 37),
+    ],
+)
+def test_convert(value, unit, target, code, expected):
+    assert convert(value, unit, target, code) == pytest.approx(expected, rel=1e-5)
+
+
+@pytest.mark.parametrize(
+    "unit, target, code",
+    [
+        ("mg/dL", "mmol/L", None),  # needs the analyte's molar mass
+        ("mg/dL", "mmol/L", "6690-2"),  # no molar mass for this code
+        ("kg", "cm", None),
+        ("mg/dL", "furlong", None),
+    ],
+)
+def test_convert_without_a_conversion(unit, target, code):
+    with pytest.raises(ValueError, match="Cannot convert"):
+        convert(1, unit, target, code)
+
+
+def test_every_factor_has_its_inverse():
+    for code, source, target in FACTORS:
+        there = convert(3.7, source, target, code)
+        assert convert(there, target, source, code) == pytest.approx(3.7), (code, source, target)
+
+
+def test_parse_targets():
+    assert parse_targets(None) == {}
+    assert parse_targets(["mg/dl", "2345-7:mmol/L", " 718-7 : g/L "]) == {
+        None: "mg/dL",
+        "2345-7": "mmol/L",
+        "718-7": "g/L",
+    }
+
+
+def test_parse_targets_rejects_unknown_units():
+    with pytest.raises(ValueError, match="Unknown unit 'furlong'"):
+        parse_targets(["2345-7:furlong"])
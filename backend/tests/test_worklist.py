@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from app import models
+from app.worklist import refresh_collection_times
+from benchmarks.common import temp_database_url
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+UPDATED = datetime(2025, 1, 1, 9, 0, 0)
+
+
+def test_refresh_collection_times_keeps_version_and_updated_at():
+    engine = create_engine(temp_database_url("worklist"))
+    models.Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        db.add(models.Patient(id=1, first_name="A", last_name="B", sex="male", identifier="P1"))
+        db.add(models.Composition(id=1, patient_id=1, start_time=UPDATED))
+        db.add(
+            models.Specimen(
+                id=1, specimen_type="Blood", collection_time=datetime(2025, 1, 1, 8, 0, 0)
+            )
+        )
+        db.add(models.LabTest(id=1, composition_id=1, specimen_id=1, loinc_code="24323-8"))
+        db.add(
+            models.LabAnalyteResult(
+                id=1,
+                lab_test_id=1,
+                loinc_code="2345-7",
+                value=5.0,
+                unit="mmol/L",
+                version=3,
+                updated_at=UPDATED,
+            )
+        )
+        db.flush()
+
+        refresh_collection_times(db, specimen_ids=[1])
+        db.get(models.Specimen, 1).collection_time = datetime(2025, 1, 1, 7, 30, 0)
+        refresh_collection_times(db, specimen_ids=[1])
+        db.commit()
+
+        db.expire_all()
+        result = db.get(models.LabAnalyteResult, 1)
+        assert result.collection_time == datetime(2025, 1, 1, 7, 30, 0)
+        assert (result.version, result.updated_at) == (3, UPDATED)
+    engine.dispose()
@@ -0,0 +1,59 @@
+import pytest
+from app import database
+from app.writer import WriteQueue
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+
+@pytest.fixture
+def names():
+    """A scratch table with a unique column, so a duplicate insert fails"""
+    with database.engine.begin() as connection:
+        connection.execute(text("CREATE TABLE writer_test (name TEXT UNIQUE)"))
+
+    def read():
+        with database.engine.connect() as connection:
+            return sorted(connection.execute(text("SELECT name FROM writer_test")).scalars())
+
+    yield read
+    with database.engine.begin() as connection:
+        connection.execute(text("DROP TABLE writer_test"))
+
+
+def insert(name, sessions):
+    def work(session):
+        sessions.append(session)
+        session.execute(text("INSERT INTO writer_test (name) VALUES (:name)"), {"name": name})
+        return name
+
+    return work
+
+
+def test_failing_write_does_not_roll_back_its_group(names):
+    writes = WriteQueue(window_ms=500)
+    sessions = []
+    try:
+        futures = [writes.submit(insert(name, sessions)) for name in ("a", "b", "a", "c")]
+        assert futures[0].result(timeout=10) == "a"
+        assert futures[1].result(timeout=10) == "b"
+        with pytest.raises(IntegrityError):
+            futures[2].result(timeout=10)
+        assert futures[3].result(timeout=10) == "c"
+    finally:
+        writes.stop()
+    # All four shared one transaction
+    assert len({id(session) for session in sessions}) == 1
+    assert names() == ["a", "b", "c"]
+
+
+def test_failing_write_on_its_own_leaves_the_queue_usable(names):
+    writes = WriteQueue(window_ms=0)
+    sessions = []
+    try:
+        assert writes.run(insert("a", sessions)) == "a"
+        with pytest.raises(IntegrityError):
+            writes.run(insert("a", sessions))
+        assert writes.run(insert("b", sessions)) == "b"
+    finally:
+        writes.stop()
+    assert names() == ["a", "b"]